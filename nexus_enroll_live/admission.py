@@ -0,0 +1,211 @@
+# admission.py
+"""
+Admission control for the enrollment facade's write endpoints.
+
+When registration opens, thousands of clients hit /enroll at once. Without
+backpressure every request goes through to the database service and all of
+them slow down together. Admission control decides at the door instead:
+
+  * Rate limits: a token bucket per student and one shared by all students.
+    Over the limit, the request gets 429 with a Retry-After header (seconds
+    until a token is available).
+  * Concurrency gate: at most `max_concurrent` requests talk to the database
+    at once. A request that cannot get a slot within `max_wait` seconds gets
+    503 with Retry-After, so waiting time stays bounded instead of queueing.
+  * Known-full courses: seat counts seen on earlier requests mark a course as
+    full for `full_ttl` seconds. Enrolling in such a course can only end in a
+    waitlist decision, so the facade skips the context read and sends the atomic
+    enroll-or-waitlist write straight away. The database still decides under the
+    course lock, so a stale mark costs nothing but the saved read.
+
+A rate of 0 turns that limit off. The async facade waits for a slot with
+async_database_slot(), which does not hold a thread while it waits.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+from instrumentation import registry
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is turned away; carries the HTTP status and Retry-After seconds."""
+
+    def __init__(self, status, retry_after, reason):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`. Not thread-safe; the controller locks."""
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def wait_time(self, now):
+        """Refills the bucket; returns 0 if a token is available, else seconds until one is."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class AdmissionController:
+    def __init__(self, student_rate=5.0, student_burst=10, global_rate=500.0, global_burst=1000,
+                 max_concurrent=8, max_wait=0.25, full_ttl=2.0, max_students=100000):
+        self.student_rate = student_rate
+        self.student_burst = student_burst
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self.full_ttl = full_ttl
+        self.max_students = max_students
+        self._lock = threading.Lock()
+        # student_id -> TokenBucket, least recently used first. An evicted student has
+        # been idle long enough that their bucket would have refilled anyway.
+        self._student_buckets = OrderedDict()
+        self._global_bucket = TokenBucket(global_rate, global_burst, time.monotonic()) if global_rate > 0 else None
+        self._gate = threading.BoundedSemaphore(max_concurrent) if max_concurrent > 0 else None
+        self._async_gate = asyncio.BoundedSemaphore(max_concurrent) if max_concurrent > 0 else None
+        self._in_flight = 0
+        self._full_until = {}  # course_id -> monotonic time the "full" mark expires
+        self._counters = {"admitted": 0, "rate_limited_student": 0, "rate_limited_global": 0,
+                          "overloaded": 0, "full_course_shortcuts": 0}
+
+    @classmethod
+    def from_env(cls):
+        """Limits from the NEXUS_* environment variables (see the README)."""
+        env = os.environ.get
+        return cls(student_rate=float(env("NEXUS_STUDENT_RATE", "5")),
+                   student_burst=float(env("NEXUS_STUDENT_BURST", "10")),
+                   global_rate=float(env("NEXUS_GLOBAL_RATE", "500")),
+                   global_burst=float(env("NEXUS_GLOBAL_BURST", "1000")),
+                   max_concurrent=int(env("NEXUS_DB_CONCURRENCY", "8")),
+                   max_wait=float(env("NEXUS_ADMISSION_WAIT_MS", "250")) / 1000,
+                   full_ttl=float(env("NEXUS_FULL_COURSE_TTL", "2")))
+
+    def check_rate(self, student_id):
+        """
+        Takes a token from the student's bucket and from the global bucket, or
+        raises AdmissionRejected (429) without taking either.
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = None
+            student_wait = global_wait = 0.0
+            if self.student_rate > 0:
+                bucket = self._student_buckets.get(student_id)
+                if bucket is None:
+                    bucket = self._student_buckets[student_id] = TokenBucket(self.student_rate, self.student_burst, now)
+                    if len(self._student_buckets) > self.max_students:
+                        self._student_buckets.popitem(last=False)
+                else:
+                    self._student_buckets.move_to_end(student_id)
+                student_wait = bucket.wait_time(now)
+            if self._global_bucket is not None:
+                global_wait = self._global_bucket.wait_time(now)
+            if student_wait or global_wait:
+                self._reject("rate_limited_student" if student_wait >= global_wait else "rate_limited_global")
+                raise AdmissionRejected(429, max(student_wait, global_wait), "Too many requests; please retry shortly.")
+            if bucket is not None:
+                bucket.take()
+            if self._global_bucket is not None:
+                self._global_bucket.take()
+
+    @contextmanager
+    def database_slot(self):
+        """Holds one of the `max_concurrent` database slots for the duration of the block, or raises 503."""
+        if self._gate is None:
+            yield
+            return
+        if not self._gate.acquire(timeout=self.max_wait):
+            self._overloaded()
+        self._slot_taken()
+        try:
+            yield
+        finally:
+            self._slot_released()
+            self._gate.release()
+
+    @asynccontextmanager
+    async def async_database_slot(self):
+        """database_slot() for asyncio handlers: waits for a slot on the event loop."""
+        if self._async_gate is None:
+            yield
+            return
+        try:
+            await asyncio.wait_for(self._async_gate.acquire(), self.max_wait)
+        except asyncio.TimeoutError:
+            self._overloaded()
+        self._slot_taken()
+        try:
+            yield
+        finally:
+            self._slot_released()
+            self._async_gate.release()
+
+    def _overloaded(self):
+        with self._lock:
+            self._reject("overloaded")
+        raise AdmissionRejected(503, 1, "The enrollment service is busy; please retry shortly.")
+
+    def _slot_taken(self):
+        with self._lock:
+            self._in_flight += 1
+            self._counters["admitted"] += 1
+
+    def _slot_released(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _reject(self, reason):
+        # Caller holds self._lock
+        self._counters[reason] += 1
+        registry.inc("nexus_admission_rejections_total", (("service", "enrollment_service"), ("reason", reason)))
+
+    # --- Known-full courses ---
+    def observe_seats(self, course_id, taken, capacity):
+        """Records a seat count read from the database; marks or clears the course's "full" mark."""
+        with self._lock:
+            if taken >= capacity:
+                self._full_until[course_id] = time.monotonic() + self.full_ttl
+            else:
+                self._full_until.pop(course_id, None)
+
+    def forget(self, course_id=None):
+        """Clears one course's mark (a seat may have freed up), or every mark."""
+        with self._lock:
+            if course_id is None:
+                self._full_until.clear()
+            else:
+                self._full_until.pop(course_id, None)
+
+    def known_full(self, course_id):
+        with self._lock:
+            until = self._full_until.get(course_id)
+            if until is not None and until <= time.monotonic():
+                del self._full_until[course_id]
+                until = None
+            return until is not None
+
+    def record_shortcut(self):
+        with self._lock:
+            self._counters["full_course_shortcuts"] += 1
+
+    def metrics(self):
+        with self._lock:
+            return dict(self._counters, in_flight=self._in_flight, max_concurrent=self.max_concurrent,
+                        max_wait_seconds=self.max_wait, tracked_students=len(self._student_buckets),
+                        known_full_courses=len(self._full_until))
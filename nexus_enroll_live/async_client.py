@@ -0,0 +1,148 @@
+# async_client.py
+"""
+asyncio counterparts of ServiceClient and ShardedDatabase, used by the async
+enrollment facade (enrollment_service_async.py).
+
+AsyncServiceClient keeps ServiceClient's contract on top of an httpx.AsyncClient:
+pooled keep-alive connections, connect/read timeouts, bounded retries with
+jittered backoff for reads only, a circuit breaker per downstream, per-call
+metrics, the current X-Request-ID forwarded and the wire format negotiated. A call waits on the event loop
+instead of holding a thread, so thousands of them can be in flight in one process.
+
+Errors are raised as httpx exceptions; callers catch httpx.HTTPError and read
+bodies with wire.decode(response).
+
+Needs `pip install httpx` (see the README); the threaded services do not import it.
+"""
+import asyncio
+import random
+import time
+
+import httpx
+
+import instrumentation
+import wire
+from service_client import DEFAULT_TIMEOUT, IDEMPOTENT_METHODS, CircuitBreaker
+from sharding import ShardedDatabase
+
+
+class CircuitOpenError(httpx.ConnectError):
+    """Raised without touching the network while a downstream's circuit is open."""
+
+
+def _httpx_timeout(timeout):
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+class AsyncServiceClient:
+    """Pooled, timeout-bounded, retrying asyncio HTTP client for one downstream service."""
+
+    def __init__(self, base_url, timeout=DEFAULT_TIMEOUT, retries=2, backoff=0.05,
+                 pool_size=32, breaker=None, name=None, binary_bodies=False):
+        self.base_url = base_url.rstrip('/')
+        self.name = name or self.base_url  # target label in metrics and Server-Timing
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.binary_bodies = binary_bodies  # the downstream reads MessagePack request bodies
+        # Requests beyond `pool_size` connections wait for one to free up (for at most the read timeout)
+        self.client = httpx.AsyncClient(base_url=self.base_url, timeout=_httpx_timeout(timeout),
+                                        limits=httpx.Limits(max_connections=pool_size,
+                                                            max_keepalive_connections=pool_size))
+
+    async def request(self, method, path, timeout=None, stream=False, **kwargs):
+        """
+        Sends a request to `base_url + path`.
+        Reads are retried on connection errors, timeouts and 5xx responses; writes are sent once.
+        With stream=True the body is not read; the caller iterates it and closes the response.
+        """
+        method = method.upper()
+        attempts = 1 + self.retries if method in IDEMPOTENT_METHODS else 1
+        kwargs = wire.prepare_request(kwargs, self.binary_bodies)
+        request_id = instrumentation.current_request_id()
+        if request_id:
+            kwargs['headers'][instrumentation.REQUEST_ID_HEADER] = request_id
+        if timeout is not None:
+            kwargs['timeout'] = _httpx_timeout(timeout)
+
+        for attempt in range(attempts):
+            if not self.breaker.allow_request():
+                raise CircuitOpenError(f"Circuit open for {self.base_url}; failing fast.")
+            last_attempt = attempt == attempts - 1
+            request = self.client.build_request(method, path, **kwargs)
+            started = time.perf_counter()
+            try:
+                response = await self.client.send(request, stream=stream)
+            except httpx.HTTPError as error:
+                # Every attempt reports to the breaker, or a failed half-open trial would leave it stuck
+                instrumentation.record_downstream(self.name, method, path, time.perf_counter() - started,
+                                                  "error", 0, 0)
+                self.breaker.record_failure()
+                if last_attempt or not isinstance(error, httpx.TransportError):
+                    raise
+                await self._sleep_before_retry(attempt)
+                continue
+
+            # Streamed bodies have not been read yet; their size is only known from Content-Length
+            instrumentation.record_downstream(
+                self.name, method, path, time.perf_counter() - started, response.status_code,
+                int(request.headers.get('Content-Length') or 0), int(response.headers.get('Content-Length') or 0))
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+                if not last_attempt:
+                    await response.aclose()
+                    await self._sleep_before_retry(attempt)
+                    continue
+            else:
+                self.breaker.record_success()
+            return response
+
+    async def _sleep_before_retry(self, attempt):
+        await asyncio.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    async def get(self, path, **kwargs):
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.request("POST", path, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class AsyncShardedDatabase(ShardedDatabase):
+    """ShardedDatabase over AsyncServiceClients: the same routing, with fan-outs run as concurrent tasks."""
+    client_class = AsyncServiceClient
+    scatter_threads = False  # fan-outs are asyncio tasks
+
+    async def parallel(self, calls):
+        """
+        Awaits coroutines (typically one request per shard) concurrently and returns
+        their results in order. Raises the first error, if any.
+        """
+        return list(await asyncio.gather(*calls))
+
+    async def scatter(self, method, path, clients=None, **kwargs):
+        """Sends the same request to every shard (or to `clients`) concurrently; returns the responses in order."""
+        clients = self.clients if clients is None else clients
+        return await self.parallel([client.request(method, path, **kwargs) for client in clients])
+
+    async def broadcast(self, path, **kwargs):
+        """POSTs a replicated write to every shard; returns the responses."""
+        return await self.scatter("POST", path, **kwargs)
+
+    async def student_enrollments(self, student_id, exclude=()):
+        """A student's enrolled courses gathered from every shard except those in `exclude`."""
+        clients = [client for client in self.clients if client not in exclude]
+        courses = []
+        for response in await self.scatter("GET", f"/enrollments/{student_id}", clients=clients):
+            response.raise_for_status()
+            courses.extend(wire.decode(response))
+        return courses
+
+    async def aclose(self):
+        await asyncio.gather(*(client.aclose() for client in self.clients))
@@ -0,0 +1,85 @@
+# benchmarks/bench_bulk_import.py
+"""
+Compares loading a semester one entity per HTTP POST against the bulk import endpoints.
+
+For each path the database is cleared, then N students and M courses are created
+through the public user/course services and the elapsed time is reported.
+
+Usage:
+    python benchmarks/bench_bulk_import.py [--students 5000] [--courses 500]
+"""
+import argparse
+import json
+import time
+
+import requests
+
+from harness import LocalStack
+
+
+def user_rows(n):
+    return [{"type": "student", "user_id": f"S{i:06d}", "name": f"Student {i}"} for i in range(n)]
+
+
+def course_rows(n):
+    return [{"course_id": f"C{i:05d}", "name": f"Course {i}", "capacity": 30 + i % 120} for i in range(n)]
+
+
+def per_entity(session, users, courses):
+    for user in users:
+        session.post(LocalStack.url("user_service", "/users"), json=user).raise_for_status()
+    for course in courses:
+        session.post(LocalStack.url("course_service", "/courses"), json=course).raise_for_status()
+
+
+def bulk_json(session, users, courses):
+    session.post(LocalStack.url("user_service", "/users/bulk"), json=users).raise_for_status()
+    session.post(LocalStack.url("course_service", "/courses/bulk"), json=courses).raise_for_status()
+
+
+def bulk_ndjson(session, users, courses):
+    headers = {"Content-Type": "application/x-ndjson"}
+    # Generators make requests send the body with chunked transfer encoding
+    session.post(LocalStack.url("user_service", "/users/bulk"), headers=headers,
+                 data=(json.dumps(u).encode() + b"\n" for u in users)).raise_for_status()
+    session.post(LocalStack.url("course_service", "/courses/bulk"), headers=headers,
+                 data=(json.dumps(c).encode() + b"\n" for c in courses)).raise_for_status()
+
+
+def bulk_csv(session, users, courses):
+    headers = {"Content-Type": "text/csv"}
+    user_csv = "type,user_id,name\n" + "".join(f"{u['type']},{u['user_id']},{u['name']}\n" for u in users)
+    course_csv = "course_id,name,capacity\n" + "".join(f"{c['course_id']},{c['name']},{c['capacity']}\n" for c in courses)
+    session.post(LocalStack.url("user_service", "/users/bulk"), headers=headers, data=user_csv).raise_for_status()
+    session.post(LocalStack.url("course_service", "/courses/bulk"), headers=headers, data=course_csv).raise_for_status()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--courses', type=int, default=500)
+    args = parser.parse_args()
+
+    users, courses = user_rows(args.students), course_rows(args.courses)
+    total = len(users) + len(courses)
+    results = {}
+    with LocalStack(["database_service", "user_service", "course_service"]) as stack:
+        db = stack.modules["database_service"]
+        session = requests.Session()
+        for name, path in (("per_entity", per_entity), ("bulk_json", bulk_json),
+                           ("bulk_ndjson", bulk_ndjson), ("bulk_csv", bulk_csv)):
+            session.post(LocalStack.url("database_service", "/clear"))
+            start = time.perf_counter()
+            path(session, users, courses)
+            elapsed = time.perf_counter() - start
+            assert len(db.db['users']) == len(users) and len(db.db['courses']) == len(courses)
+            results[name] = {"seconds": round(elapsed, 3), "entities_per_second": round(total / elapsed)}
+
+    baseline = results["per_entity"]["seconds"]
+    for name, result in results.items():
+        result["speedup"] = round(baseline / result["seconds"], 1)
+    print(json.dumps({"students": args.students, "courses": args.courses, "results": results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
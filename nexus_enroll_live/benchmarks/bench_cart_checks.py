@@ -0,0 +1,183 @@
+# benchmarks/bench_cart_checks.py
+"""
+Cost of the prerequisite and timetable checks for a 6-course registration cart.
+
+Builds a catalog where courses require earlier ones (so prerequisites chain several
+levels deep) and meet two or three times a week, plus students with completed
+courses and a partly filled schedule. Random 6-course carts, mostly of courses the
+student has the prerequisites for, are then checked with:
+
+  1. naive:   walks the prerequisite graph from every completed course and compares
+              meeting times pairwise, as code without precomputed indexes would.
+  2. indexed: database_service's check (prerequisite closures, per-student credit
+              sets and time-slot bitmaps), warmed up first as it is during a rush.
+  3. cart op: POST /ops/enroll/cart through the database service's WSGI app with
+              the checks included, as the facade calls it (no network).
+
+Both checkers must reach the same verdict on every course.
+
+Usage:
+    python benchmarks/bench_cart_checks.py [--courses 3000] [--students 5000] [--carts 20000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("NEXUS_DB_DATA_DIR", "")
+import database_service
+from timetable import DAYS, parse_meeting
+
+CART_SIZE = 6
+
+
+def build_catalog(num_courses, rng):
+    """Courses in 8 levels; each requires up to 3 courses from lower levels."""
+    courses = []
+    per_level = num_courses // 8
+    for i in range(num_courses):
+        level = i // per_level
+        prerequisites = []
+        if level > 0:
+            prerequisites = sorted({f"C{rng.randrange(0, level * per_level):05d}" for _ in range(rng.randint(1, 3))})
+        schedule = []
+        for day in rng.sample(DAYS[:5], rng.choice((2, 3))):
+            start = rng.randrange(8 * 60, 19 * 60, 5)
+            end = start + rng.choice((50, 75, 90))
+            schedule.append(f"{day} {start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}")
+        courses.append({"course_id": f"C{i:05d}", "name": f"Course {i}", "capacity": 10 ** 6,
+                        "prerequisites": prerequisites, "schedule": schedule})
+    return courses
+
+
+def random_cart(student_id, course_ids, rng):
+    """Mostly courses the student has the prerequisites for, as real carts are, plus one random pick."""
+    credits = database_service.student_credits(student_id)
+    cart = []
+    while len(cart) < CART_SIZE:
+        course_id = rng.choice(course_ids)
+        prerequisites = database_service.db['courses'][course_id]['prerequisites']
+        if course_id not in cart and (len(cart) == CART_SIZE - 1 or all(p in credits for p in prerequisites)):
+            cart.append(course_id)
+    return student_id, cart
+
+
+def naive_problem(student_id, course_id, taken):
+    """Eligibility without indexes; `taken` are the courses already on the student's schedule."""
+    db = database_service.db
+    course = db['courses'][course_id]
+    completed = db['users'][student_id].get('completed_courses', [])
+    for prerequisite in course['prerequisites']:
+        if not any(_requires(c, prerequisite) for c in completed):
+            return "missing_prerequisites"
+    meetings = [parse_meeting(m) for m in course['schedule']]
+    for other in taken:
+        for day, start, end in (parse_meeting(m) for m in db['courses'][other]['schedule']):
+            if any(day == d and start < e and s < end for d, s, e in meetings):
+                return "schedule_conflict"
+    return None
+
+
+def _requires(course_id, target):
+    """True if `course_id` is `target` or requires it, directly or transitively (depth-first walk)."""
+    if course_id == target:
+        return True
+    return any(_requires(p, target) for p in database_service.db['courses'][course_id]['prerequisites'])
+
+
+def indexed_problem(student_id, course_id):
+    problem = database_service._eligibility_problem(student_id, course_id)
+    return problem[0] if problem else None
+
+
+def percentile(samples, q):
+    return round(samples[min(len(samples) - 1, int(len(samples) * q))] * 1e6, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=3000)
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--carts', type=int, default=20000)
+    parser.add_argument('--completed', type=int, default=12, help="completed courses per student")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    catalog = build_catalog(args.courses, rng)
+    course_ids = [c['course_id'] for c in catalog]
+    lower_half = course_ids[:args.courses // 2]
+    database_service._write("put_courses", catalog)
+    student_ids = [f"S{i:06d}" for i in range(args.students)]
+    database_service._write("put_users", [
+        {"user_id": s, "name": s, "role": "Student", "completed_courses": rng.sample(lower_half, args.completed)}
+        for s in student_ids])
+    for student_id in student_ids:
+        for course_id in rng.sample(course_ids, 2):
+            if not database_service._eligibility_problem(student_id, course_id):
+                database_service._write("enroll", student_id, course_id)
+
+    carts = [random_cart(rng.choice(student_ids), course_ids, rng) for _ in range(args.carts)]
+
+    def run(check):
+        """Checks every cart as the cart op would: each accepted course joins the schedule."""
+        samples, verdicts = [], []
+        for student_id, cart in carts:
+            start = time.perf_counter()
+            taken = list(database_service.db['enrollments'].get(student_id, ()))
+            for course_id in cart:
+                problem = check(student_id, course_id, taken)
+                verdicts.append(problem)
+                if problem is None:
+                    taken.append(course_id)
+            samples.append(time.perf_counter() - start)
+        samples.sort()
+        return {"carts_per_second": round(len(samples) / sum(samples)), "p50_us": percentile(samples, 0.5),
+                "p99_us": percentile(samples, 0.99)}, verdicts
+
+    def indexed(student_id, course_id, taken):
+        # The real check reads the student's enrolled courses; cart courses accepted so far join them
+        enrolled = database_service.db['enrollments']
+        saved = enrolled.get(student_id)
+        enrolled[student_id] = taken
+        try:
+            return indexed_problem(student_id, course_id)
+        finally:
+            if saved is None:
+                del enrolled[student_id]
+            else:
+                enrolled[student_id] = saved
+
+    run(indexed)  # warm the closure and credit caches, as the first minutes of a rush do
+    naive_report, naive_verdicts = run(naive_problem)
+    indexed_report, indexed_verdicts = run(indexed)
+    assert naive_verdicts == indexed_verdicts, "the indexed check disagrees with the naive one"
+
+    client = database_service.app.test_client()
+    samples = []
+    statuses = {}
+    for student_id, cart in carts[:min(len(carts), 5000)]:
+        start = time.perf_counter()
+        response = client.post("/ops/enroll/cart", json={"student_id": student_id, "course_ids": cart})
+        samples.append(time.perf_counter() - start)
+        for status in response.get_json()['results'].values():
+            statuses[status] = statuses.get(status, 0) + 1
+    samples.sort()
+
+    print(json.dumps({
+        "courses": args.courses, "students": args.students, "carts": args.carts, "cart_size": CART_SIZE,
+        "refused": {v: naive_verdicts.count(v) for v in ("missing_prerequisites", "schedule_conflict")},
+        "naive": naive_report,
+        "indexed": indexed_report,
+        "speedup": round(indexed_report["carts_per_second"] / naive_report["carts_per_second"], 1),
+        "cart_op": {"carts": len(samples), "p50_us": percentile(samples, 0.5), "p99_us": percentile(samples, 0.99),
+                    "statuses": statuses},
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+# benchmarks/bench_embedded.py
+"""
+Startup time, memory and per-enroll latency of the two layouts of the live stack:
+
+  processes: `serve.py`, one process per service, calls between them over loopback HTTP
+  embedded:  `serve.py --embedded`, every service in one process, calls made in process
+
+For each layout, serve.py is started --starts times (in-memory database, rate
+limits off) and timed until every service's /readyz passes. After the last
+start the memory of the launcher and all its child processes is summed (RSS
+from /proc, so Linux only; null elsewhere). The benchmark then seeds students
+and courses and measures /enroll:
+  * sequential: one client, so each latency is the request path alone. The
+    facade's Server-Timing header gives the part spent in database calls.
+  * concurrent: --clients threads enrolling at once, for throughput.
+Latencies are in milliseconds.
+
+Usage:
+    python benchmarks/bench_embedded.py [--starts 3] [--enrolls 2000] [--clients 16] [--threads 16]
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+LIVE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PORTS = [5000, 5001, 5002, 5003, 5004]
+USER_URL = "http://127.0.0.1:5001"
+COURSE_URL = "http://127.0.0.1:5002"
+FACADE_URL = "http://127.0.0.1:5004"
+LAYOUTS = {"processes": [], "embedded": ["--embedded"]}
+_DATABASE_TIMING = re.compile(r"database_service;dur=([0-9.]+)")
+
+
+def start(layout, threads):
+    """Starts serve.py; returns (process, seconds until every service was ready)."""
+    env = dict(os.environ, NEXUS_DB_DATA_DIR="", NEXUS_STUDENT_RATE="0", NEXUS_GLOBAL_RATE="0")
+    for variable in ("NEXUS_DB_URL", "NEXUS_USER_URL", "NEXUS_COURSE_URL", "NEXUS_NOTIFY_URL"):
+        env.pop(variable, None)
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "serve.py", "--threads", str(threads)] + LAYOUTS[layout],
+                               cwd=LIVE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for port in PORTS:
+        while True:
+            try:
+                if requests.get(f"http://127.0.0.1:{port}/readyz", timeout=1).status_code == 200:
+                    break
+            except requests.exceptions.ConnectionError:
+                pass
+            if process.poll() is not None or time.perf_counter() - started > 120:
+                stop(process)
+                raise RuntimeError(f"{layout}: service on port {port} did not start")
+            time.sleep(0.02)
+    return process, time.perf_counter() - started
+
+
+def stop(process):
+    process.terminate()
+    process.wait(timeout=30)
+    # serve.py stops its children before exiting; wait until the ports are free for the next start
+    for port in PORTS:
+        while True:
+            try:
+                requests.get(f"http://127.0.0.1:{port}/healthz", timeout=0.5)
+                time.sleep(0.1)
+            except requests.exceptions.ConnectionError:
+                break
+
+
+def rss_mb(pid):
+    """Resident memory of a process and all its descendants, or None without /proc."""
+    if not os.path.isdir("/proc"):
+        return None
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    parent = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(parent, []).append(int(entry))
+    total_kb, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, ()))
+        try:
+            with open(f"/proc/{current}/status") as f:
+                total_kb += next((int(line.split()[1]) for line in f if line.startswith("VmRSS:")), 0)
+        except OSError:
+            pass
+    return round(total_kb / 1024, 1)
+
+
+def seed(num_students, num_courses):
+    session = requests.Session()
+    session.post("http://127.0.0.1:5000/clear").raise_for_status()
+    session.post(f"{USER_URL}/users/bulk", json=[
+        {"type": "student", "user_id": f"S{i:06d}", "name": f"Student {i}"} for i in range(num_students)
+    ]).raise_for_status()
+    session.post(f"{COURSE_URL}/courses/bulk", json=[
+        {"course_id": f"C{i:04d}", "name": f"Course {i}", "capacity": num_students} for i in range(num_courses)
+    ]).raise_for_status()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: round(samples[min(len(samples) - 1, int(len(samples) * q))] * 1000, 2)
+    return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+def enroll(session, student_id, course_id):
+    response = session.post(f"{FACADE_URL}/enroll", json={"student_id": student_id, "course_id": course_id})
+    response.raise_for_status()
+    return response
+
+
+def sequential(pairs):
+    session = requests.Session()
+    for pair in pairs[:50]:  # warm up the connection and the entity cache
+        enroll(session, *pair)
+    latencies, database = [], []
+    for pair in pairs[50:]:
+        started = time.perf_counter()
+        response = enroll(session, *pair)
+        latencies.append(time.perf_counter() - started)
+        database.append(sum(float(d) for d in _DATABASE_TIMING.findall(response.headers.get("Server-Timing", ""))))
+    return dict(percentiles(latencies), requests=len(latencies),
+                database_calls_p50_ms=round(statistics.median(database), 2))
+
+
+def concurrent(pairs, clients):
+    latencies, lock = [], threading.Lock()
+
+    def client(chunk):
+        session, own = requests.Session(), []
+        for pair in chunk:
+            started = time.perf_counter()
+            enroll(session, *pair)
+            own.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client, args=(pairs[index::clients],)) for index in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return dict(percentiles(latencies), requests=len(latencies), clients=clients,
+                throughput_rps=round(len(latencies) / elapsed, 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--starts', type=int, default=3, help="starts per layout (median startup time)")
+    parser.add_argument('--enrolls', type=int, default=2000, help="enrollments per phase")
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--threads', type=int, default=16, help="serve.py --threads")
+    args = parser.parse_args()
+
+    num_courses = 50
+    # Every (student, course) pair is enrolled once: sequential pairs first, then the concurrent ones
+    pairs = [(f"S{i // num_courses:06d}", f"C{i % num_courses:04d}") for i in range(2 * args.enrolls + 50)]
+    num_students = len(pairs) // num_courses + 1
+
+    results = {}
+    for layout in LAYOUTS:
+        startup = []
+        for attempt in range(args.starts):
+            process, seconds = start(layout, args.threads)
+            startup.append(seconds)
+            if attempt < args.starts - 1:
+                stop(process)
+        try:
+            idle_rss = rss_mb(process.pid)
+            seed(num_students, num_courses)
+            results[layout] = {
+                "startup_seconds": round(statistics.median(startup), 2),
+                "rss_mb_idle": idle_rss,
+                "sequential_enroll": sequential(pairs[:args.enrolls + 50]),
+                "concurrent_enroll": concurrent(pairs[args.enrolls + 50:], args.clients),
+                "rss_mb_after_load": rss_mb(process.pid),
+            }
+        finally:
+            stop(process)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# benchmarks/bench_recovery.py
+"""
+Durability benchmark for database_service's write-ahead log.
+
+  1. Loads students, courses and N enrollments through the logged write path.
+  2. Measures acknowledged (fsync'd) write throughput with many concurrent writers,
+     which is what group commit is for.
+  3. Restarts from the log alone (replaying the full history).
+  4. Takes a snapshot, appends a short tail and restarts again (snapshot + tail).
+
+Usage:
+    python benchmarks/bench_recovery.py [--enrollments 1000000] [--courses-per-student 5]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database_service
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def restart(data_dir):
+    """Simulates a process restart: drop all in-memory state, then recover from disk."""
+    database_service.store.close()
+    database_service.store = None
+    database_service._apply(("clear",))
+    start = time.perf_counter()
+    database_service.init_persistence(data_dir, snapshot_every=0)
+    return time.perf_counter() - start
+
+
+def durable_writes(num_threads, ops_per_thread, course_id):
+    """Each writer waits for its own fsync, like a real request would."""
+    store = database_service.store
+
+    def writer(thread_index):
+        for i in range(ops_per_thread):
+            seq = database_service._write("waitlist", f"W{thread_index}-{i}", course_id)
+            store.wait_durable(seq)
+
+    fsyncs_before = store.stats["fsyncs"]
+    threads = [threading.Thread(target=writer, args=(t,)) for t in range(num_threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    total = num_threads * ops_per_thread
+    fsyncs = store.stats["fsyncs"] - fsyncs_before
+    return {"writes": total, "seconds": round(elapsed, 3), "writes_per_second": round(total / elapsed),
+            "fsyncs": fsyncs, "writes_per_fsync": round(total / max(fsyncs, 1), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--enrollments', type=int, default=1000000)
+    parser.add_argument('--courses-per-student', type=int, default=5)
+    parser.add_argument('--courses', type=int, default=3000)
+    parser.add_argument('--tail', type=int, default=10000, help="log records written after the snapshot")
+    parser.add_argument('--writer-threads', type=int, default=64)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="nexus-wal-")
+    report = {"enrollments": args.enrollments}
+    try:
+        database_service.init_persistence(data_dir, snapshot_every=0)
+        num_students = args.enrollments // args.courses_per_student
+        course_ids = [f"C{i:05d}" for i in range(args.courses)]
+
+        start = time.perf_counter()
+        database_service._write("put_courses", [{"course_id": c, "name": c, "capacity": 10 ** 6} for c in course_ids])
+        for first in range(0, num_students, 10000):
+            database_service._write("put_users", [
+                {"user_id": f"S{i:07d}", "name": f"Student {i}", "role": "Student"}
+                for i in range(first, min(first + 10000, num_students))
+            ])
+        for i in range(num_students):
+            for k in range(args.courses_per_student):
+                database_service._write("enroll", f"S{i:07d}", course_ids[(i * 7 + k * 13) % args.courses])
+        report["load_seconds"] = round(time.perf_counter() - start, 2)
+
+        report["durable_writes"] = durable_writes(args.writer_threads, 200, course_ids[0])
+        expected_enrolled = sum(len(v) for v in database_service.db['enrollments'].values())
+
+        report["log_only"] = {"log_bytes": dir_size(data_dir), "restart_seconds": round(restart(data_dir), 2)}
+        assert sum(len(v) for v in database_service.db['enrollments'].values()) == expected_enrolled
+
+        snapshot_start = time.perf_counter()
+        snapshot = database_service.store.snapshot()
+        snapshot_seconds = time.perf_counter() - snapshot_start
+        for i in range(args.tail):
+            database_service._write("waitlist", f"T{i}", course_ids[1])
+        report["snapshot_plus_tail"] = {
+            "snapshot_bytes": snapshot["bytes"], "snapshot_seconds": round(snapshot_seconds, 2),
+            "tail_records": args.tail, "restart_seconds": round(restart(data_dir), 2),
+        }
+        assert sum(len(v) for v in database_service.db['enrollments'].values()) == expected_enrolled
+        assert len(database_service.db['waitlists'][course_ids[1]]) == args.tail
+    finally:
+        if database_service.store is not None:
+            database_service.store.close()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+# benchmarks/bench_sharding.py
+"""
+Write throughput of the database service as it is split into more shards.
+
+For each shard count:
+  1. starts that many database processes with the production launcher
+     (serve.py --only database_service --shards N, in memory),
+  2. loads the same students and courses through the routing client
+     (sharding.ShardedDatabase), which copies them to every shard,
+  3. runs client *processes*, so the load generator is not held back by a single
+     GIL either, each sending enroll-then-drop pairs for random students and
+     courses straight to the shard that owns the course.
+
+It prints write operations per second and latency for each shard count, and the
+speedup over one shard. Shards only scale when they get cores of their own:
+run it on a machine with at least (largest shard count + client processes) CPUs.
+
+Usage:
+    python benchmarks/bench_sharding.py [--shards 1,2,4] [--clients 8] [--duration 10]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from serve import DEFAULT_PORTS, LIVE_DIR, SHARD_PORT_STEP
+from sharding import ShardedDatabase
+
+
+def shard_urls(count):
+    port = DEFAULT_PORTS["database_service"]
+    return [f"http://127.0.0.1:{port + SHARD_PORT_STEP * index}" for index in range(count)]
+
+
+def start_shards(count, threads):
+    env = dict(os.environ, NEXUS_DB_DATA_DIR="")
+    env.pop("NEXUS_DB_URL", None)
+    process = subprocess.Popen([sys.executable, "serve.py", "--only", "database_service", "--shards", str(count),
+                                "--threads", str(threads)], cwd=LIVE_DIR, env=env, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    for url in shard_urls(count):
+        while True:
+            try:
+                if requests.get(f"{url}/readyz", timeout=1).status_code == 200:
+                    break
+            except requests.exceptions.ConnectionError:
+                pass
+            if time.monotonic() > deadline or process.poll() is not None:
+                process.terminate()
+                raise RuntimeError(f"Shard at {url} did not start")
+            time.sleep(0.1)
+    return process
+
+
+def seed(shards, num_students, num_courses, capacity):
+    students = [{"user_id": f"S{i:06d}", "name": f"Student {i}", "role": "Student"} for i in range(num_students)]
+    courses = [{"course_id": f"C{i:04d}", "name": f"Course {i}", "capacity": capacity, "prerequisites": [],
+                "schedule": []} for i in range(num_courses)]
+    for response in shards.broadcast("/users/bulk", json={"users": students}):
+        response.raise_for_status()
+    for response in shards.broadcast("/courses/bulk", json={"courses": courses}):
+        response.raise_for_status()
+    return [s["user_id"] for s in students], [c["course_id"] for c in courses]
+
+
+def client_process(urls, student_ids, course_ids, threads, stop_at, seed_value):
+    """Runs `threads` request loops against the shards; returns (write operations, latencies in seconds)."""
+    shards = ShardedDatabase(urls)
+    counts, latencies = [], []
+    lock = threading.Lock()
+
+    def loop(rng):
+        ops, samples = 0, []
+        while time.monotonic() < stop_at:
+            student_id, course_id = rng.choice(student_ids), rng.choice(course_ids)
+            client = shards.for_course(course_id)
+            started = time.perf_counter()
+            result = client.post("/ops/enroll", json={"student_id": student_id, "course_id": course_id,
+                                                      "waitlist_if_full": False}).json()
+            samples.append(time.perf_counter() - started)
+            ops += 1
+            if result["status"] == "enrolled":
+                started = time.perf_counter()
+                client.post("/ops/drop", json={"student_id": student_id, "course_id": course_id})
+                samples.append(time.perf_counter() - started)
+                ops += 1
+        with lock:
+            counts.append(ops)
+            latencies.extend(samples)
+
+    workers = [threading.Thread(target=loop, args=(random.Random(seed_value * 1000 + i),)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(counts), latencies
+
+
+def run(count, args):
+    process = start_shards(count, args.server_threads)
+    try:
+        urls = shard_urls(count)
+        student_ids, course_ids = seed(ShardedDatabase(urls), args.students, args.courses, args.capacity)
+        stop_at = time.monotonic() + args.duration
+        with multiprocessing.Pool(args.clients) as pool:
+            started = time.perf_counter()
+            results = pool.starmap(client_process, [(urls, student_ids, course_ids, args.threads, stop_at, i)
+                                                    for i in range(args.clients)])
+            elapsed = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    ops = sum(r[0] for r in results)
+    latencies = sorted(sample for r in results for sample in r[1])
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 2) if latencies else None
+    return {"shards": count, "write_ops": ops, "ops_per_second": round(ops / elapsed, 1),
+            "p50_ms": pick(0.5), "p99_ms": pick(0.99)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shards', default="1,2,4", help="comma-separated shard counts to measure")
+    parser.add_argument('--clients', type=int, default=8, help="client processes")
+    parser.add_argument('--threads', type=int, default=4, help="request loops per client process")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds of load per shard count")
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--courses', type=int, default=400)
+    parser.add_argument('--capacity', type=int, default=40)
+    parser.add_argument('--server-threads', type=int, default=16, help="request threads per shard")
+    args = parser.parse_args()
+
+    runs = [run(int(count), args) for count in args.shards.split(',')]
+    baseline = runs[0]["ops_per_second"]
+    for result in runs:
+        result["speedup"] = round(result["ops_per_second"] / baseline, 2) if baseline else None
+    print(json.dumps({"cpus": os.cpu_count(), "clients": args.clients, "threads_per_client": args.threads,
+                      "runs": runs}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# benchmarks/bench_wire_format.py
+"""
+Payload size and encode/decode cost of JSON and MessagePack (see wire.py) for
+the database service's inter-service endpoints, each with and without gzip.
+
+Loads a registration-sized dataset into database_service in process, then for
+each endpoint and wire format:
+  * bytes:     body size as the service sends it,
+  * encode_us: encoding the body (plus gzip) on its own,
+  * decode_us: decoding it as the caller does (gunzip, then JSON or MessagePack),
+  * request_us: the whole request through the WSGI app (handler, encoding,
+    compression; no network), so the saving is seen in context.
+Request bodies (the bulk enrollment chunk the facade sends) are measured the same way.
+Times are medians in microseconds.
+
+Usage:
+    python benchmarks/bench_wire_format.py [--students 20000] [--courses 2000] [--repeat 200]
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("NEXUS_DB_DATA_DIR", "")
+os.environ.setdefault("NEXUS_COMPRESS_MIN_BYTES", "1")  # so the gzip rows are compressed whatever their size
+import database_service
+import wire
+
+FORMATS = [("json", wire.JSON)] + ([("msgpack", wire.MSGPACK)] if wire.msgpack else [])
+
+
+def seed(num_students, num_courses, rng):
+    database_service._write("put_courses", [
+        {"course_id": f"C{i:05d}", "name": f"Course {i}", "capacity": 60, "prerequisites": [],
+         "schedule": [f"Mon {8 + i % 10:02d}:00-{8 + i % 10:02d}:50"]} for i in range(num_courses)])
+    database_service._write("put_users", [
+        {"user_id": f"S{i:06d}", "name": f"Student {i}", "role": "Student",
+         "completed_courses": [f"C{rng.randrange(num_courses):05d}" for _ in range(4)]} for i in range(num_students)])
+    for i in range(num_students):
+        for course_id in rng.sample(range(num_courses), 3):
+            database_service._write("enroll", f"S{i:06d}", f"C{course_id:05d}")
+
+
+def median_us(call, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - start)
+    return round(statistics.median(samples) * 1e6, 1)
+
+
+def encoder(fmt, compressed):
+    dumps = (lambda value: json.dumps(value, separators=(",", ":")).encode()) if fmt == "json" else wire.pack
+    if compressed:
+        return lambda value: gzip.compress(dumps(value), compresslevel=1)
+    return dumps
+
+
+def decoder(fmt, compressed):
+    loads = json.loads if fmt == "json" else wire.msgpack.unpackb
+    if compressed:
+        return lambda body: loads(gzip.decompress(body))
+    return loads
+
+
+def measure_response(client, path, repeat):
+    """One row per (format, gzip) for a GET endpoint."""
+    value = client.get(path).get_json()
+    rows = {}
+    for fmt, mimetype in FORMATS:
+        for compressed in (False, True):
+            headers = {"Accept": mimetype, "Accept-Encoding": "gzip" if compressed else "identity"}
+            body = client.get(path, headers=headers).data
+            decode = decoder(fmt, compressed)
+            assert decode(body) == value, f"{path} does not round-trip as {fmt}"
+            rows[fmt + ("+gzip" if compressed else "")] = {
+                "bytes": len(body),
+                "encode_us": median_us(lambda: encoder(fmt, compressed)(value), repeat),
+                "decode_us": median_us(lambda: decode(body), repeat),
+                "request_us": median_us(lambda: client.get(path, headers=headers).data, repeat),
+            }
+    return rows
+
+
+def measure_request_body(client, path, value, repeat):
+    """One row per format for a POST body (request bodies are not compressed)."""
+    rows = {}
+    for fmt, mimetype in FORMATS:
+        body = encoder(fmt, False)(value)
+        rows[fmt] = {
+            "bytes": len(body),
+            "encode_us": median_us(lambda: encoder(fmt, False)(value), repeat),
+            "decode_us": median_us(lambda: decoder(fmt, False)(body), repeat),
+            "request_us": median_us(lambda: client.post(path, data=body, headers={"Content-Type": mimetype}), repeat),
+        }
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=20000)
+    parser.add_argument('--courses', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=200, help="samples per small endpoint (snapshots use fewer)")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    seed(args.students, args.courses, rng)
+    client = database_service.app.test_client()
+
+    latest = client.get("/changes?since=0&limit=0").get_json()['version']
+    cart = ",".join(f"C{rng.randrange(args.courses):05d}" for _ in range(6))
+    snapshot_repeat = max(3, args.repeat // 40)
+    endpoints = {
+        "enrollment_context": measure_response(client, "/enrollment_context/S000001/C00001", args.repeat),
+        "enrollment_context (cached entities)":
+            measure_response(client, "/enrollment_context/S000001/C00001?entities=0", args.repeat),
+        "cart context (6 courses)": measure_response(client, f"/enrollment_context/S000002?course_ids={cart}",
+                                                     args.repeat),
+        "changes (1000 events)": measure_response(client, f"/changes?since={max(0, latest - 1000)}&limit=1000",
+                                                  args.repeat // 4 or 1),
+        "data page (5000 records)": measure_response(client, "/data?limit=5000", snapshot_repeat),
+        "data snapshot": measure_response(client, "/data", snapshot_repeat),
+    }
+    bulk = {"enrollments": [{"student_id": f"S{rng.randrange(args.students):06d}",
+                             "course_id": f"C{rng.randrange(args.courses):05d}"} for _ in range(500)],
+            "waitlist_if_full": False}
+    endpoints["ops/enroll/bulk request (500 rows)"] = measure_request_body(client, "/ops/enroll/bulk", bulk,
+                                                                           args.repeat // 4 or 1)
+
+    print(json.dumps({"students": args.students, "courses": args.courses,
+                      "msgpack": wire.msgpack is not None, "endpoints": endpoints}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
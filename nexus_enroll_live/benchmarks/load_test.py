@@ -0,0 +1,250 @@
+# benchmarks/load_test.py
+"""
+Registration-rush load test for the live NexusEnroll stack.
+
+  1. Starts the five services with the production launcher (serve.py) on their
+     usual ports, unless --no-start is given.
+  2. Seeds N students and M courses through the public user/course APIs.
+  3. Replays a registration rush from many concurrent clients: course popularity
+     follows a Zipf distribution, and the mix of single enrolls, cart enrolls and
+     drops keeps popular courses full and their waitlists churning.
+  4. Reports throughput, per-endpoint latency percentiles, error counts and the
+     number of oversold seats as JSON, so runs can be compared across commits.
+
+Usage:
+    python benchmarks/load_test.py [--students 2000] [--courses 200] [--clients 32]
+                                   [--duration 20] [--shards 1 | --embedded] [--output results.json]
+"""
+import argparse
+import bisect
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+LIVE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = [
+    ("database_service", 5000),
+    ("user_service", 5001),
+    ("course_service", 5002),
+    ("notification_service", 5003),
+    ("enrollment_service", 5004),
+]
+USER_URL = "http://127.0.0.1:5001"
+COURSE_URL = "http://127.0.0.1:5002"
+FACADE_URL = "http://127.0.0.1:5004"
+SHARD_PORT_STEP = 100  # as in serve.py: database shard i listens on 5000 + 100 * i
+
+def shard_ports(shards):
+    return [5000 + SHARD_PORT_STEP * index for index in range(shards)]
+
+def start_services(data_dir, threads, shards, embedded=False):
+    """Runs serve.py (the database keeps its write-ahead log on) and waits until every service is ready."""
+    env = dict(os.environ, NEXUS_DB_DATA_DIR=data_dir)
+    env.pop("NEXUS_DB_URL", None)
+    command = [sys.executable, "serve.py", "--threads", str(threads)]
+    command += ["--embedded"] if embedded else ["--shards", str(shards)]
+    processes = [subprocess.Popen(command, cwd=LIVE_DIR, env=env, stdout=subprocess.DEVNULL)]
+    deadline = time.monotonic() + 60
+    for port in shard_ports(shards)[1:] + [port for _, port in SERVICES]:
+        while True:
+            try:
+                if requests.get(f"http://127.0.0.1:{port}/readyz", timeout=1).status_code == 200:
+                    break
+            except requests.exceptions.ConnectionError:
+                pass
+            if time.monotonic() > deadline or processes[0].poll() is not None:
+                stop_services(processes)
+                raise RuntimeError(f"Service on port {port} did not start")
+            time.sleep(0.1)
+    return processes
+
+
+def stop_services(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait(timeout=30)
+
+
+def seed(num_students, num_courses, capacity, shards):
+    session = requests.Session()
+    for port in shard_ports(shards):
+        session.post(f"http://127.0.0.1:{port}/clear").raise_for_status()
+    students = [{"type": "student", "user_id": f"S{i:06d}", "name": f"Student {i}"} for i in range(num_students)]
+    courses = [{"course_id": f"C{i:04d}", "name": f"Course {i}", "capacity": capacity} for i in range(num_courses)]
+    session.post(f"{USER_URL}/users/bulk", json=students).raise_for_status()
+    session.post(f"{COURSE_URL}/courses/bulk", json=courses).raise_for_status()
+    return [s["user_id"] for s in students], [c["course_id"] for c in courses]
+
+
+class ZipfChooser:
+    """Picks items with probability proportional to 1 / rank**s (a few very popular courses)."""
+    def __init__(self, items, s):
+        self.items = items
+        self.cumulative = list(itertools.accumulate(1.0 / (rank ** s) for rank in range(1, len(items) + 1)))
+
+    def choice(self, rng):
+        return self.items[bisect.bisect_left(self.cumulative, rng.random() * self.cumulative[-1])]
+
+
+class Recorder:
+    """Thread-safe per-endpoint latency and status collection."""
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, seconds, status):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+
+    def summary(self, elapsed):
+        endpoints = {}
+        for endpoint, samples in sorted(self.latencies.items()):
+            samples.sort()
+            pick = lambda q: round(samples[min(len(samples) - 1, int(len(samples) * q))] * 1000, 2)
+            statuses = dict(self.statuses[endpoint])
+            endpoints[endpoint] = {
+                "requests": len(samples),
+                "throughput_rps": round(len(samples) / elapsed, 1),
+                "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99),
+                "max_ms": round(samples[-1] * 1000, 2),
+                "errors": sum(n for status, n in statuses.items() if status == "exception" or int(status) >= 500),
+                "status_counts": {str(k): v for k, v in statuses.items()},
+            }
+        return endpoints
+
+
+def client_loop(student_ids, chooser, args, recorder, stop_at, seed_value):
+    rng = random.Random(seed_value)
+    session = requests.Session()
+    held = defaultdict(set)  # what this client believes each student is enrolled in
+
+    def call(endpoint, path, body):
+        start = time.perf_counter()
+        try:
+            response = session.post(f"{FACADE_URL}{path}", json=body, timeout=30)
+            recorder.record(endpoint, time.perf_counter() - start, response.status_code)
+            if response.status_code in (429, 503) and response.headers.get("Retry-After"):
+                # Well-behaved clients back off when admission control turns them away
+                time.sleep(min(float(response.headers["Retry-After"]), max(0.0, stop_at - time.monotonic())))
+            return response
+        except requests.exceptions.RequestException:
+            recorder.record(endpoint, time.perf_counter() - start, "exception")
+            return None
+
+    while time.monotonic() < stop_at:
+        roll = rng.random()
+        holders = [s for s, courses in held.items() if courses]
+        if roll < args.drop_ratio and holders:
+            # Drops free seats in popular courses, which keeps their waitlists churning
+            student_id = rng.choice(holders)
+            course_id = rng.choice(sorted(held[student_id]))
+            if call("POST /drop", "/drop", {"student_id": student_id, "course_id": course_id}) is not None:
+                held[student_id].discard(course_id)
+            continue
+        student_id = rng.choice(student_ids)
+        if roll < args.drop_ratio + args.cart_ratio:
+            cart = list({chooser.choice(rng) for _ in range(rng.randint(4, 6))})
+            response = call("POST /enroll/batch", "/enroll/batch", {"student_id": student_id, "course_ids": cart})
+            if response is not None and response.status_code == 200:
+                for result in response.json()["results"]:
+                    if result["status"] in ("enrolled", "already_enrolled"):
+                        held[student_id].add(result["course_id"])
+        else:
+            course_id = chooser.choice(rng)
+            response = call("POST /enroll", "/enroll", {"student_id": student_id, "course_id": course_id})
+            if response is not None and response.status_code == 200:
+                if response.json().get("message", "").startswith("Successfully enrolled"):
+                    held[student_id].add(course_id)
+
+
+def count_oversold():
+    data = requests.get(f"{FACADE_URL}/system_data", params={"collections": "courses,enrollments"}, timeout=60).json()
+    enrolled = defaultdict(int)
+    for courses in data["enrollments"].values():
+        for course_id in courses:
+            enrolled[course_id] += 1
+    oversold = {c: enrolled[c] - course["capacity"] for c, course in data["courses"].items()
+                if enrolled[c] > course["capacity"]}
+    return {"oversold_courses": len(oversold), "oversold_seats": sum(oversold.values()),
+            "total_enrollments": sum(enrolled.values())}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=LIVE_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--courses', type=int, default=200)
+    parser.add_argument('--capacity', type=int, default=30)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20.0, help="seconds of load")
+    parser.add_argument('--zipf', type=float, default=1.1, help="course popularity skew")
+    parser.add_argument('--drop-ratio', type=float, default=0.2)
+    parser.add_argument('--cart-ratio', type=float, default=0.1)
+    parser.add_argument('--server-threads', type=int, default=16, help="request threads per service")
+    parser.add_argument('--shards', type=int, default=1, help="database processes (serve.py --shards)")
+    parser.add_argument('--embedded', action='store_true', help="run every service in one process (serve.py --embedded)")
+    parser.add_argument('--no-start', action='store_true', help="use services that are already running")
+    parser.add_argument('--output', help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="nexus-load-")
+    processes = [] if args.no_start else start_services(data_dir, args.server_threads, args.shards,
+                                                                     args.embedded)
+    try:
+        student_ids, course_ids = seed(args.students, args.courses, args.capacity, args.shards)
+        chooser = ZipfChooser(course_ids, args.zipf)
+        recorder = Recorder()
+        stop_at = time.monotonic() + args.duration
+        clients = [threading.Thread(target=client_loop, args=(student_ids, chooser, args, recorder, stop_at, i))
+                   for i in range(args.clients)]
+        start = time.perf_counter()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - start
+
+        endpoints = recorder.summary(elapsed)
+        total = sum(e["requests"] for e in endpoints.values())
+        report = {
+            "commit": git_commit(),
+            "config": {k: v for k, v in vars(args).items() if k != "output"},
+            "elapsed_seconds": round(elapsed, 2),
+            "total_requests": total,
+            "throughput_rps": round(total / elapsed, 1),
+            "endpoints": endpoints,
+            **count_oversold(),
+            "facade_cache": requests.get(f"{FACADE_URL}/cache/metrics", timeout=10).json(),
+            "facade_admission": requests.get(f"{FACADE_URL}/admission/metrics", timeout=10).json(),
+        }
+    finally:
+        stop_services(processes)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# benchmarks/stress_oversell.py
+"""
+Multithreaded stress test for the atomic enroll/drop operations in database_service.
+
+Many threads race to enroll in (and drop from) a handful of small courses at once.
+After the run, every course's roster must fit within its capacity, the roster index
+must agree with the per-student enrollment lists and no waitlist may contain duplicates.
+
+Usage:
+    python benchmarks/stress_oversell.py [--threads 32] [--students 2000] [--courses 4] [--capacity 25]
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database_service
+
+
+def seed(client, num_students, num_courses, capacity):
+    client.post('/clear')
+    for i in range(num_students):
+        client.post('/users', json={"user_id": f"S{i:05d}", "name": f"Student {i}", "role": "Student"})
+    for i in range(num_courses):
+        client.post('/courses', json={"course_id": f"C{i:03d}", "name": f"Course {i}", "capacity": capacity})
+
+
+def worker(student_ids, course_ids, ops_per_thread, max_seen, errors):
+    client = database_service.app.test_client()
+    rng = random.Random()
+    for _ in range(ops_per_thread):
+        student_id = rng.choice(student_ids)
+        course_id = rng.choice(course_ids)
+        if rng.random() < 0.8:
+            res = client.post('/ops/enroll', json={"student_id": student_id, "course_id": course_id})
+            if res.status_code != 200:
+                errors.append(res.status_code)
+                continue
+            result = res.get_json()
+            # Track the highest count ever reported, not just the final state
+            if result['enrolled_count'] > max_seen.get(course_id, 0):
+                max_seen[course_id] = result['enrolled_count']
+        else:
+            client.post('/ops/drop', json={"student_id": student_id, "course_id": course_id})
+
+
+def check_invariants(capacity):
+    """Returns a list of human-readable invariant violations (empty when consistent)."""
+    problems = []
+    db = database_service.db
+    for course_id in db['courses']:
+        enrolled = {s for s, courses in db['enrollments'].items() if course_id in courses}
+        roster = database_service.course_rosters.get(course_id, set())
+        if len(enrolled) > capacity:
+            problems.append(f"{course_id} oversold: {len(enrolled)}/{capacity}")
+        if enrolled != roster:
+            problems.append(f"{course_id} roster index out of sync with enrollments")
+        waitlist = db['waitlists'].get(course_id, [])
+        if len(waitlist) != len(set(waitlist)):
+            problems.append(f"{course_id} waitlist contains duplicates")
+    for student_id, courses in db['enrollments'].items():
+        if len(courses) != len(set(courses)):
+            problems.append(f"{student_id} enrolled twice in the same course")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--courses', type=int, default=4)
+    parser.add_argument('--capacity', type=int, default=25)
+    parser.add_argument('--ops', type=int, default=300, help="operations per thread")
+    args = parser.parse_args()
+
+    seed(database_service.app.test_client(), args.students, args.courses, args.capacity)
+    student_ids = list(database_service.db['users'])
+    course_ids = list(database_service.db['courses'])
+
+    max_seen, errors = {}, []
+    threads = [
+        threading.Thread(target=worker, args=(student_ids, course_ids, args.ops, max_seen, errors))
+        for _ in range(args.threads)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    problems = check_invariants(args.capacity)
+    problems += [f"{c} reported {n}/{args.capacity} during the run" for c, n in max_seen.items() if n > args.capacity]
+    total_ops = args.threads * args.ops
+    print(f"{total_ops} operations on {args.courses} courses with {args.threads} threads "
+          f"in {elapsed:.2f}s ({total_ops / elapsed:.0f} ops/s)")
+    print(f"Unexpected responses: {len(errors)}")
+    if problems:
+        print("FAILED:")
+        for problem in problems:
+            print(f"  - {problem}")
+        sys.exit(1)
+    print("OK: zero oversold seats, roster index consistent, no duplicate waitlist entries.")
+
+
+if __name__ == '__main__':
+    main()
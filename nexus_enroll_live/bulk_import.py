@@ -0,0 +1,85 @@
+# bulk_import.py
+"""
+Helpers shared by the bulk import endpoints (users, courses, enrollments).
+
+A bulk upload can be sent as:
+  * application/json      - a JSON array of objects
+  * application/x-ndjson  - one JSON object per line, read as a stream
+  * text/csv              - a header row followed by one row per entity, read as a stream
+
+Rows are yielded one at a time, so NDJSON and CSV uploads are never held in memory
+as a whole. A malformed row is reported with its row number instead of failing the upload.
+"""
+import csv
+import io
+import json
+
+CHUNK_SIZE = 1000
+
+
+class BulkRowError(Exception):
+    """A single row could not be parsed; carries the 1-based row number."""
+    def __init__(self, row, message):
+        super().__init__(message)
+        self.row = row
+
+
+def iter_rows(request):
+    """Yields (row_number, record) pairs, or (row_number, BulkRowError) for unparseable rows."""
+    mimetype = request.mimetype
+    if mimetype == 'application/x-ndjson':
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8')
+        row = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            row += 1
+            try:
+                yield row, json.loads(line)
+            except ValueError as e:
+                yield row, BulkRowError(row, f"Invalid JSON: {e}")
+    elif mimetype == 'text/csv':
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        for row, record in enumerate(csv.DictReader(stream), start=1):
+            yield row, record
+    else:
+        records = request.get_json(silent=True)
+        if not isinstance(records, list):
+            raise ValueError("Expected a JSON array, NDJSON (application/x-ndjson) or CSV (text/csv) body.")
+        for row, record in enumerate(records, start=1):
+            yield row, record
+
+
+def split_ids(value):
+    """A list of IDs given as a JSON array or a ';'-separated CSV cell; blanks and repeats dropped."""
+    if value is None or value == "":
+        return []
+    items = value.split(';') if isinstance(value, str) else value
+    return list(dict.fromkeys(str(item).strip() for item in items if str(item).strip()))
+
+
+def chunked(items, size=CHUNK_SIZE):
+    """Groups an iterable into lists of at most `size` items."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class BulkReport:
+    """Collects the outcome of a bulk import: counts plus a per-row error list."""
+    def __init__(self):
+        self.received = 0
+        self.imported = 0
+        self.errors = []
+
+    def error(self, row, message):
+        self.errors.append({"row": row, "error": message})
+
+    def to_dict(self):
+        return {"received": self.received, "imported": self.imported,
+                "failed": len(self.errors), "errors": sorted(self.errors, key=lambda e: e["row"])}
@@ -0,0 +1,125 @@
+# change_feed.py
+"""
+In-memory change feed: a bounded, versioned log of recent change events.
+
+Every event gets a monotonically increasing version number. Consumers ask for
+"changes since version N" and may long-poll until something newer arrives. Only
+the last `capacity` events are kept; a consumer that has fallen further behind
+(or presents a version from before a restart) is told to reset, i.e. reload a
+snapshot and continue from the current version.
+"""
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+import requests
+
+import wire
+
+
+class ChangeFeed:
+    def __init__(self, capacity=10000):
+        self._events = deque(maxlen=capacity)  # (version, event) in version order
+        self._version = 0
+        self._cond = threading.Condition()
+
+    @property
+    def version(self):
+        return self._version
+
+    def publish(self, event, version=None):
+        """Appends an event and wakes waiting consumers. `version` is only given when relaying another feed."""
+        with self._cond:
+            self._version = self._version + 1 if version is None else version
+            self._events.append((self._version, dict(event, version=self._version)))
+            self._cond.notify_all()
+            return self._version
+
+    def reset(self, version):
+        """Forgets buffered events and continues numbering from `version` (used when relaying a restarted feed)."""
+        with self._cond:
+            self._events.clear()
+            self._version = version
+            self._cond.notify_all()
+
+    def since(self, version, limit=1000, wait=0.0):
+        """
+        Returns (events newer than `version`, current version, reset flag).
+        With `wait` > 0 and nothing new, blocks up to `wait` seconds for the next event.
+        """
+        with self._cond:
+            if wait > 0 and version == self._version:
+                self._cond.wait_for(lambda: self._version != version, timeout=wait)
+            if version > self._version:
+                return [], self._version, True  # the consumer saw a feed from before a restart
+            if version == self._version:
+                return [], self._version, False
+            oldest = self._events[0][0] if self._events else self._version + 1
+            if version < oldest - 1:
+                return [], self._version, True  # the events the consumer missed were evicted
+            # Versions in the buffer are contiguous, so the start position is a subtraction
+            start = version - oldest + 1
+            events = [event for _, event in islice(self._events, start, start + limit)]
+            return events, self._version, False
+
+
+class ChangeFeedRelay:
+    """
+    Mirrors a remote /changes feed into a local ChangeFeed using one long-polling
+    thread, so any number of local subscribers (e.g. SSE clients) cost a single
+    connection to the source service.
+
+    Given several clients (the shards of a sharded database), it follows each one
+    with its own thread and merges their events into the local feed. Event order
+    is kept per shard, and events are renumbered locally because the shards'
+    versions are independent. If any shard's feed has to be resynchronized,
+    subscribers are told to reset.
+    """
+
+    def __init__(self, client, path="/changes", wait=20.0, retry_delay=1.0):
+        self.clients = list(client) if isinstance(client, (list, tuple)) else [client]
+        self.path = path
+        self.wait = wait
+        self.retry_delay = retry_delay
+        self.feed = ChangeFeed()
+        self._threads = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Starts the polling threads on first use."""
+        with self._start_lock:
+            if self._threads is None:
+                self._threads = [threading.Thread(target=self._run, args=(client,), name="change-feed-relay",
+                                                  daemon=True) for client in self.clients]
+                for thread in self._threads:
+                    thread.start()
+
+    def _run(self, client):
+        merged = len(self.clients) > 1
+        version = None
+        synced = False
+        while True:
+            try:
+                if version is None:
+                    # (Re)synchronize: continue from whatever the source's current version is
+                    body = wire.decode(client.get(self.path, params={"since": 0, "limit": 0}))
+                    version = body['version']
+                    if not merged:
+                        self.feed.reset(version)
+                    elif synced:
+                        # Events from this shard were missed: skip a version so every subscriber resets
+                        self.feed.reset(self.feed.version + 1)
+                    synced = True
+                body = wire.decode(client.get(self.path, params={"since": version, "wait": self.wait},
+                                              timeout=(1.0, self.wait + 5.0)))
+                if body['reset']:
+                    version = None
+                    continue
+                for event in body['changes']:
+                    self.feed.publish(event, version=None if merged else event['version'])
+                    version = event['version']
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                print(f"Change feed relay lost its source ({e}); retrying.")
+                version = None
+                time.sleep(self.retry_delay)
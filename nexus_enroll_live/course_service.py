@@ -1,29 +1,134 @@
 # course_service.py
-from flask import Flask, request, jsonify
+import csv
+import io
+from flask import Flask, request, jsonify, Response
 import requests
 from flask_cors import CORS
+from sharding import ShardedDatabase
+from bulk_import import BulkReport, BulkRowError, chunked, iter_rows, split_ids
+from instrumentation import instrument
+from health import add_health_endpoints, downstream_check
+from timetable import normalize_schedule
+import wire
 
 app = Flask(__name__)
 CORS(app)
-DB_SERVICE_URL = "http://127.0.0.1:5000"
+instrument(app, "course_service")
+# Every database shard keeps a copy of the catalog, so course writes go to all of them
+db_shards = ShardedDatabase.from_env()
+add_health_endpoints(app, **{client.name: downstream_check(client) for client in db_shards.clients})
+
+def build_course(data):
+    """
+    Validates raw course input and returns the record to store. Optional fields:
+    prerequisites (course IDs) and schedule (meetings such as "Mon 09:00-10:30").
+    """
+    # In a real app, you'd have a Course class, but for simplicity we use a dict
+    course = {
+        "course_id": data['course_id'],
+        "name": data['name'],
+        "capacity": int(data['capacity']),
+        "prerequisites": split_ids(data.get('prerequisites')),
+        "schedule": normalize_schedule(data.get('schedule'))
+    }
+    if course['course_id'] in course['prerequisites']:
+        raise ValueError(f"Course '{course['course_id']}' cannot be its own prerequisite.")
+    return course
 
 @app.route('/courses', methods=['POST'])
 def create_course_endpoint():
     data = request.json
     try:
-        # In a real app, you'd have a Course class, but for simplicity we use a dict
-        course_data = {
-            "course_id": data['course_id'],
-            "name": data['name'],
-            "capacity": int(data['capacity'])
-        }
-        response = requests.post(f"{DB_SERVICE_URL}/courses", json=course_data)
-        if response.status_code == 201:
+        course_data = build_course(data)
+        responses = db_shards.broadcast("/courses", json=course_data)
+        if all(response.status_code == 201 for response in responses):
             return jsonify({"message": "Course created successfully.", "course": course_data}), 201
         else:
             return jsonify({"error": "Failed to save course"}), 500
     except (ValueError, KeyError) as e:
         return jsonify({"error": str(e)}), 400
+    except requests.exceptions.RequestException as e:
+        return jsonify({"error": f"Could not connect to database service: {e}"}), 503
+
+def _validated_courses(rows, report):
+    """Validates every uploaded row, recording rows that fail."""
+    for row, data in rows:
+        report.received += 1
+        if isinstance(data, BulkRowError):
+            report.error(row, str(data))
+            continue
+        try:
+            yield row, build_course(data)
+        except (ValueError, KeyError, TypeError) as e:
+            report.error(row, f"Invalid course: {e}")
+
+@app.route('/courses/bulk', methods=['POST'])
+def bulk_create_courses_endpoint():
+    """
+    Bulk import for semester rollover: accepts a JSON array, NDJSON or CSV
+    (columns: course_id, name, capacity and optionally prerequisites and schedule, each
+    ';'-separated). Valid courses are saved in chunks.
+    """
+    report = BulkReport()
+    try:
+        for chunk in chunked(_validated_courses(iter_rows(request), report)):
+            responses = db_shards.broadcast("/courses/bulk", json={"courses": [course for _, course in chunk]})
+            if all(response.status_code == 201 for response in responses):
+                report.imported += len(chunk)
+            else:
+                for row, _ in chunk:
+                    report.error(row, "Failed to save course")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except requests.exceptions.RequestException as e:
+        return jsonify({"error": f"Could not connect to database service: {e}", "report": report.to_dict()}), 503
+    return jsonify(report.to_dict()), 200
+
+@app.route('/reports/capacity', methods=['GET'])
+def capacity_report_endpoint():
+    """
+    Courses at or above ?threshold= utilization (default 0.9), fullest first.
+    ?format=csv returns a CSV download instead of JSON.
+    """
+    if db_shards.sharded:
+        return _sharded_capacity_report()
+    try:
+        response = db_shards.primary.get("/reports/capacity", params=request.args.to_dict(),
+                                         headers=wire.relay_headers())
+    except requests.exceptions.RequestException as e:
+        return jsonify({"error": f"Could not connect to database service: {e}"}), 503
+    headers = {}
+    if request.args.get('format') == 'csv' and response.status_code == 200:
+        headers["Content-Disposition"] = "attachment; filename=capacity_report.csv"
+    return Response(response.content, status=response.status_code,
+                    content_type=response.headers.get('Content-Type', 'application/json'), headers=headers)
+
+REPORT_COLUMNS = ["course_id", "name", "enrolled_count", "capacity", "utilization", "waitlist_length"]
+
+def _sharded_capacity_report():
+    """
+    Merges the shards' reports. Every shard tracks the whole catalog, but only the
+    shard that owns a course has its enrollments, so each course is taken from its owner.
+    """
+    params = {"threshold": request.args.get('threshold', '0.9')}
+    try:
+        responses = db_shards.scatter("GET", "/reports/capacity", params=params)
+    except requests.exceptions.RequestException as e:
+        return jsonify({"error": f"Could not connect to database service: {e}"}), 503
+    if responses[0].status_code != 200:
+        return jsonify(wire.decode(responses[0])), responses[0].status_code
+    reports = [wire.decode(response) for response in responses]
+    courses = [row for index, report in enumerate(reports) for row in report['courses']
+               if db_shards.index_for(row['course_id']) == index]
+    courses.sort(key=lambda row: (-(row['utilization'] or 0), row['course_id']))
+    if request.args.get('format') == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=REPORT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(courses)
+        return Response(buffer.getvalue(), mimetype='text/csv',
+                        headers={"Content-Disposition": "attachment; filename=capacity_report.csv"})
+    return jsonify(dict(reports[0], matching=len(courses), courses=courses))
 
 if __name__ == '__main__':
     # Runs on port 5002
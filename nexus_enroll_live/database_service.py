@@ -1,70 +1,1048 @@
-from flask import Flask, jsonify, request
+import bisect
+import csv
+import heapq
+import io
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+from flask import Flask, jsonify, request, g, has_request_context, Response
 from flask_cors import CORS
+from persistence import DurableStore
+from change_feed import ChangeFeed
+from instrumentation import current_request_id, instrument
+from health import add_health_endpoints
+from timetable import schedule_mask, schedules_overlap
+from utilization import UtilizationIndex, alert_thresholds_from_env
+import wire
 
 app = Flask(__name__)
 CORS(app) 
+instrument(app, "database_service", quiet_routes=("/changes",))
+# Service clients get MessagePack when they ask for it; browsers keep getting JSON
+wire.enable(app)
+# In-memory mode (store is None) is always ready; otherwise the write-ahead log must be accepting writes
+add_health_endpoints(app, write_ahead_log=lambda: store is None or store.is_running())
 
 # This dictionary acts as our in-memory database.
 db = {
     "users": {},
     "courses": {},
     "enrollments": {}, 
-    "waitlists": {}
+    "waitlists": {}  # course_id -> deque of student_ids, head first
 }
 
+# Reverse index (course_id -> set of enrolled student_ids), maintained on every
+# enrollment write so capacity checks never scan all students. It is kept
+# outside `db` so that /data stays plain JSON; len() gives the enrolled count.
+course_rosters = {}
+
+def _reindex_student(student_id, old_courses, new_courses):
+    """Applies the difference between a student's old and new course lists to the reverse index."""
+    old_set, new_set = set(old_courses), set(new_courses)
+    for course_id in old_set - new_set:
+        roster = course_rosters.get(course_id)
+        if roster is not None:
+            roster.discard(student_id)
+    for course_id in new_set - old_set:
+        course_rosters.setdefault(course_id, set()).add(student_id)
+
+def get_enrolled_count(course_id):
+    return len(course_rosters.get(course_id, ()))
+
+# Rosters in student ID order for paginated /rosters reads (course_id -> sorted list),
+# built on first read and dropped whenever the course's roster changes
+_sorted_rosters = {}
+
+def _roster_changed(course_id):
+    _sorted_rosters.pop(course_id, None)
+    _track_utilization(course_id)
+
+def sorted_roster(course_id):
+    sorted_ids = _sorted_rosters.get(course_id)
+    if sorted_ids is None:
+        # Built under the course lock so a concurrent enroll or drop cannot leave a stale copy behind
+        with course_lock(course_id):
+            sorted_ids = _sorted_rosters[course_id] = sorted(course_rosters.get(course_id, ()))
+    return sorted_ids
+
+# Per-course utilization, updated with every enrollment change so capacity
+# reports and threshold alerts never scan the rosters
+capacity_index = UtilizationIndex(alert_thresholds_from_env())
+
+def _track_utilization(course_id):
+    course = db['courses'].get(course_id)
+    if course is not None:
+        capacity_index.update(course_id, get_enrolled_count(course_id), course['capacity'])
+
+# Waitlist membership index (course_id -> set of waiting student_ids), so
+# "is this student already waiting?" never scans the queue.
+waitlist_members = {}
+
+# Seats reserved for promoted waitlisters in "hold" mode:
+# course_id -> {student_id: expiry as a Unix timestamp}. A held seat counts as taken.
+seat_holds = {}
+
+def is_waitlisted(student_id, course_id):
+    return student_id in waitlist_members.get(course_id, ())
+
+def _remove_from_waitlist(student_id, course_id):
+    """Takes a student out of a course's waitlist (O(1) when they are at the head)."""
+    members = waitlist_members.get(course_id)
+    if not members or student_id not in members:
+        return
+    members.discard(student_id)
+    queue = db['waitlists'][course_id]
+    if queue[0] == student_id:
+        queue.popleft()
+    else:
+        queue.remove(student_id)
+
+# Fine-grained locking: every check-and-mutate on a course runs under that
+# course's own lock, so requests for different courses never wait on each other.
+_course_locks = {}
+_course_locks_guard = threading.Lock()
+
+def course_lock(course_id):
+    """Returns the lock for a course, creating it on first use."""
+    with _course_locks_guard:
+        lock = _course_locks.get(course_id)
+        if lock is None:
+            lock = _course_locks[course_id] = threading.Lock()
+        return lock
+
+def lock_courses(course_ids):
+    """Acquires several course locks in sorted order (avoids deadlocks). Use as a context manager."""
+    stack = ExitStack()
+    for course_id in sorted(set(course_ids)):
+        stack.enter_context(course_lock(course_id))
+    return stack
+
+# Whether a student may take a course depends on their whole schedule, so the
+# eligibility check and the enroll it guards also hold a per-student lock. The
+# locks are striped (a fixed pool, picked by hashing the ID) and always taken
+# after any course locks, one at a time, so they cannot deadlock.
+_student_locks = [threading.Lock() for _ in range(64)]
+
+def student_lock(student_id):
+    return _student_locks[hash(student_id) % len(_student_locks)]
+
+# --- Prerequisites and Timetables ---
+# Precomputed so checking a whole cart is a few set lookups and bitwise ANDs,
+# never a walk over the catalog:
+#   schedule_masks     course_id -> bitmap of its meeting times (see timetable.py),
+#                      built whenever a course is written
+#   _closures          course_id -> every course it requires, directly or transitively
+#   _student_credits   student_id -> courses they have credit for: their completed
+#                      courses plus everything those required
+# Closures and credits are filled in on first use and dropped when the catalog changes.
+schedule_masks = {}
+_closures = {}
+_student_credits = {}  # student_id -> (user record it was derived from, credits)
+_catalog_generation = 0
+_catalog_guard = threading.Lock()
+
+def _reset_catalog_indexes():
+    global _catalog_generation
+    with _catalog_guard:
+        _catalog_generation += 1
+        _closures.clear()
+        _student_credits.clear()
+
+def prerequisite_closure(course_id):
+    """All courses required before `course_id`, directly or through other prerequisites."""
+    closure = _closures.get(course_id)
+    if closure is not None:
+        return closure
+    generation = _catalog_generation
+    required = set()
+    pending = list((db['courses'].get(course_id) or {}).get('prerequisites', ()))
+    while pending:
+        prerequisite = pending.pop()
+        if prerequisite in required or prerequisite == course_id:
+            continue  # also stops at cycles
+        required.add(prerequisite)
+        known = _closures.get(prerequisite)
+        if known is not None:
+            required |= known
+        else:
+            pending.extend((db['courses'].get(prerequisite) or {}).get('prerequisites', ()))
+    required.discard(course_id)
+    closure = frozenset(required)
+    with _catalog_guard:
+        if generation == _catalog_generation:
+            _closures[course_id] = closure
+    return closure
+
+def student_credits(student_id):
+    """Courses that count as taken for prerequisites: completed ones and everything they required."""
+    user = db['users'].get(student_id) or {}
+    cached = _student_credits.get(student_id)
+    if cached is not None and cached[0] is user:
+        return cached[1]
+    generation = _catalog_generation
+    credits = set()
+    for course_id in user.get('completed_courses', ()):
+        credits.add(course_id)
+        credits |= prerequisite_closure(course_id)
+    credits = frozenset(credits)
+    with _catalog_guard:
+        if generation == _catalog_generation:
+            _student_credits[student_id] = (user, credits)
+    return credits
+
+def _eligibility_problem(student_id, course_id, elsewhere=()):
+    """
+    Returns None if the student may take the course, otherwise (status, details):
+    "missing_prerequisites" with the missing course IDs, or "schedule_conflict"
+    with the enrolled course that meets at the same time. In sharded mode
+    `elsewhere` lists the student's courses held by other shards.
+    Caller must hold the student's lock.
+    """
+    prerequisites = db['courses'][course_id].get('prerequisites')
+    if prerequisites:
+        credits = student_credits(student_id)
+        missing = [p for p in prerequisites if p not in credits]
+        if missing:
+            return "missing_prerequisites", {"missing": missing}
+    mask = schedule_masks.get(course_id, 0)
+    if mask:
+        enrolled = db['enrollments'].get(student_id, ())
+        if elsewhere:
+            enrolled = list(enrolled) + list(elsewhere)
+        busy = 0
+        for other in enrolled:
+            busy |= schedule_masks.get(other, 0)
+        if busy & mask:
+            schedule = db['courses'][course_id].get('schedule')
+            conflict = next((other for other in enrolled if schedule_masks.get(other, 0) & mask
+                             and schedules_overlap(schedule, (db['courses'].get(other) or {}).get('schedule'))), None)
+            if conflict:
+                return "schedule_conflict", {"conflicts_with": conflict}
+    return None
+
+# --- Mutations and Durability ---
+# Every change to the data goes through _write() as a small operation tuple.
+# _apply() performs it on the in-memory state; with persistence enabled the
+# operation is also appended to the write-ahead log, and the same _apply()
+# replays the log on startup.
+store = None
+
+# Recent changes, versioned, so consumers can ask "what changed since version N?"
+changes = ChangeFeed()
+
+# Version stamp for user and course records, bumped on every write to them and
+# returned with each enrollment context so callers can validate their caches.
+# It starts from the clock, so it never repeats across restarts.
+entity_version = time.time_ns()
+
+def _apply(op):
+    """Performs one mutation on the in-memory state (live writes and log replay)."""
+    global entity_version
+    kind = op[0]
+    if kind == "put_users":
+        for user_data in op[1]:
+            db['users'][user_data['user_id']] = user_data
+        entity_version += 1
+    elif kind == "put_courses":
+        for course_data in op[1]:
+            db['courses'][course_data['course_id']] = course_data
+            schedule_masks[course_data['course_id']] = schedule_mask(course_data.get('schedule'))
+            _track_utilization(course_data['course_id'])
+        _reset_catalog_indexes()
+        entity_version += 1
+    elif kind in ("enroll", "promote"):
+        # A student who gets a seat leaves the waitlist and gives up any hold on it
+        _, student_id, course_id = op
+        db['enrollments'].setdefault(student_id, []).append(course_id)
+        course_rosters.setdefault(course_id, set()).add(student_id)
+        _remove_from_waitlist(student_id, course_id)
+        seat_holds.get(course_id, {}).pop(student_id, None)
+        _roster_changed(course_id)
+    elif kind == "drop":
+        _, student_id, course_id = op
+        db['enrollments'][student_id].remove(course_id)
+        course_rosters[course_id].discard(student_id)
+        _roster_changed(course_id)
+    elif kind == "waitlist":
+        _, student_id, course_id = op
+        db['waitlists'].setdefault(course_id, deque()).append(student_id)
+        waitlist_members.setdefault(course_id, set()).add(student_id)
+    elif kind == "unwaitlist":
+        # (student_id, course_id), plus (reason, details) when promotion passed the student over
+        _remove_from_waitlist(op[1], op[2])
+    elif kind == "hold":
+        _, student_id, course_id, expires_at = op
+        _remove_from_waitlist(student_id, course_id)
+        seat_holds.setdefault(course_id, {})[student_id] = expires_at
+    elif kind == "release_hold":
+        _, student_id, course_id = op
+        seat_holds.get(course_id, {}).pop(student_id, None)
+    elif kind == "set_enrollments":
+        _, student_id, courses = op
+        old_courses = db['enrollments'].get(student_id, [])
+        _reindex_student(student_id, old_courses, courses)
+        db['enrollments'][student_id] = courses
+        for course_id in set(old_courses) ^ set(courses):
+            _roster_changed(course_id)
+    elif kind == "set_waitlist":
+        _, course_id, students = op
+        db['waitlists'][course_id] = deque(dict.fromkeys(students))
+        waitlist_members[course_id] = set(students)
+    elif kind == "clear":
+        for collection in db.values():
+            collection.clear()
+        course_rosters.clear()
+        _sorted_rosters.clear()
+        waitlist_members.clear()
+        seat_holds.clear()
+        schedule_masks.clear()
+        _reset_catalog_indexes()
+        capacity_index.clear()
+        entity_version += 1
+    else:
+        raise ValueError(f"Unknown operation: {kind}")
+
+def _describe(op):
+    """Turns an applied operation into a change-feed event (a delta, not a snapshot)."""
+    kind = op[0]
+    if kind in ("enroll", "drop"):
+        _, student_id, course_id = op
+        course = db['courses'].get(course_id) or {}
+        return {"type": kind, "student_id": student_id, "course_id": course_id,
+                "enrolled_count": get_enrolled_count(course_id), "capacity": course.get('capacity')}
+    if kind in ("waitlist", "unwaitlist"):
+        student_id, course_id = op[1], op[2]
+        event = {"type": "waitlist" if kind == "waitlist" else "waitlist_removed",
+                 "student_id": student_id, "course_id": course_id,
+                 "waitlist_length": len(db['waitlists'].get(course_id, ()))}
+        if len(op) > 3:
+            # Passed over for the freed seat: enough for the student to be told why
+            event.update(op[4], reason=op[3], student_name=(db['users'].get(student_id) or {}).get('name'),
+                         course_name=(db['courses'].get(course_id) or {}).get('name'))
+        return event
+    if kind in ("promote", "hold"):
+        student_id, course_id = op[1], op[2]
+        course = db['courses'].get(course_id) or {}
+        event = {"type": "promoted" if kind == "promote" else "seat_held",
+                 "student_id": student_id, "course_id": course_id,
+                 "student_name": (db['users'].get(student_id) or {}).get('name'), "course_name": course.get('name'),
+                 "enrolled_count": get_enrolled_count(course_id), "capacity": course.get('capacity'),
+                 "waitlist_length": len(db['waitlists'].get(course_id, ()))}
+        if kind == "hold":
+            event["hold_expires_at"] = op[3]
+        return event
+    if kind == "release_hold":
+        return {"type": "hold_released", "student_id": op[1], "course_id": op[2]}
+    if kind == "set_enrollments":
+        return {"type": "enrollments_replaced", "student_id": op[1], "courses": op[2]}
+    if kind == "set_waitlist":
+        return {"type": "waitlist_replaced", "course_id": op[1], "students": op[2]}
+    if kind == "put_users":
+        return {"type": "users_updated", "user_ids": [u['user_id'] for u in op[1]]}
+    if kind == "put_courses":
+        return {"type": "courses_updated", "course_ids": [c['course_id'] for c in op[1]]}
+    return {"type": "cleared"}
+
+def _courses_changed_by(op):
+    """Courses whose enrolled count or capacity an operation may change (read before applying it)."""
+    kind = op[0]
+    if kind in ("enroll", "promote", "drop"):
+        return [op[2]]
+    if kind == "set_enrollments":
+        return list(set(db['enrollments'].get(op[1], [])) ^ set(op[2]))
+    if kind == "put_courses":
+        return [course['course_id'] for course in op[1]]
+    return []
+
+def _capacity_alerts(course_id, before):
+    """Alert events for every threshold the course crossed since its utilization was `before`."""
+    after = capacity_index.ratio(course_id)
+    course = db['courses'].get(course_id) or {}
+    return [{"type": "capacity_alert", "course_id": course_id, "course_name": course.get('name'),
+             "threshold": threshold, "direction": direction, "enrolled_count": get_enrolled_count(course_id),
+             "capacity": course.get('capacity'), "utilization": round(after, 4)}
+            for threshold, direction in capacity_index.crossings(before, after)]
+
+# Operations that no course lock orders against the others: a reset, and the
+# bulk replacements of users, courses and a student's whole enrollment list.
+# They are logged with every other write paused, so replay sees them in the same order.
+_UNORDERED_OPS = frozenset({"clear", "put_users", "put_courses", "set_enrollments"})
+
+def _write(*op):
+    """
+    Applies a mutation, publishes it on the change feed and, when persistence
+    is on, logs it before the response is sent. A change that moves a course
+    across a capacity alert threshold also publishes a capacity_alert event.
+    """
+    watched = _courses_changed_by(op)
+    before = [capacity_index.ratio(course_id) for course_id in watched]
+    seq = None
+    if store is None:
+        _apply(op)
+    else:
+        seq = store.commit(op, exclusive=op[0] in _UNORDERED_OPS)
+        if has_request_context():
+            g.wal_seq = seq
+    events = [_describe(op)]
+    for course_id, ratio in zip(watched, before):
+        events.extend(_capacity_alerts(course_id, ratio))
+    request_id = current_request_id()
+    for event in events:
+        if request_id:
+            event["request_id"] = request_id  # lets consumers trace a change back to the request that made it
+        changes.publish(event)
+    return seq
+
+@app.after_request
+def _wait_for_durability(response):
+    # Group commit: the write is acknowledged only once its log record is fsync'd
+    seq = g.pop('wal_seq', None)
+    if seq is not None and not store.wait_durable(seq):
+        return jsonify({"error": "Write was applied but could not be made durable in time."}), 503
+    return response
+
+def _get_state():
+    return {"db": db, "course_rosters": course_rosters, "seat_holds": seat_holds}
+
+def _load_state(state):
+    for name, collection in state["db"].items():
+        db[name].clear()
+        db[name].update(collection)
+    course_rosters.clear()
+    course_rosters.update(state["course_rosters"])
+    _sorted_rosters.clear()
+    # Snapshots from before the promotion engine hold plain lists and no holds
+    for course_id, students in db['waitlists'].items():
+        db['waitlists'][course_id] = deque(students)
+    waitlist_members.clear()
+    waitlist_members.update({course_id: set(queue) for course_id, queue in db['waitlists'].items()})
+    seat_holds.clear()
+    seat_holds.update(state.get("seat_holds", {}))
+    schedule_masks.clear()
+    schedule_masks.update({course_id: schedule_mask(course.get('schedule')) for course_id, course in db['courses'].items()})
+    _reset_catalog_indexes()
+    capacity_index.clear()
+    for course_id in db['courses']:
+        _track_utilization(course_id)
+
+def init_persistence(data_dir, snapshot_every=200000):
+    """Enables the write-ahead log in `data_dir`, restoring any state saved there."""
+    global store
+    store = DurableStore(data_dir, _apply, _get_state, _load_state, snapshot_every=snapshot_every)
+    replayed = store.recover()
+    for course_id, holds in seat_holds.items():
+        for expires_at in holds.values():
+            _schedule_hold_expiry(expires_at, course_id)
+    print(f"Database restored from {data_dir}: {len(db['users'])} users, {len(db['courses'])} courses, "
+          f"{replayed} log records replayed.")
+    return store
+
+# --- Snapshot Reads ---
+COLLECTIONS = ("users", "courses", "enrollments", "waitlists")
+MAX_PAGE_SIZE = 5000
+STREAM_BATCH = 500
+
+def _parse_data_query(args):
+    """Reads the collection and field selections shared by every /data mode."""
+    collections = [c for c in args.get('collections', '').split(',') if c] or list(COLLECTIONS)
+    unknown = [c for c in collections if c not in COLLECTIONS]
+    if unknown:
+        raise ValueError(f"Unknown collection(s): {', '.join(unknown)}")
+    fields = [f for f in args.get('fields', '').split(',') if f] or None
+    return collections, fields
+
+def _project(value, fields):
+    """Keeps only the requested fields of a user/course record (lists are returned whole)."""
+    if isinstance(value, deque):
+        return list(value)
+    if fields and isinstance(value, dict):
+        return {field: value[field] for field in fields if field in value}
+    return value
+
+def _iter_collection(name, start=0):
+    """Yields (key, value) pairs in insertion order, tolerating concurrent writes."""
+    collection = db[name]
+    keys = list(collection)  # copying only the keys lets writers keep going while we read
+    for index in range(start, len(keys)):
+        value = collection.get(keys[index])
+        if value is not None:
+            yield keys[index], value
+
+def _read_page(collections, fields, cursor, limit):
+    """
+    One page of at most `limit` records across the selected collections.
+    The cursor is "<collection>:<offset>", the position where the next page starts.
+    """
+    start_name, start_offset = collections[0], 0
+    if cursor:
+        start_name, _, offset = cursor.partition(':')
+        if start_name not in collections or not offset.isdigit():
+            raise ValueError(f"Invalid cursor: {cursor}")
+        start_offset = int(offset)
+
+    page, count = {}, 0
+    for name in collections[collections.index(start_name):]:
+        offset = start_offset if name == start_name else 0
+        items = {}
+        for key, value in _iter_collection(name, offset):
+            if count >= limit:
+                # The cursor points at a record that exists; a collection the page
+                # has not reached yet is left out rather than sent empty
+                if items:
+                    page[name] = items
+                return page, f"{name}:{offset}"
+            items[key] = _project(value, fields)
+            offset += 1
+            count += 1
+        page[name] = items
+    return page, None
+
+def _stream_json(collections, fields):
+    """Encodes the selected collections as one JSON document, a few hundred records at a time."""
+    yield '{'
+    for index, name in enumerate(collections):
+        yield f'{", " if index else ""}{json.dumps(name)}: {{'
+        batch, first = [], True
+        for key, value in _iter_collection(name):
+            batch.append(f'{json.dumps(key)}: {json.dumps(_project(value, fields))}')
+            if len(batch) >= STREAM_BATCH:
+                yield ('' if first else ', ') + ', '.join(batch)
+                batch, first = [], False
+        if batch:
+            yield ('' if first else ', ') + ', '.join(batch)
+        yield '}'
+    yield '}'
+
+def _stream_msgpack(collections, fields):
+    """The same document as _stream_json, encoded as MessagePack."""
+    packer = wire.msgpack.Packer()
+    yield packer.pack_map_header(len(collections))
+    for name in collections:
+        # A MessagePack map starts with its size, so take the records first (references, not copies)
+        items = list(_iter_collection(name))
+        yield packer.pack(name) + packer.pack_map_header(len(items))
+        for start in range(0, len(items), STREAM_BATCH):
+            yield b''.join(packer.pack(key) + packer.pack(_project(value, fields))
+                           for key, value in items[start:start + STREAM_BATCH])
+
+def _stream_ndjson(collections, fields):
+    """One {"collection", "key", "value"} object per line."""
+    batch = []
+    for name in collections:
+        for key, value in _iter_collection(name):
+            batch.append(json.dumps({"collection": name, "key": key, "value": _project(value, fields)}))
+            if len(batch) >= STREAM_BATCH:
+                yield '\n'.join(batch) + '\n'
+                batch = []
+    if batch:
+        yield '\n'.join(batch) + '\n'
+
 @app.route('/data', methods=['GET'])
 def get_all_data():
-    """Endpoint to view the entire database state."""
-    return jsonify(db)
+    """
+    Endpoint to view the database state. Optional query parameters:
+      collections=courses,waitlists   only these collections
+      fields=name,capacity            only these fields of each user/course record
+      limit=500&cursor=...            one page of records plus a next_cursor
+      format=ndjson                   one record per line instead of one JSON document
+    Without `limit` the response is streamed, so memory stays flat as the database grows.
+    Callers that accept them get MessagePack instead of JSON and a gzip-compressed stream.
+    """
+    try:
+        collections, fields = _parse_data_query(request.args)
+        if 'limit' in request.args:
+            limit = min(int(request.args['limit']), MAX_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError("limit must be at least 1")
+            page, next_cursor = _read_page(collections, fields, request.args.get('cursor'), limit)
+            return jsonify({"data": page, "next_cursor": next_cursor})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if request.args.get('format') == 'ndjson':
+        body, mimetype = _stream_ndjson(collections, fields), 'application/x-ndjson'
+    elif wire.wants_msgpack():
+        body, mimetype = _stream_msgpack(collections, fields), wire.MSGPACK
+    else:
+        body, mimetype = _stream_json(collections, fields), 'application/json'
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if wire.accepts_gzip():
+        body = wire.gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, mimetype=mimetype, headers=headers)
+
+@app.route('/enrollment_context/<student_id>/<course_id>', methods=['GET'])
+def get_enrollment_context(student_id, course_id):
+    """
+    Composite read for the enrollment facade.
+    Returns only the records an enroll/drop needs instead of the whole database.
+    With ?entities=0 the student and course records are left out (the caller has
+    them cached and checks `entity_version` instead).
+    """
+    context = {
+        "entity_version": entity_version,
+        "enrollments": db['enrollments'].get(student_id, []),
+        "enrolled_count": get_enrolled_count(course_id),
+        "held_seats": len(seat_holds.get(course_id, ())),
+        "waitlisted": is_waitlisted(student_id, course_id),
+        "waitlist_length": len(db['waitlists'].get(course_id, ()))
+    }
+    if request.args.get('entities') != '0':
+        context["student"] = db['users'].get(student_id)
+        context["course"] = db['courses'].get(course_id)
+    return jsonify(context)
+
+@app.route('/enrollment_context/<student_id>', methods=['GET'])
+def get_cart_context(student_id):
+    """
+    Composite read for a whole registration cart (?course_ids=CS101,MA202,...):
+    the student, their enrollments, and each requested course with its seat counts and waitlist status.
+    ?entities=0 leaves out the student and course records, as above.
+    """
+    course_ids = [c for c in request.args.get('course_ids', '').split(',') if c]
+    include_entities = request.args.get('entities') != '0'
+    courses = {}
+    for course_id in course_ids:
+        courses[course_id] = {
+            "enrolled_count": get_enrolled_count(course_id),
+            "held_seats": len(seat_holds.get(course_id, ())),
+            "waitlisted": is_waitlisted(student_id, course_id),
+            "waitlist_length": len(db['waitlists'].get(course_id, ()))
+        }
+        if include_entities:
+            courses[course_id]["course"] = db['courses'].get(course_id)
+    context = {"entity_version": entity_version, "enrollments": db['enrollments'].get(student_id, []),
+               "courses": courses}
+    if include_entities:
+        context["student"] = db['users'].get(student_id)
+    return jsonify(context)
+
+@app.route('/schedules/<student_id>', methods=['GET'])
+def get_schedule(student_id):
+    """
+    A student's enrolled course IDs (in sharded mode, those of this shard's courses)
+    with the entity version; the caller fills in the records from its cache or /entities.
+    """
+    return jsonify({"entity_version": entity_version, "student_id": student_id,
+                    "courses": list(db['enrollments'].get(student_id, []))})
+
+@app.route('/rosters/<course_id>', methods=['GET'])
+def get_roster(course_id):
+    """
+    One page of a course's roster in student ID order: ?limit=100&cursor=<last student
+    ID of the previous page>. Returns the student IDs, the seat counts, a next_cursor
+    and the entity version.
+    """
+    try:
+        limit = min(int(request.args.get('limit', 100)), MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    roster = sorted_roster(course_id)
+    # A student ID cursor (not an offset) keeps pages stable while students enroll and drop
+    start = bisect.bisect_right(roster, request.args['cursor']) if request.args.get('cursor') else 0
+    page = roster[start:start + limit]
+    return jsonify({
+        "entity_version": entity_version,
+        "course_id": course_id,
+        "enrolled_count": len(roster),
+        "held_seats": len(seat_holds.get(course_id, ())),
+        "waitlist_length": len(db['waitlists'].get(course_id, ())),
+        "student_ids": page,
+        "next_cursor": page[-1] if page and start + limit < len(roster) else None
+    })
+
+@app.route('/entities', methods=['GET'])
+def get_entities():
+    """Batched record lookup: ?users=S001,S002&courses=CS101 returns {id: record or null} per kind."""
+    return jsonify({
+        "entity_version": entity_version,
+        "users": {user_id: db['users'].get(user_id) for user_id in request.args.get('users', '').split(',') if user_id},
+        "courses": {course_id: db['courses'].get(course_id)
+                    for course_id in request.args.get('courses', '').split(',') if course_id}
+    })
+
+@app.route('/reports/capacity', methods=['GET'])
+def capacity_report():
+    """
+    Courses at or above ?threshold= utilization (default 0.9), fullest first, read
+    from the incrementally maintained utilization index. ?format=csv returns CSV.
+    """
+    try:
+        threshold = float(request.args.get('threshold', 0.9))
+    except ValueError:
+        return jsonify({"error": "threshold must be a number, e.g. 0.9"}), 400
+    rows, tracked = capacity_index.report(threshold)
+    courses = []
+    for course_id, enrolled, capacity in rows:
+        course = db['courses'].get(course_id) or {}
+        courses.append({"course_id": course_id, "name": course.get('name'), "enrolled_count": enrolled,
+                        "capacity": capacity, "utilization": round(enrolled / capacity, 4) if capacity else None,
+                        "waitlist_length": len(db['waitlists'].get(course_id, ()))})
+    if request.args.get('format') == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=["course_id", "name", "enrolled_count", "capacity",
+                                                    "utilization", "waitlist_length"])
+        writer.writeheader()
+        writer.writerows(courses)
+        return Response(buffer.getvalue(), mimetype='text/csv')
+    return jsonify({"threshold": threshold, "courses_tracked": tracked, "matching": len(courses),
+                    "alert_thresholds": capacity_index.thresholds, "courses": courses})
+
+@app.route('/changes', methods=['GET'])
+def get_changes():
+    """
+    Change feed: ?since=<version>&limit=<n>&wait=<seconds>.
+    Returns the events after `since`; with `wait`, long-polls until one arrives.
+    "reset": true means the caller is too far behind and should reload /data.
+    """
+    try:
+        since = int(request.args.get('since', 0))
+        if since < 0:
+            raise ValueError("since must be a version number (0 or more)")
+        limit = min(int(request.args.get('limit', 1000)), MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        wait = float(request.args.get('wait', 0.0))
+        if not wait >= 0:  # also rejects NaN
+            raise ValueError("wait must be a number of seconds (0 or more)")
+        wait = min(wait, 30.0)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    events, version, reset = changes.since(since, limit=limit, wait=wait)
+    return jsonify({"version": version, "changes": events, "reset": reset})
 
 @app.route('/clear', methods=['POST'])
 def clear_data():
     """Endpoint to reset the database."""
-    global db
-    db = {"users": {}, "courses": {}, "enrollments": {}, "waitlists": {}}
+    # Every course's lock is held, so no check-and-mutate on a course straddles the reset
+    with _course_locks_guard:
+        course_ids = set(_course_locks)
+    with lock_courses(course_ids | set(db['courses'])):
+        if store is not None:
+            # Keep a copy of what is about to be wiped so it can be recovered by hand
+            archive_path = store.archive("cleared")
+            print(f"Pre-clear state archived to {archive_path}")
+        _write("clear")
     return jsonify({"message": "Database cleared."})
 
+@app.route('/admin/snapshot', methods=['POST'])
+def take_snapshot():
+    """Forces a compacted snapshot (normally taken automatically every N log records)."""
+    if store is None:
+        return jsonify({"error": "Persistence is disabled."}), 400
+    return jsonify(dict(store.snapshot(), **store.stats))
+
 # --- User Data Endpoints ---
 @app.route('/users', methods=['POST'])
 def add_user():
     user_data = request.json
-    db['users'][user_data['user_id']] = user_data
+    _write("put_users", [user_data])
     return jsonify(user_data), 201
 
 @app.route('/users/<user_id>', methods=['GET'])
 def get_user(user_id):
     return jsonify(db['users'].get(user_id))
 
+@app.route('/users/bulk', methods=['POST'])
+def add_users_bulk():
+    """Saves a chunk of already-validated users in one call."""
+    users = request.json['users']
+    _write("put_users", users)
+    return jsonify({"saved": len(users)}), 201
+
 # --- Course Data Endpoints ---
 @app.route('/courses', methods=['POST'])
 def add_course():
     course_data = request.json
-    db['courses'][course_data['course_id']] = course_data
+    _write("put_courses", [course_data])
     return jsonify(course_data), 201
 
 @app.route('/courses/<course_id>', methods=['GET'])
 def get_course(course_id):
     return jsonify(db['courses'].get(course_id))
 
+@app.route('/courses/bulk', methods=['POST'])
+def add_courses_bulk():
+    """Saves a chunk of already-validated courses in one call."""
+    courses = request.json['courses']
+    _write("put_courses", courses)
+    return jsonify({"saved": len(courses)}), 201
+
 # --- Enrollment and Waitlist Endpoints ---
 @app.route('/enrollments', methods=['GET'])
 def get_enrollments():
     return jsonify(db['enrollments'])
     
+@app.route('/enrollments/<student_id>', methods=['GET'])
+def get_student_enrollments(student_id):
+    """One student's enrolled courses (in sharded mode, only those of this shard's courses)."""
+    return jsonify(db['enrollments'].get(student_id, []))
+
 @app.route('/enrollments', methods=['POST'])
 def update_enrollments():
     enrollment_data = request.json
     student_id = enrollment_data['student_id']
-    db['enrollments'][student_id] = enrollment_data['courses']
+    while True:
+        old_courses = list(db['enrollments'].get(student_id, []))
+        with lock_courses(old_courses + enrollment_data['courses']):
+            # The list is read before its course locks are held; start over if it changed meanwhile
+            if db['enrollments'].get(student_id, []) == old_courses:
+                _write("set_enrollments", student_id, enrollment_data['courses'])
+                break
     return jsonify(db['enrollments'][student_id])
 
 @app.route('/waitlist', methods=['POST'])
 def update_waitlist():
     waitlist_data = request.json
     course_id = waitlist_data['course_id']
-    db['waitlists'][course_id] = waitlist_data['students']
-    return jsonify(db['waitlists'][course_id])
+    with course_lock(course_id):
+        _write("set_waitlist", course_id, waitlist_data['students'])
+    return jsonify(list(db['waitlists'][course_id]))
+
+# --- Atomic Operations ---
+# Each operation checks and mutates under the course's lock, so concurrent
+# requests can neither oversell the last seat nor overwrite each other's
+# waitlist appends (unlike the whole-list POSTs above).
+def _append_to_waitlist(student_id, course_id):
+    """Appends a student to a course's waitlist. Caller must hold the course lock."""
+    if is_waitlisted(student_id, course_id):
+        return "already_waitlisted"
+    _write("waitlist", student_id, course_id)
+    return "waitlisted"
+
+def _enroll_locked(student_id, course_id, waitlist_if_full, elsewhere=()):
+    """
+    Enroll-or-waitlist decision for one student. Caller must hold the course lock.
+    Returns (status, details); details explain a missing-prerequisite or schedule-conflict refusal.
+    """
+    course = db['courses'][course_id]
+    if course_id in db['enrollments'].get(student_id, []):
+        return "already_enrolled", None
+    holds = _expire_holds_locked(course_id)
+    with student_lock(student_id):
+        problem = _eligibility_problem(student_id, course_id, elsewhere)
+        if problem:
+            return problem
+        if student_id in holds:
+            _write("enroll", student_id, course_id)  # claims the seat held for them
+            return "enrolled", None
+        if get_enrolled_count(course_id) + len(holds) < course['capacity']:
+            _write("enroll", student_id, course_id)
+            return "enrolled", None
+    if waitlist_if_full:
+        return _append_to_waitlist(student_id, course_id), None
+    return "full", None
+
+# --- Waitlist Promotion ---
+# When a seat frees up, the head of the waitlist gets it without having to poll:
+#   auto  the student is enrolled straight away
+#   hold  the seat is reserved for them for HOLD_SECONDS; if they do not enroll
+#         in time it passes to the next student in line
+PROMOTION_MODE = os.environ.get("NEXUS_PROMOTION_MODE", "auto")
+HOLD_SECONDS = float(os.environ.get("NEXUS_HOLD_SECONDS", "900"))
+
+def _promote_locked(course_id):
+    """
+    Fills free seats from the head of the waitlist. Caller must hold the course lock.
+    Returns the students promoted ("enrolled" or "held") and those passed over
+    ("skipped", with the reason), in queue order.
+    """
+    course = db['courses'].get(course_id)
+    queue = db['waitlists'].get(course_id)
+    promoted = []
+    while course and queue:
+        if get_enrolled_count(course_id) + len(seat_holds.get(course_id, ())) >= course['capacity']:
+            break
+        student_id = queue[0]
+        with student_lock(student_id):
+            # Stale entries are trimmed
+            if student_id not in db['users'] or course_id in db['enrollments'].get(student_id, []):
+                _write("unwaitlist", student_id, course_id)
+                continue
+            # Students who have since enrolled in a clashing course (or lost a prerequisite) lose their place
+            problem = _eligibility_problem(student_id, course_id)
+            if problem:
+                reason, details = problem
+                _write("unwaitlist", student_id, course_id, reason, details)
+                promoted.append({"student": db['users'][student_id], "status": "skipped", "reason": reason, **details})
+                continue
+            if PROMOTION_MODE == "hold":
+                expires_at = time.time() + HOLD_SECONDS
+                _write("hold", student_id, course_id, expires_at)
+                _schedule_hold_expiry(expires_at, course_id)
+                promoted.append({"student": db['users'][student_id], "status": "held", "hold_expires_at": expires_at})
+            else:
+                _write("promote", student_id, course_id)
+                promoted.append({"student": db['users'][student_id], "status": "enrolled"})
+    return promoted
+
+def _expire_holds_locked(course_id):
+    """Releases lapsed holds and hands their seats on. Returns the live holds. Caller must hold the course lock."""
+    holds = seat_holds.get(course_id)
+    if not holds:
+        return {}
+    now = time.time()
+    expired = [student_id for student_id, expires_at in holds.items() if expires_at <= now]
+    for student_id in expired:
+        _write("release_hold", student_id, course_id)
+    if expired:
+        _promote_locked(course_id)
+    return seat_holds.get(course_id, {})
+
+# Holds also expire when nobody touches the course: one sweeper thread sleeps until the next deadline
+_hold_deadlines = []  # heap of (expires_at, course_id)
+_hold_cond = threading.Condition()
+_hold_sweeper = None
+
+def _schedule_hold_expiry(expires_at, course_id):
+    global _hold_sweeper
+    with _hold_cond:
+        heapq.heappush(_hold_deadlines, (expires_at, course_id))
+        if _hold_sweeper is None:
+            _hold_sweeper = threading.Thread(target=_sweep_holds, name="hold-sweeper", daemon=True)
+            _hold_sweeper.start()
+        _hold_cond.notify()
+
+def _sweep_holds():
+    while True:
+        with _hold_cond:
+            while not _hold_deadlines or _hold_deadlines[0][0] > time.time():
+                _hold_cond.wait(_hold_deadlines[0][0] - time.time() if _hold_deadlines else None)
+            _, course_id = heapq.heappop(_hold_deadlines)
+        with course_lock(course_id):
+            _expire_holds_locked(course_id)
+
+@app.route('/ops/enroll', methods=['POST'])
+def atomic_enroll():
+    """
+    Enrolls a student if a seat is free. When the course is full the student is
+    waitlisted instead, unless 'waitlist_if_full' is false. Students missing a
+    prerequisite or with a clashing course are refused either way. A sharded
+    router also sends 'enrolled_elsewhere', the student's courses on other shards.
+    """
+    data = request.json
+    student_id, course_id = data['student_id'], data['course_id']
+
+    with course_lock(course_id):
+        # Checked under the lock: a concurrent /clear holds every course lock
+        course = db['courses'].get(course_id)
+        if student_id not in db['users'] or not course:
+            return jsonify({"status": "not_found"}), 404
+        status, details = _enroll_locked(student_id, course_id, data.get('waitlist_if_full', True),
+                                         data.get('enrolled_elsewhere', ()))
+        enrolled_count = get_enrolled_count(course_id)
+
+    return jsonify({"status": status, "enrolled_count": enrolled_count, "capacity": course['capacity'],
+                    **(details or {})})
+
+@app.route('/ops/enroll/bulk', methods=['POST'])
+def atomic_enroll_bulk():
+    """
+    Applies many enrollments with the same rules as /ops/enroll. Items are grouped
+    by course so each course lock is taken once per chunk. Returns one status per item.
+    """
+    data = request.json
+    items = data['enrollments']
+    waitlist_if_full = data.get('waitlist_if_full', False)
+    results = [None] * len(items)
+
+    by_course = {}
+    for index, item in enumerate(items):
+        by_course.setdefault(item['course_id'], []).append(index)
+    for course_id, indices in by_course.items():
+        with course_lock(course_id):
+            if course_id not in db['courses']:
+                for index in indices:
+                    results[index] = "course_not_found"
+                continue
+            for index in indices:
+                student_id = items[index]['student_id']
+                if student_id not in db['users']:
+                    results[index] = "student_not_found"
+                else:
+                    results[index] = _enroll_locked(student_id, course_id, waitlist_if_full)[0]
+
+    return jsonify({"results": results})
+
+@app.route('/ops/enroll/cart', methods=['POST'])
+def atomic_enroll_cart():
+    """
+    Enroll-or-waitlist decisions for every course in one student's cart, applied
+    as a single atomic write: all of the cart's course locks are held together.
+    'enrolled_elsewhere' is accepted as for /ops/enroll.
+    """
+    data = request.json
+    student_id, course_ids = data['student_id'], data['course_ids']
+    elsewhere = data.get('enrolled_elsewhere', ())
+    if student_id not in db['users']:
+        return jsonify({"status": "not_found"}), 404
+
+    results, details = {}, {}
+    with lock_courses(course_ids):
+        # In cart order: of two clashing courses, the first one listed that gets a seat wins
+        for course_id in course_ids:
+            if course_id not in db['courses']:
+                results[course_id] = "not_found"
+            else:
+                results[course_id], course_details = _enroll_locked(student_id, course_id,
+                                                                    data.get('waitlist_if_full', True), elsewhere)
+                if course_details:
+                    details[course_id] = course_details
+
+    return jsonify({"results": results, "details": details})
+
+@app.route('/ops/drop', methods=['POST'])
+def atomic_drop():
+    """
+    Drops a course and, in the same critical section, promotes the head of its
+    waitlist into the freed seat (or grants them a hold). Returns who was promoted
+    or passed over, and how long the waitlist was when the seat came free.
+    """
+    data = request.json
+    student_id, course_id = data['student_id'], data['course_id']
+
+    with course_lock(course_id):
+        if course_id not in db['enrollments'].get(student_id, []):
+            return jsonify({"status": "not_enrolled"}), 400
+        _write("drop", student_id, course_id)
+        waitlist_length = len(db['waitlists'].get(course_id, ()))
+        _expire_holds_locked(course_id)
+        promoted = _promote_locked(course_id)
+
+    return jsonify({"status": "dropped", "course": db['courses'].get(course_id), "promoted": promoted,
+                    "waitlist_length": waitlist_length})
+
+@app.route('/ops/waitlist', methods=['POST'])
+def atomic_waitlist_append():
+    """
+    Appends a single student to a course's waitlist without rewriting the whole list.
+    A student already enrolled in the course is refused with 409.
+    """
+    data = request.json
+    student_id, course_id = data['student_id'], data['course_id']
+    with course_lock(course_id):
+        # Checked under the lock: a concurrent /clear holds every course lock
+        if student_id not in db['users'] or course_id not in db['courses']:
+            return jsonify({"status": "not_found"}), 404
+        if course_id in db['enrollments'].get(student_id, []):
+            return jsonify({"status": "already_enrolled"}), 409
+        status = _append_to_waitlist(student_id, course_id)
+        queue = db['waitlists'][course_id]
+        # A new entry is last in the queue; only a repeat request has to look its place up
+        position = len(queue) if status == "waitlisted" else queue.index(student_id) + 1
+    return jsonify({"status": status, "position": position})
+
+# Where the write-ahead log and snapshots live; set NEXUS_DB_DATA_DIR="" to run purely in memory
+DATA_DIR = os.environ.get("NEXUS_DB_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
 
 if __name__ == '__main__':
+    # With debug=True the reloader runs this file twice; only the serving child opens the log
+    if DATA_DIR and os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        init_persistence(DATA_DIR)
     # Runs on port 5000
     app.run(port=5000, debug=True)
\ No newline at end of file
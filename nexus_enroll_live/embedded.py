@@ -0,0 +1,94 @@
+# embedded.py
+"""
+Embedded mode: every NexusEnroll service in one process.
+
+serve.py runs each service as its own process, and every call between them is
+loopback HTTP. Embedded mode imports all five Flask apps into one interpreter:
+
+  * Before the services that call an app are imported, the app's URL is mounted
+    on the in-process transport (transport.py). Every ServiceClient call then
+    goes straight into the target app, with no socket and no HTTP round trip.
+  * A single waitress server listens on the five usual ports. PortDispatcher
+    hands each request to the app that owns the port it arrived on, so browsers,
+    scripts and load tests see the same URLs and API as with serve.py.
+
+This suits CI, load tests and small deployments. There is one database and one
+threaded enrollment facade: sharding and the async facade need serve.py.
+Prometheus metrics from all five services share one registry, so each /metrics
+lists every service (the series are labelled by service).
+
+Run it with `python serve.py --embedded`. Tests can call load() and drive the
+apps with Flask's test client without opening any port.
+"""
+import importlib
+import os
+import signal
+import sys
+from collections import OrderedDict
+
+from werkzeug.exceptions import NotFound
+
+import transport
+
+# Each service is imported after the services it calls, so its clients find them mounted
+IMPORT_ORDER = ("database_service", "notification_service", "user_service", "course_service", "enrollment_service")
+# Environment variables through which the services find each other (as in serve.py)
+URL_VARIABLES = {
+    "database_service": "NEXUS_DB_URL",
+    "user_service": "NEXUS_USER_URL",
+    "course_service": "NEXUS_COURSE_URL",
+    "notification_service": "NEXUS_NOTIFY_URL",
+}
+
+
+class PortDispatcher:
+    """WSGI app that passes each request to the app serving the port it arrived on."""
+
+    def __init__(self, apps_by_port):
+        self.apps_by_port = apps_by_port
+
+    def __call__(self, environ, start_response):
+        app = self.apps_by_port.get(int(environ.get('SERVER_PORT') or 0), NotFound())
+        return app(environ, start_response)
+
+
+def load(urls):
+    """
+    Imports every service with the others reachable in process; returns {service: module}.
+    `urls` maps each service that others call to the URL they know it by.
+    """
+    if ',' in urls["database_service"]:
+        raise ValueError("Embedded mode runs a single database; NEXUS_DB_URL must be one URL.")
+    # Set before the first import: the services read them when they create their clients
+    for service, variable in URL_VARIABLES.items():
+        os.environ[variable] = urls[service]
+    modules = OrderedDict()
+    for service in IMPORT_ORDER:
+        modules[service] = importlib.import_module(service)
+        if service in urls:  # no service calls the enrollment facade
+            transport.mount(urls[service], modules[service].app)
+    return modules
+
+
+def serve(host, public_host, ports, threads):
+    """Serves every service from this process on its port until terminated."""
+    from waitress import serve as waitress_serve
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    urls = {service: os.environ.get(variable) or f"http://{public_host}:{ports[service]}"
+            for service, variable in URL_VARIABLES.items()}
+    modules = load(urls)
+    database = modules["database_service"]
+    if database.DATA_DIR:
+        database.init_persistence(database.DATA_DIR)
+    print("All services ready (embedded, one process):")
+    for service in IMPORT_ORDER:
+        print(f"  {service:<22} http://{public_host}:{ports[service]}")
+    print(f"Open http://{public_host}:{ports['enrollment_service']} in your browser. Press Ctrl+C to stop.")
+    try:
+        waitress_serve(PortDispatcher({ports[service]: modules[service].app for service in IMPORT_ORDER}),
+                       listen=" ".join(f"{host}:{ports[service]}" for service in IMPORT_ORDER),
+                       threads=threads, ident="nexus_enroll")
+    finally:
+        if database.store is not None:
+            database.store.close()
@@ -1,138 +1,741 @@
 # enrollment_service.py
-from flask import Flask, jsonify, request, render_template
+import functools
+import json
+import math
+import os
+import threading
+import time
+from flask import Flask, jsonify, request, render_template, Response, stream_with_context
 import requests
 from flask_cors import CORS
+from service_client import ServiceClient
+from sharding import ShardedDatabase
+from notification_dispatcher import NotificationDispatcher
+from bulk_import import BulkReport, BulkRowError, chunked, iter_rows
+from change_feed import ChangeFeedRelay
+from entity_cache import EntityCache
+from instrumentation import instrument
+from health import add_health_endpoints, downstream_check
+from admission import AdmissionController, AdmissionRejected
+from idempotency import HEADER as IDEMPOTENCY_HEADER, REPLAYED_HEADER, IdempotencyError, IdempotencyStore, fingerprint
+import wire
 
 app = Flask(__name__)
 CORS(app)
+instrument(app, "enrollment_service", quiet_routes=("/events",))
 
-# URLs of the other microservices
-DB_URL = "http://127.0.0.1:5000"
-NOTIFY_URL = "http://127.0.0.1:5003"
+# URLs of the other microservices (NEXUS_DB_URL may list several database shards)
+NOTIFY_URL = os.environ.get("NEXUS_NOTIFY_URL", "http://127.0.0.1:5003")
+# Browser-facing URLs of the user and course services, used by the UI page
+USER_URL = os.environ.get("NEXUS_USER_URL", "http://127.0.0.1:5001")
+COURSE_URL = os.environ.get("NEXUS_COURSE_URL", "http://127.0.0.1:5002")
+
+# Pooled keep-alive clients (with timeouts, retries and circuit breakers) for each downstream;
+# course-scoped database calls go to the shard that owns the course
+db_shards = ShardedDatabase.from_env()
+notify_client = ServiceClient(NOTIFY_URL, name="notification_service")
+
+# Notifications are queued, so only the database (every shard of it) is needed to serve requests
+add_health_endpoints(app, **{client.name: downstream_check(client) for client in db_shards.clients})
+
+# Notifications are queued and delivered in batches by a background worker,
+# keeping the notification hop off the drop request path.
+notifications = NotificationDispatcher(notify_client)
+
+# User and course records, validated against the database's entity version on every read
+entity_cache = EntityCache()
+
+# Rate limits and a concurrency gate in front of the database for /enroll, /enroll/batch and /drop
+admission = AdmissionController.from_env()
+
+# Responses of /enroll and /drop by Idempotency-Key, so client retries run once
+idempotency = IdempotencyStore.from_env()
+
+@app.errorhandler(AdmissionRejected)
+def _admission_rejected(e):
+    response = jsonify({"error": e.reason})
+    response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+    return response, e.status
+
+@app.errorhandler(IdempotencyError)
+def _idempotency_error(e):
+    response = jsonify({"error": e.reason})
+    if e.retry_after:
+        response.headers['Retry-After'] = str(e.retry_after)
+    return response, e.status
+
+def _idempotent(view):
+    """
+    Runs an endpoint once per Idempotency-Key: repeats get the stored response and
+    concurrent duplicates wait for the first. Requests without the header run as usual.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None or not idempotency.enabled:
+            return view(*args, **kwargs)
+        body_fingerprint = fingerprint(request.get_json(silent=True))
+        while True:
+            entry, owner = idempotency.claim(request.path, key, body_fingerprint)
+            if owner:
+                break
+            result = idempotency.wait_for(entry)
+            if result is not None:
+                status, body, mimetype = result
+                return Response(body, status=status, mimetype=mimetype, headers={REPLAYED_HEADER: "true"})
+            # The first request failed without an answer; run this one instead
+
+        try:
+            response = app.make_response(view(*args, **kwargs))
+        except BaseException:
+            idempotency.release(request.path, key, entry)
+            raise
+        idempotency.finish(request.path, key, entry, (response.status_code, response.get_data(), response.mimetype))
+        return response
+    return wrapper
+
+def _admitted(view):
+    """Rate-limits an endpoint by the body's student_id and holds a database slot while it runs."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        admission.check_rate((request.get_json(silent=True) or {}).get('student_id'))
+        with admission.database_slot():
+            return view(*args, **kwargs)
+    return wrapper
+
+def _read_context(client, path, params, keys, extract):
+    """
+    Reads an enrollment context from one database shard, leaving out the user/course
+    records when the cache holds them all. `extract(context)` maps each key in `keys`
+    to its record in a full response. Returns (context, records by key).
+    """
+    source = client.name if db_shards.sharded else None  # each shard stamps its own entity version
+    cached = entity_cache.get_many(keys)
+    if len(cached) == len(keys):
+        context_res = client.get(path, params=dict(params, entities="0"))
+        context_res.raise_for_status()
+        context = wire.decode(context_res)
+        if entity_cache.check_version(context['entity_version'], source):
+            return context, cached
+        # Users or courses were written since these records were cached; read them again
+
+    context_res = client.get(path, params=params)
+    context_res.raise_for_status()
+    context = wire.decode(context_res)
+    records = extract(context)
+    entity_cache.check_version(context['entity_version'], source)
+    entity_cache.put_many(records, context['entity_version'], source)
+    return context, records
+
+def _enrolled_elsewhere(student_id, courses, client):
+    """
+    In sharded mode, the student's courses on shards other than `client`: the
+    schedule check needs the whole timetable. Skipped when no course has meetings.
+    """
+    if not db_shards.sharded or not any(course.get('schedule') for course in courses):
+        return []
+    return db_shards.student_enrollments(student_id, exclude=(client,))
+
+# One long-poll to the database's change feed (per shard), fanned out to every /events subscriber
+change_relay = ChangeFeedRelay(db_shards.clients)
+
+# An open /events stream holds a server thread for as long as the browser tab stays open,
+# so only this many run at once and the rest of the pool stays free for /enroll and /drop.
+# Further subscribers get 503 and try again after EVENT_STREAM_RETRY_MS.
+MAX_EVENT_STREAMS = int(os.environ.get("NEXUS_MAX_EVENT_STREAMS", "4"))
+EVENT_STREAM_RETRY_MS = 30000
+# The server only notices a closed tab when writing to it fails, a few writes later;
+# frequent keep-alives hand its slot back within seconds
+EVENT_STREAM_KEEPALIVE = 5.0
+_event_streams = threading.BoundedSemaphore(MAX_EVENT_STREAMS)
+
+def _promotion_message(event):
+    if event['type'] == "seat_held":
+        until = time.strftime("%H:%M", time.localtime(event['hold_expires_at']))
+        return f"A seat in {event['course_name']} is being held for you until {until}. Enroll before then to claim it."
+    return f"Good news! A seat opened up in {event['course_name']} and you have been enrolled from the waitlist."
+
+def _removal_message(event):
+    if event['reason'] == "schedule_conflict":
+        why = f"it meets at the same time as {event['conflicts_with']}, which you are enrolled in"
+    else:
+        why = f"you are missing the prerequisite(s) {', '.join(event.get('missing', []))}"
+    return f"A seat opened up in {event['course_name']}, but you were removed from its waitlist: {why}."
+
+# Change-feed events after which a course marked full may have a free seat again
+_SEAT_FREEING_EVENTS = {"drop", "hold_released"}
+_BULK_CHANGE_EVENTS = {"enrollments_replaced", "courses_updated", "cleared"}
+
+def _notify_promotions():
+    """
+    Turns waitlist promotions on the change feed into notifications. This covers
+    promotions made by drops and holds passed on after another student's hold expired,
+    and students passed over because they can no longer take the course.
+    Also clears admission control's "full" mark on courses where a seat has freed up.
+    """
+    version = change_relay.feed.version
+    while True:
+        events, current, reset = change_relay.feed.since(version, wait=15.0)
+        if reset:
+            version = current
+            continue
+        for event in events:
+            if event['type'] in _SEAT_FREEING_EVENTS:
+                admission.forget(event['course_id'])
+            elif event['type'] in _BULK_CHANGE_EVENTS:
+                admission.forget()
+            if event['type'] in ("promoted", "seat_held") or event.get('reason'):
+                message = _removal_message(event) if event.get('reason') else _promotion_message(event)
+                payload = {"user_id": event['student_id'], "user_name": event['student_name'],
+                           "course_id": event['course_id'], "message": message,
+                           "request_id": event.get('request_id')}
+                if not notifications.enqueue(payload):
+                    print(f"Notification queue full; dropped notification for {event['student_id']}.")
+        if events:
+            version = events[-1]['version']
+
+_promotion_notifier = None
+_promotion_notifier_lock = threading.Lock()
+
+@app.before_request
+def _start_promotion_notifier():
+    # Started with the first request so importing the module (e.g. by the reloader parent) spawns nothing
+    global _promotion_notifier
+    if _promotion_notifier is None:
+        with _promotion_notifier_lock:
+            if _promotion_notifier is None:
+                change_relay.start()
+                _promotion_notifier = threading.Thread(target=_notify_promotions, name="promotion-notifier", daemon=True)
+                _promotion_notifier.start()
 
 # --- UI Endpoint ---
 @app.route('/')
 def index():
     """Serves the main HTML page."""
-    return render_template('index.html')
+    return render_template('index.html', user_url=USER_URL, course_url=COURSE_URL)
+
+# Outcomes where the database service refused the enrollment outright (no seat, no waitlist)
+REFUSED_STATUSES = {"missing_prerequisites", "schedule_conflict"}
+
+def _enroll_message(status, student, course, details=None):
+    """User-facing message for an enroll outcome reported by the database service."""
+    if status == "missing_prerequisites":
+        return (f"{student['name']} cannot enroll in {course['name']}: missing prerequisite(s) "
+                f"{', '.join(details['missing'])}.")
+    if status == "schedule_conflict":
+        return (f"{student['name']} cannot enroll in {course['name']}: it meets at the same time as "
+                f"{details['conflicts_with']}.")
+    if status == "enrolled":
+        return f"Successfully enrolled {student['name']} in {course['name']}."
+    if status == "waitlisted":
+        return f"Course is full. Successfully added {student['name']} to the waitlist for {course['name']}."
+    if status == "already_enrolled":
+        return f"{student['name']} is already enrolled in {course['name']}."
+    return f"{student['name']} is already on the waitlist for {course['name']}."
 
 # --- Facade API Endpoints ---
 @app.route('/enroll', methods=['POST'])
+@_idempotent
+@_admitted
 def enroll_student():
     """Facade method to handle the complex enrollment process."""
     data = request.json
     student_id = data['student_id']
     course_id = data['course_id']
-    
-    # 1. Get all required data from the database service first
+    student_key, course_key = ("user", student_id), ("course", course_id)
+
+    # 1. A course seen full moments ago can only end in a waitlist decision, and the atomic
+    # write makes that decision itself: skip the read when the records are cached too.
+    if admission.known_full(course_id):
+        cached = entity_cache.get_many([student_key, course_key])
+        if len(cached) == 2:
+            admission.record_shortcut()
+            return _claim_seat(student_id, course_id, cached[student_key], cached[course_key])
+
+    # 2. Get only the records this enrollment needs: student and course usually come from the cache
     try:
-        db_data_res = requests.get(f"{DB_URL}/data")
-        db_data_res.raise_for_status()
-        db_data = db_data_res.json()
-        
-        student = db_data.get('users', {}).get(student_id)
-        course = db_data.get('courses', {}).get(course_id)
-        all_enrollments = db_data.get('enrollments', {})
-        all_waitlists = db_data.get('waitlists', {})
+        context, records = _read_context(
+            db_shards.for_course(course_id), f"/enrollment_context/{student_id}/{course_id}", {},
+            [student_key, course_key],
+            lambda c: {student_key: c.get('student'), course_key: c.get('course')})
+
+        student = records[student_key]
+        course = records[course_key]
+        student_enrollments = context.get('enrollments', [])
+        taken_seats = context.get('enrolled_count', 0) + context.get('held_seats', 0)
+        waitlisted = context.get('waitlisted', False)
 
     except requests.exceptions.RequestException as e:
         return jsonify({"error": f"Could not connect to database service: {e}"}), 503
 
-    # 2. Validate that the student and course exist
+    # 3. Validate that the student and course exist
     if not student or not course:
         return jsonify({"error": f"Student ID '{student_id}' or Course ID '{course_id}' not found. Please add them first."}), 404
+    admission.observe_seats(course_id, taken_seats, course['capacity'])
 
-    # 3. Core Logic: Check for enrollment, capacity, and waitlisting
-    student_enrollments = all_enrollments.get(student_id, [])
+    # 4. Core Logic: Answer repeat requests straight from the snapshot
     if course_id in student_enrollments:
-        return jsonify({"message": f"{student['name']} is already enrolled in {course['name']}."}), 200
-        
-    enrolled_count = sum(1 for elist in all_enrollments.values() if course_id in elist)
-    
-    # --- THIS IS THE CORRECTED LOGIC BLOCK ---
-    if enrolled_count >= course['capacity']:
-        # Course is full, handle waitlisting.
-        course_waitlist = all_waitlists.get(course_id, [])
-        
-        if student_id in course_waitlist:
-            return jsonify({"message": f"{student['name']} is already on the waitlist for {course['name']}."}), 200
-        else:
-            # Add the student to the waitlist and update the DB
-            course_waitlist.append(student_id)
-            try:
-                # Make the API call to update the waitlist in the database
-                requests.post(f"{DB_URL}/waitlist", json={"course_id": course_id, "students": course_waitlist})
-                return jsonify({"message": f"Course is full. Successfully added {student['name']} to the waitlist for {course['name']}."}), 200
-            except requests.exceptions.RequestException as e:
-                return jsonify({"error": f"Failed to update waitlist: {e}"}), 503
-    
-    # 4. Success: If not full, perform enrollment and update the DB
-    student_enrollments.append(course_id)
+        return jsonify({"message": _enroll_message("already_enrolled", student, course)}), 200
+    if taken_seats >= course['capacity'] and waitlisted:
+        return jsonify({"message": _enroll_message("already_waitlisted", student, course)}), 200
+
+    return _claim_seat(student_id, course_id, student, course)
+
+def _claim_seat(student_id, course_id, student, course):
+    """
+    Claims a seat (or a waitlist spot) with one atomic operation in the DB service.
+    The capacity check happens there under the course's lock, so seats are never oversold.
+    """
+    client = db_shards.for_course(course_id)
     try:
-        requests.post(f"{DB_URL}/enrollments", json={"student_id": student_id, "courses": student_enrollments})
-        return jsonify({"message": f"Successfully enrolled {student['name']} in {course['name']}."}), 200
+        payload = {"student_id": student_id, "course_id": course_id}
+        elsewhere = _enrolled_elsewhere(student_id, [course], client)
+        if elsewhere:
+            payload["enrolled_elsewhere"] = elsewhere
+        op_res = client.post("/ops/enroll", json=payload)
+        if op_res.status_code == 404:
+            return jsonify({"error": f"Student ID '{student_id}' or Course ID '{course_id}' not found. Please add them first."}), 404
+        op_res.raise_for_status()
+        result = wire.decode(op_res)
     except requests.exceptions.RequestException as e:
         return jsonify({"error": f"Failed to update enrollments: {e}"}), 503
+
+    status = result['status']
+    # Waitlisting only happens when the course is full
+    taken = result['capacity'] if status in ("waitlisted", "already_waitlisted") else result['enrolled_count']
+    admission.observe_seats(course_id, taken, result['capacity'])
+    if status in REFUSED_STATUSES:
+        return jsonify({"error": _enroll_message(status, student, course, result), "status": status}), 409
+    return jsonify({"message": _enroll_message(status, student, course)}), 200
+
+@app.route('/enroll/batch', methods=['POST'])
+@_admitted
+def enroll_cart():
+    """
+    Facade method for a whole registration cart: {"student_id": ..., "course_ids": [...]}.
+    One read resolves every course and one atomic write applies all decisions,
+    so a cart costs two database round trips instead of two per course.
+    With a sharded database that is one read per shard involved, sent in parallel,
+    and one atomic write per run of consecutive courses on the same shard.
+    """
+    data = request.json
+    student_id = data['student_id']
+    course_ids = list(dict.fromkeys(data['course_ids']))  # de-duplicate, keep order
+
+    # 1. Resolve the student and every course in the cart with a single read (records from the cache)
+    by_shard = {}
+    for course_id in course_ids:
+        by_shard.setdefault(db_shards.for_course(course_id), []).append(course_id)
+
+    def read(client, shard_courses):
+        keys = [("user", student_id)] + [("course", course_id) for course_id in shard_courses]
+        return _read_context(
+            client, f"/enrollment_context/{student_id}", {"course_ids": ",".join(shard_courses)}, keys,
+            lambda c: {("user", student_id): c.get('student'),
+                       **{("course", cid): c['courses'][cid].get('course') for cid in shard_courses}})
+
+    try:
+        shard_reads = db_shards.parallel([functools.partial(read, client, shard_courses)
+                                          for client, shard_courses in by_shard.items()] or
+                                         [functools.partial(read, db_shards.primary, [])])
+    except requests.exceptions.RequestException as e:
+        return jsonify({"error": f"Could not connect to database service: {e}"}), 503
+    context, records = {"enrollments": [], "courses": {}}, {}
+    for shard_context, shard_records in shard_reads:
+        context["enrollments"].extend(shard_context['enrollments'])
+        context["courses"].update(shard_context['courses'])
+        records.update(shard_records)
+
+    student = records[("user", student_id)]
+    if not student:
+        return jsonify({"error": f"Student ID '{student_id}' not found. Please add them first."}), 404
+
+    # 2. Answer missing courses and repeat requests from the snapshot; the rest need a write
+    results, to_write = {}, []
+    for course_id in course_ids:
+        course_context = context['courses'][course_id]
+        course = records[("course", course_id)]
+        if not course:
+            results[course_id] = ("not_found", f"Course ID '{course_id}' not found.")
+            continue
+        taken_seats = course_context['enrolled_count'] + course_context['held_seats']
+        admission.observe_seats(course_id, taken_seats, course['capacity'])
+        if course_id in context['enrollments']:
+            results[course_id] = ("already_enrolled", _enroll_message("already_enrolled", student, course))
+        elif taken_seats >= course['capacity'] and course_context['waitlisted']:
+            results[course_id] = ("already_waitlisted", _enroll_message("already_waitlisted", student, course))
+        else:
+            to_write.append(course_id)
+
+    # 3. Apply every remaining enroll/waitlist decision in one atomic write (per shard run, in cart order)
+    if to_write:
+        statuses, details = {}, {}
+        try:
+            elsewhere = []
+            if db_shards.sharded and any(records[("course", course_id)].get('schedule') for course_id in to_write):
+                # The whole timetable: what the cart read, the shards it did not read, then what each run adds
+                elsewhere = context["enrollments"] + db_shards.student_enrollments(student_id, exclude=tuple(by_shard))
+            for client, run in db_shards.group_runs(to_write):
+                payload = {"student_id": student_id, "course_ids": run}
+                if elsewhere:
+                    payload["enrolled_elsewhere"] = elsewhere
+                op_res = client.post("/ops/enroll/cart", json=payload)
+                op_res.raise_for_status()
+                op_result = wire.decode(op_res)
+                statuses.update(op_result['results'])
+                details.update(op_result.get('details', {}))
+                elsewhere = elsewhere + [course_id for course_id in run if statuses[course_id] == "enrolled"]
+        except requests.exceptions.RequestException as e:
+            return jsonify({"error": f"Failed to update enrollments: {e}"}), 503
+        for course_id in to_write:
+            course = records[("course", course_id)]
+            if statuses[course_id] == "not_found":
+                results[course_id] = ("not_found", f"Course ID '{course_id}' not found.")
+            else:
+                results[course_id] = (statuses[course_id], _enroll_message(statuses[course_id], student, course,
+                                                                           details.get(course_id)))
+
+    return jsonify({
+        "student_id": student_id,
+        "results": [
+            {"course_id": course_id, "status": results[course_id][0], "message": results[course_id][1]}
+            for course_id in course_ids
+        ]
+    }), 200
     
+def _drop_message(drop_result):
+    """Describes what a drop did to the course's waitlist."""
+    entries = drop_result.get('promoted', [])
+    promoted = [entry for entry in entries if entry['status'] != "skipped"]
+    skipped = [entry['student']['name'] for entry in entries if entry['status'] == "skipped"]
+    if promoted:
+        name = promoted[0]['student']['name']
+        if promoted[0]['status'] == "held":
+            until = time.strftime("%H:%M", time.localtime(promoted[0]['hold_expires_at']))
+            message = f"Student unenrolled. The seat is held for {name} until {until}; they have been notified."
+        else:
+            message = f"Student unenrolled. {name} was enrolled from the waitlist and has been notified."
+    elif drop_result.get('waitlist_length', len(entries)):
+        message = "Student unenrolled successfully. No one on the waitlist could take the seat."
+    else:
+        message = "Student unenrolled successfully. The course waitlist was empty."
+    if skipped:
+        message += (f" Removed from the waitlist because they can no longer take the course: {', '.join(skipped)};"
+                    " they have been notified.")
+    return message
+
 @app.route('/drop', methods=['POST'])
+@_idempotent
+@_admitted
 def drop_course():
-    """Facade method to handle dropping a course and notifying waitlisters."""
+    """Facade method to handle dropping a course; the freed seat goes to the head of the waitlist."""
     data = request.json
     student_id, course_id = data['student_id'], data['course_id']
 
-    # 1. Get all current data from the database
+    # 1. Drop the course atomically; the DB service validates the enrollment under the course's lock
     try:
-        db_data_res = requests.get(f"{DB_URL}/data")
-        db_data_res.raise_for_status()
-        db_data = db_data_res.json()
-        
-        all_enrollments = db_data.get('enrollments', {})
-        student_enrollments = all_enrollments.get(student_id, [])
+        drop_res = db_shards.for_course(course_id).post("/ops/drop", json={"student_id": student_id, "course_id": course_id})
+        if drop_res.status_code == 400:
+            return jsonify({"error": f"Student '{student_id}' is not enrolled in this course."}), 400
+        drop_res.raise_for_status()
+        drop_result = wire.decode(drop_res)
     except requests.exceptions.RequestException as e:
         return jsonify({"error": f"Could not connect to database service: {e}"}), 503
+    admission.forget(course_id)
 
-    # 2. Validate that the student is actually enrolled
-    if course_id not in student_enrollments:
-        return jsonify({"error": f"Student '{student_id}' is not enrolled in this course."}), 400
-
-    # 3. Perform the drop action
-    student_enrollments.remove(course_id)
-    requests.post(f"{DB_URL}/enrollments", json={"student_id": student_id, "courses": student_enrollments})
-
-    # 4. OBSERVER PATTERN TRIGGER: Check waitlist and notify
-    all_waitlists = db_data.get('waitlists', {})
-    if course_id in all_waitlists and all_waitlists[course_id]:
-        student_to_notify_id = all_waitlists[course_id][0]
-        student_to_notify = db_data.get('users', {}).get(student_to_notify_id)
-        course = db_data.get('courses', {}).get(course_id)
-        
-        if student_to_notify and course:
-            notification_payload = {
-                "user_id": student_to_notify['user_id'],
-                "user_name": student_to_notify['name'],
-                "message": f"A spot has opened up in {course['name']}! Please try to enroll."
-            }
-            requests.post(f"{NOTIFY_URL}/notify", json=notification_payload)
-            
-            return jsonify({"status": "Success", "message": f"Student unenrolled. {student_to_notify['name']} has been notified from the waitlist."})
-
-    # --- THIS MESSAGE HAS BEEN CORRECTED ---
-    return jsonify({"status": "Success", "message": "Student unenrolled successfully. The course waitlist was empty."})
+    # 2. The DB service already moved the head of the waitlist into the freed seat (or
+    # reserved it for them), passing over students who can no longer take the course;
+    # the promotion notifier tells them via the change feed.
+    return jsonify({"status": "Success", "message": _drop_message(drop_result)})
+
+# --- Schedule and Roster Queries ---
+def _entity_records(keys, reported):
+    """
+    The user/course records for `keys` (None for unknown IDs). `reported` lists the
+    (client, entity version) pairs just read from the database: cached records are
+    used while those versions hold, and misses are read from the first client in a
+    single batched /entities call.
+    """
+    for client, version in reported:
+        entity_cache.check_version(version, client.name if db_shards.sharded else None)
+    records = entity_cache.get_many(keys)
+    missing = [key for key in keys if key not in records]
+    if missing:
+        client = reported[0][0]
+        found_res = client.get("/entities", params={
+            "users": ",".join(entity_id for kind, entity_id in missing if kind == "user"),
+            "courses": ",".join(entity_id for kind, entity_id in missing if kind == "course")})
+        found_res.raise_for_status()
+        found = wire.decode(found_res)
+        fetched = {("user", user_id): record for user_id, record in found['users'].items()}
+        fetched.update({("course", course_id): record for course_id, record in found['courses'].items()})
+        source = client.name if db_shards.sharded else None
+        entity_cache.check_version(found['entity_version'], source)
+        entity_cache.put_many(fetched, found['entity_version'], source)
+        records.update(fetched)
+    return records
+
+def _schedule_body(student, course_ids, records):
+    courses = []
+    for course_id in course_ids:
+        course = records.get(("course", course_id))
+        if course is not None:
+            courses.append({"course_id": course_id, "name": course['name'], "schedule": course.get('schedule', [])})
+    return {"student_id": student['user_id'], "name": student['name'], "courses": courses}
+
+def _roster_body(roster, course, records):
+    students = []
+    for student_id in roster['student_ids']:
+        student = records.get(("user", student_id)) or {}
+        students.append({"user_id": student_id, "name": student.get('name')})
+    return {"course_id": roster['course_id'], "name": course['name'], "capacity": course['capacity'],
+            "enrolled_count": roster['enrolled_count'], "held_seats": roster['held_seats'],
+            "waitlist_length": roster['waitlist_length'], "students": students,
+            "next_cursor": roster['next_cursor']}
+
+@app.route('/students/<student_id>/schedule', methods=['GET'])
+def get_student_schedule(student_id):
+    """A student's enrolled courses with their names and meeting times."""
+    try:
+        # 1. The enrolled course IDs from the student's enrollment index (on every shard when sharded)
+        responses = db_shards.scatter("GET", f"/schedules/{student_id}")
+        course_ids, reported = [], []
+        for client, response in zip(db_shards.clients, responses):
+            response.raise_for_status()
+            schedule = wire.decode(response)
+            course_ids.extend(schedule['courses'])
+            reported.append((client, schedule['entity_version']))
+
+        # 2. The student and course records, usually all from the cache
+        records = _entity_records([("user", student_id)] + [("course", c) for c in course_ids], reported)
+    except requests.exceptions.RequestException as e:
+        return jsonify({"error": f"Could not connect to database service: {e}"}), 503
+
+    student = records.get(("user", student_id))
+    if not student:
+        return jsonify({"error": f"Student ID '{student_id}' not found."}), 404
+    return jsonify(_schedule_body(student, course_ids, records))
+
+@app.route('/courses/<course_id>/roster', methods=['GET'])
+def get_course_roster(course_id):
+    """One page of a course's enrolled students (?limit=100&cursor=<next_cursor of the previous page>)."""
+    client = db_shards.for_course(course_id)
+    try:
+        # 1. One page of student IDs from the course's roster index on the shard that owns it
+        roster_res = client.get(f"/rosters/{course_id}", params=request.args.to_dict())
+        if roster_res.status_code == 400:
+            return jsonify(wire.decode(roster_res)), 400
+        roster_res.raise_for_status()
+        roster = wire.decode(roster_res)
+
+        # 2. The course and student records in one batch, usually all from the cache
+        keys = [("course", course_id)] + [("user", s) for s in roster['student_ids']]
+        records = _entity_records(keys, [(client, roster['entity_version'])])
+    except requests.exceptions.RequestException as e:
+        return jsonify({"error": f"Could not connect to database service: {e}"}), 503
+
+    course = records.get(("course", course_id))
+    if not course:
+        return jsonify({"error": f"Course ID '{course_id}' not found."}), 404
+    return jsonify(_roster_body(roster, course, records))
+
+def _validated_enrollments(rows, report):
+    for row, data in rows:
+        report.received += 1
+        if isinstance(data, BulkRowError):
+            report.error(row, str(data))
+        elif not isinstance(data, dict) or not data.get('student_id') or not data.get('course_id'):
+            report.error(row, "Both student_id and course_id are required.")
+        else:
+            yield row, {"student_id": data['student_id'], "course_id": data['course_id']}
+
+def _bulk_enroll(items, waitlist_if_full):
+    """Sends a chunk of enrollments to the shards owning their courses (in parallel); returns one status per item."""
+    by_shard = {}
+    for index, item in enumerate(items):
+        by_shard.setdefault(db_shards.for_course(item['course_id']), []).append(index)
+
+    def send(client, indices):
+        response = client.post("/ops/enroll/bulk", json={
+            "enrollments": [items[index] for index in indices], "waitlist_if_full": waitlist_if_full
+        })
+        response.raise_for_status()
+        return wire.decode(response)['results']
+
+    results = [None] * len(items)
+    shard_results = db_shards.parallel([functools.partial(send, client, indices) for client, indices in by_shard.items()])
+    for indices, statuses in zip(by_shard.values(), shard_results):
+        for index, status in zip(indices, statuses):
+            results[index] = status
+    return results
+
+@app.route('/enrollments/bulk', methods=['POST'])
+def bulk_import_enrollments():
+    """
+    Bulk enrollment import (JSON array, NDJSON or CSV with columns student_id, course_id).
+    Capacity is still enforced; pass ?waitlist=true to waitlist rows for full courses.
+    """
+    waitlist_if_full = request.args.get('waitlist', 'false').lower() == 'true'
+    report = BulkReport()
+    try:
+        for chunk in chunked(_validated_enrollments(iter_rows(request), report)):
+            statuses = _bulk_enroll([item for _, item in chunk], waitlist_if_full)
+            for (row, _), status in zip(chunk, statuses):
+                if status in ("enrolled", "already_enrolled", "waitlisted", "already_waitlisted"):
+                    report.imported += 1
+                else:
+                    report.error(row, status)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except requests.exceptions.RequestException as e:
+        return jsonify({"error": f"Could not connect to database service: {e}", "report": report.to_dict()}), 503
+    return jsonify(report.to_dict()), 200
+
+@app.route('/notifications/metrics', methods=['GET'])
+def get_notification_metrics():
+    """Queue depth, delivery counters and delivery latency of the notification pipeline."""
+    return jsonify(notifications.metrics())
+
+@app.route('/cache/metrics', methods=['GET'])
+def get_cache_metrics():
+    """Hit/miss counters and size of the user/course cache."""
+    return jsonify(entity_cache.metrics())
+
+@app.route('/admission/metrics', methods=['GET'])
+def get_admission_metrics():
+    """Admitted and rejected request counters, database slots in use and known-full courses."""
+    return jsonify(admission.metrics())
+
+@app.route('/idempotency/metrics', methods=['GET'])
+def get_idempotency_metrics():
+    """Executed, replayed and collapsed keyed requests, and keys held."""
+    return jsonify(idempotency.metrics())
+
+@app.route('/events', methods=['GET'])
+def stream_events():
+    """
+    Server-sent events: incremental enroll/drop/waitlist deltas as they happen.
+    Reconnecting clients resume from the Last-Event-ID header (or ?since=<version>);
+    a "reset" event means they missed too much and should reload /system_data.
+    At most MAX_EVENT_STREAMS run at once; beyond that the answer is 503.
+    """
+    if not _event_streams.acquire(blocking=False):
+        return Response(f"retry: {EVENT_STREAM_RETRY_MS}\n\n", status=503, mimetype='text/event-stream',
+                        headers={"Retry-After": str(EVENT_STREAM_RETRY_MS // 1000)})
+    try:
+        change_relay.start()
+    except BaseException:
+        _event_streams.release()
+        raise
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+
+    def generate(version):
+        if version is None:
+            version = change_relay.feed.version
+        yield "retry: 2000\n\n"
+        while True:
+            events, current, reset = change_relay.feed.since(version, wait=EVENT_STREAM_KEEPALIVE)
+            if reset:
+                yield f"event: reset\ndata: {json.dumps({'version': current})}\n\n"
+                version = current
+            elif not events:
+                yield ": keep-alive\n\n"
+            else:
+                for event in events:
+                    yield f"id: {event['version']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                version = events[-1]['version']
+
+    response = Response(stream_with_context(generate(since)), mimetype='text/event-stream',
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # The server closes the response when the stream ends or the browser goes away
+    response.call_on_close(_event_streams.release)
+    return response
 
 @app.route('/system_data', methods=['GET'])
 def get_system_data():
     """
-    Acts as a proxy to fetch all data from the database service.
+    Acts as a proxy to fetch data from the database service.
     This gives the UI a single endpoint to get a snapshot of the system state.
+    Query parameters (collections, fields, limit, cursor, format) are passed through,
+    and the body is relayed chunk by chunk without being decoded and re-encoded:
+    the caller's Accept and Accept-Encoding choose its format and compression.
     """
+    if db_shards.sharded:
+        return _sharded_system_data()
     try:
-        response = requests.get(f"{DB_URL}/data")
-        response.raise_for_status()  # Will raise an exception for 4xx/5xx errors
-        return jsonify(response.json())
+        response = db_shards.primary.get("/data", params=request.args.to_dict(), headers=wire.relay_headers(),
+                                         stream=True)
+        if response.status_code >= 500:
+            response.close()
+            response.raise_for_status()  # Will raise an exception for 5xx errors
     except requests.exceptions.RequestException as e:
         print(f"Error connecting to database service: {e}")
         return jsonify({"error": "Could not fetch data from the database service."}), 503
 
+    def relay():
+        try:
+            yield from response.raw.stream(64 * 1024, decode_content=False)
+        finally:
+            response.close()
+
+    headers = {name: response.headers[name] for name in ('Content-Encoding', 'Vary') if name in response.headers}
+    return Response(stream_with_context(relay()), status=response.status_code,
+                    content_type=response.headers.get('Content-Type'), headers=headers)
+
+# With a sharded database every shard holds all users and courses, while
+# enrollments and waitlists are split between the shards by course
+PARTITIONED_COLLECTIONS = ("enrollments", "waitlists")
+
+def _sharded_system_data():
+    """
+    /system_data over a sharded database: users and courses are read from one shard,
+    enrollments and waitlists from every shard and merged. NDJSON is relayed shard by
+    shard; paging is not available because cursors are per shard.
+    """
+    if 'limit' in request.args or 'cursor' in request.args:
+        return jsonify({"error": "Paging is not available with a sharded database; leave out limit and cursor."}), 400
+    requested = [c for c in request.args.get('collections', '').split(',') if c] or \
+        ["users", "courses", "enrollments", "waitlists"]
+    partitioned = [c for c in requested if c in PARTITIONED_COLLECTIONS]
+    clients = [db_shards.primary] + (db_shards.clients[1:] if partitioned else [])
+    ndjson = request.args.get('format') == 'ndjson'
+
+    def fetch(index, client):
+        params = dict(request.args.to_dict(), collections=",".join(requested if index == 0 else partitioned))
+        return client.get("/data", params=params, stream=ndjson)
+
+    try:
+        responses = db_shards.parallel([functools.partial(fetch, index, client) for index, client in enumerate(clients)])
+        for response in responses:
+            if response.status_code >= 500:
+                response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"Error connecting to database service: {e}")
+        return jsonify({"error": "Could not fetch data from the database service."}), 503
+    if responses[0].status_code != 200:
+        for response in responses:
+            response.close()
+        return jsonify(wire.decode(responses[0])), responses[0].status_code
+
+    if ndjson:
+        def relay():
+            try:
+                for response in responses:
+                    yield from response.iter_content(chunk_size=64 * 1024)
+            finally:
+                for response in responses:
+                    response.close()
+        return Response(stream_with_context(relay()), content_type=responses[0].headers.get('Content-Type'))
+
+    merged = wire.decode(responses[0])
+    for response in responses[1:]:
+        shard_data = wire.decode(response)
+        for student_id, courses in shard_data.get('enrollments', {}).items():
+            merged['enrollments'].setdefault(student_id, []).extend(courses)
+        merged.get('waitlists', {}).update(shard_data.get('waitlists', {}))
+    return jsonify(merged)
 
 if __name__ == '__main__':
     # Runs on port 5004
@@ -0,0 +1,580 @@
+# enrollment_service_async.py
+"""
+asyncio implementation of the enrollment facade, on Quart with httpx.
+
+It serves the same registration API as enrollment_service.py (/enroll,
+/enroll/batch, /drop, the schedule and roster queries and /system_data, plus the
+metrics and health endpoints) with the same request and response bodies. Each
+request is a task on one event loop rather than a thread, and waiting on the
+database costs no thread, so a single process can hold thousands of in-flight
+registrations.
+
+  * Independent downstream reads run concurrently: the context reads of every
+    shard a cart touches, and in sharded mode the student's timetable from the
+    other shards, fetched while the enrollment context is being read.
+  * Notifications stay fire-and-forget: promotions are queued by the promotion
+    notifier and delivered in batches in the background, never on the request path.
+
+The entity cache, admission controller, idempotency key store, notification
+queue and change-feed relay are the ones enrollment_service.py builds (importing
+it starts no server), so both facades behave the same. The UI page, /events and
+/enrollments/bulk are served by the threaded facade only.
+
+Needs `pip install quart httpx hypercorn` (see the README). Run it with
+`python serve.py --async-facade` or `hypercorn enrollment_service_async:app --bind 127.0.0.1:5004`.
+"""
+import asyncio
+import functools
+import math
+import time
+
+import httpx
+from quart import Quart, Response, jsonify, request
+
+import enrollment_service as facade
+from admission import AdmissionRejected
+from idempotency import HEADER as IDEMPOTENCY_HEADER, REPLAYED_HEADER, IdempotencyError, fingerprint
+from async_client import AsyncShardedDatabase
+from instrumentation import instrument_async
+import wire
+
+app = Quart(__name__)
+instrument_async(app, "enrollment_service")
+
+# Course-scoped database calls go to the shard that owns the course (NEXUS_DB_URL may list several)
+db_shards = AsyncShardedDatabase.from_env()
+
+# Shared with the threaded facade: see the module docstring
+entity_cache = facade.entity_cache
+admission = facade.admission
+notifications = facade.notifications
+idempotency = facade.idempotency
+
+@app.before_serving
+async def _start_background_workers():
+    # The promotion notifier reads the change feed on threads of its own, off the event loop
+    facade._start_promotion_notifier()
+
+@app.after_serving
+async def _close_clients():
+    await db_shards.aclose()
+
+@app.after_request
+async def _allow_cross_origin(response):
+    # Same policy as flask_cors in the threaded facade: any origin may call the API
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    if request.method == 'OPTIONS':
+        response.headers['Access-Control-Allow-Methods'] = response.headers.get('Allow', 'GET, POST, OPTIONS')
+        requested = request.headers.get('Access-Control-Request-Headers')
+        if requested:
+            response.headers['Access-Control-Allow-Headers'] = requested
+    return response
+
+@app.errorhandler(AdmissionRejected)
+async def _admission_rejected(e):
+    response = jsonify({"error": e.reason})
+    response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+    return response, e.status
+
+def _admitted(view):
+    """Rate-limits an endpoint by the body's student_id and holds a database slot while it runs."""
+    @functools.wraps(view)
+    async def wrapper(*args, **kwargs):
+        admission.check_rate((await request.get_json(silent=True) or {}).get('student_id'))
+        async with admission.async_database_slot():
+            return await view(*args, **kwargs)
+    return wrapper
+
+@app.errorhandler(IdempotencyError)
+async def _idempotency_error(e):
+    response = jsonify({"error": e.reason})
+    if e.retry_after:
+        response.headers['Retry-After'] = str(e.retry_after)
+    return response, e.status
+
+def _idempotent(view):
+    """Runs an endpoint once per Idempotency-Key; duplicates wait on the event loop for the first."""
+    @functools.wraps(view)
+    async def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None or not idempotency.enabled:
+            return await view(*args, **kwargs)
+        body_fingerprint = fingerprint(await request.get_json(silent=True))
+        while True:
+            entry, owner = idempotency.claim(request.path, key, body_fingerprint)
+            if owner:
+                break
+            result = await idempotency.wait_for_async(entry)
+            if result is not None:
+                status, body, mimetype = result
+                return Response(body, status=status, mimetype=mimetype, headers={REPLAYED_HEADER: "true"})
+
+        try:
+            response = await app.make_response(await view(*args, **kwargs))
+        except BaseException:
+            idempotency.release(request.path, key, entry)
+            raise
+        idempotency.finish(request.path, key, entry,
+                           (response.status_code, await response.get_data(), response.mimetype))
+        return response
+    return wrapper
+
+# --- Health ---
+@app.route('/healthz', methods=['GET'])
+async def healthz():
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz', methods=['GET'])
+async def readyz():
+    """Ready when every database shard answers its /healthz (checked concurrently)."""
+    async def check(client):
+        try:
+            (await client.get('/healthz', timeout=(0.5, 1.0))).raise_for_status()
+            return "ok"
+        except httpx.HTTPError as e:
+            return f"failing: {e}"
+
+    outcomes = await asyncio.gather(*(check(client) for client in db_shards.clients))
+    results = {client.name: outcome for client, outcome in zip(db_shards.clients, outcomes)}
+    ready = all(outcome == "ok" for outcome in outcomes)
+    return jsonify({"status": "ready" if ready else "not_ready", "checks": results}), 200 if ready else 503
+
+# --- Facade API Endpoints ---
+async def _read_context(client, path, params, keys, extract, cached=None):
+    """
+    Reads an enrollment context from one database shard, leaving out the user/course
+    records when the cache holds them all. `extract(context)` maps each key in `keys`
+    to its record in a full response. Returns (context, records by key).
+    """
+    source = client.name if db_shards.sharded else None  # each shard stamps its own entity version
+    if cached is None:
+        cached = entity_cache.get_many(keys)
+    if len(cached) == len(keys):
+        context_res = await client.get(path, params=dict(params, entities="0"))
+        context_res.raise_for_status()
+        context = wire.decode(context_res)
+        if entity_cache.check_version(context['entity_version'], source):
+            return context, cached
+        # Users or courses were written since these records were cached; read them again
+
+    context_res = await client.get(path, params=params)
+    context_res.raise_for_status()
+    context = wire.decode(context_res)
+    records = extract(context)
+    entity_cache.check_version(context['entity_version'], source)
+    entity_cache.put_many(records, context['entity_version'], source)
+    return context, records
+
+async def _enrolled_elsewhere(student_id, courses, client):
+    """
+    In sharded mode, the student's courses on shards other than `client`: the
+    schedule check needs the whole timetable. Skipped when no course has meetings.
+    """
+    if not db_shards.sharded or not any(course.get('schedule') for course in courses):
+        return []
+    return await db_shards.student_enrollments(student_id, exclude=(client,))
+
+async def _discard(task):
+    """Cancels a prefetch the request turned out not to need, and waits for it to end."""
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+@app.route('/enroll', methods=['POST'])
+@_idempotent
+@_admitted
+async def enroll_student():
+    """Facade method to handle the complex enrollment process."""
+    data = await request.get_json()
+    student_id = data['student_id']
+    course_id = data['course_id']
+    student_key, course_key = ("user", student_id), ("course", course_id)
+    client = db_shards.for_course(course_id)
+    cached = entity_cache.get_many([student_key, course_key])
+
+    # 1. A course seen full moments ago can only end in a waitlist decision, and the atomic
+    # write makes that decision itself: skip the read when the records are cached too.
+    if admission.known_full(course_id) and len(cached) == 2:
+        admission.record_shortcut()
+        return await _claim_seat(student_id, course_id, cached[student_key], cached[course_key])
+
+    # 2. Read the enrollment context; when the cached course has meetings, the student's
+    # timetable on the other shards is fetched at the same time, since the write needs it.
+    elsewhere = None
+    if db_shards.sharded and cached.get(course_key, {}).get('schedule'):
+        elsewhere = asyncio.create_task(db_shards.student_enrollments(student_id, exclude=(client,)))
+    try:
+        context, records = await _read_context(
+            client, f"/enrollment_context/{student_id}/{course_id}", {}, [student_key, course_key],
+            lambda c: {student_key: c.get('student'), course_key: c.get('course')}, cached=cached)
+
+        student = records[student_key]
+        course = records[course_key]
+        student_enrollments = context.get('enrollments', [])
+        taken_seats = context.get('enrolled_count', 0) + context.get('held_seats', 0)
+        waitlisted = context.get('waitlisted', False)
+
+    except httpx.HTTPError as e:
+        await _discard(elsewhere)
+        return jsonify({"error": f"Could not connect to database service: {e}"}), 503
+
+    # 3. Validate that the student and course exist
+    if not student or not course:
+        await _discard(elsewhere)
+        return jsonify({"error": f"Student ID '{student_id}' or Course ID '{course_id}' not found. Please add them first."}), 404
+    admission.observe_seats(course_id, taken_seats, course['capacity'])
+
+    # 4. Core Logic: Answer repeat requests straight from the snapshot
+    if course_id in student_enrollments:
+        await _discard(elsewhere)
+        return jsonify({"message": facade._enroll_message("already_enrolled", student, course)}), 200
+    if taken_seats >= course['capacity'] and waitlisted:
+        await _discard(elsewhere)
+        return jsonify({"message": facade._enroll_message("already_waitlisted", student, course)}), 200
+    return await _claim_seat(student_id, course_id, student, course, elsewhere)
+
+async def _claim_seat(student_id, course_id, student, course, elsewhere=None):
+    """
+    Claims a seat (or a waitlist spot) with one atomic operation in the DB service.
+    The capacity check happens there under the course's lock, so seats are never oversold.
+    `elsewhere` is an already started fetch of the student's courses on other shards.
+    """
+    client = db_shards.for_course(course_id)
+    try:
+        payload = {"student_id": student_id, "course_id": course_id}
+        if elsewhere is None:
+            elsewhere = await _enrolled_elsewhere(student_id, [course], client)
+        else:
+            elsewhere = await elsewhere
+        if elsewhere:
+            payload["enrolled_elsewhere"] = elsewhere
+        op_res = await client.post("/ops/enroll", json=payload)
+        if op_res.status_code == 404:
+            return jsonify({"error": f"Student ID '{student_id}' or Course ID '{course_id}' not found. Please add them first."}), 404
+        op_res.raise_for_status()
+        result = wire.decode(op_res)
+    except httpx.HTTPError as e:
+        return jsonify({"error": f"Failed to update enrollments: {e}"}), 503
+
+    status = result['status']
+    # Waitlisting only happens when the course is full
+    taken = result['capacity'] if status in ("waitlisted", "already_waitlisted") else result['enrolled_count']
+    admission.observe_seats(course_id, taken, result['capacity'])
+    if status in facade.REFUSED_STATUSES:
+        return jsonify({"error": facade._enroll_message(status, student, course, result), "status": status}), 409
+    return jsonify({"message": facade._enroll_message(status, student, course)}), 200
+
+@app.route('/enroll/batch', methods=['POST'])
+@_admitted
+async def enroll_cart():
+    """
+    Facade method for a whole registration cart: {"student_id": ..., "course_ids": [...]}.
+    The context reads of every shard involved run concurrently, together with the read
+    of the student's timetable on the other shards when a cached course has meetings;
+    then one atomic write per run of consecutive courses on the same shard.
+    """
+    data = await request.get_json()
+    student_id = data['student_id']
+    course_ids = list(dict.fromkeys(data['course_ids']))  # de-duplicate, keep order
+
+    # 1. Resolve the student and every course in the cart, one read per shard (records from the cache)
+    by_shard = {}
+    for course_id in course_ids:
+        by_shard.setdefault(db_shards.for_course(course_id), []).append(course_id)
+
+    def read(client, shard_courses):
+        keys = [("user", student_id)] + [("course", course_id) for course_id in shard_courses]
+        return _read_context(
+            client, f"/enrollment_context/{student_id}", {"course_ids": ",".join(shard_courses)}, keys,
+            lambda c: {("user", student_id): c.get('student'),
+                       **{("course", cid): c['courses'][cid].get('course') for cid in shard_courses}})
+
+    reads = [read(client, shard_courses) for client, shard_courses in by_shard.items()] or \
+        [read(db_shards.primary, [])]
+    cached_courses = entity_cache.get_many([("course", course_id) for course_id in course_ids]).values()
+    prefetch = db_shards.sharded and any(course.get('schedule') for course in cached_courses)
+    others = db_shards.student_enrollments(student_id, exclude=tuple(by_shard)) if prefetch else None
+    try:
+        if others is not None:
+            *shard_reads, others = await db_shards.parallel(reads + [others])
+        else:
+            shard_reads = await db_shards.parallel(reads)
+    except httpx.HTTPError as e:
+        return jsonify({"error": f"Could not connect to database service: {e}"}), 503
+    context, records = {"enrollments": [], "courses": {}}, {}
+    for shard_context, shard_records in shard_reads:
+        context["enrollments"].extend(shard_context['enrollments'])
+        context["courses"].update(shard_context['courses'])
+        records.update(shard_records)
+
+    student = records[("user", student_id)]
+    if not student:
+        return jsonify({"error": f"Student ID '{student_id}' not found. Please add them first."}), 404
+
+    # 2. Answer missing courses and repeat requests from the snapshot; the rest need a write
+    results, to_write = {}, []
+    for course_id in course_ids:
+        course_context = context['courses'][course_id]
+        course = records[("course", course_id)]
+        if not course:
+            results[course_id] = ("not_found", f"Course ID '{course_id}' not found.")
+            continue
+        taken_seats = course_context['enrolled_count'] + course_context['held_seats']
+        admission.observe_seats(course_id, taken_seats, course['capacity'])
+        if course_id in context['enrollments']:
+            results[course_id] = ("already_enrolled", facade._enroll_message("already_enrolled", student, course))
+        elif taken_seats >= course['capacity'] and course_context['waitlisted']:
+            results[course_id] = ("already_waitlisted", facade._enroll_message("already_waitlisted", student, course))
+        else:
+            to_write.append(course_id)
+
+    # 3. Apply every remaining enroll/waitlist decision in one atomic write (per shard run, in cart order)
+    if to_write:
+        statuses, details = {}, {}
+        try:
+            elsewhere = []
+            if db_shards.sharded and any(records[("course", course_id)].get('schedule') for course_id in to_write):
+                # The whole timetable: what the cart read, the shards it did not read, then what each run adds
+                if others is None:
+                    others = await db_shards.student_enrollments(student_id, exclude=tuple(by_shard))
+                elsewhere = context["enrollments"] + others
+            for client, run in db_shards.group_runs(to_write):
+                payload = {"student_id": student_id, "course_ids": run}
+                if elsewhere:
+                    payload["enrolled_elsewhere"] = elsewhere
+                op_res = await client.post("/ops/enroll/cart", json=payload)
+                op_res.raise_for_status()
+                op_result = wire.decode(op_res)
+                statuses.update(op_result['results'])
+                details.update(op_result.get('details', {}))
+                elsewhere = elsewhere + [course_id for course_id in run if statuses[course_id] == "enrolled"]
+        except httpx.HTTPError as e:
+            return jsonify({"error": f"Failed to update enrollments: {e}"}), 503
+        for course_id in to_write:
+            course = records[("course", course_id)]
+            if statuses[course_id] == "not_found":
+                results[course_id] = ("not_found", f"Course ID '{course_id}' not found.")
+            else:
+                results[course_id] = (statuses[course_id], facade._enroll_message(
+                    statuses[course_id], student, course, details.get(course_id)))
+
+    return jsonify({
+        "student_id": student_id,
+        "results": [
+            {"course_id": course_id, "status": results[course_id][0], "message": results[course_id][1]}
+            for course_id in course_ids
+        ]
+    }), 200
+
+def _drop_message(drop_result):
+    """Describes what a drop did to the course's waitlist."""
+    entries = drop_result.get('promoted', [])
+    promoted = [entry for entry in entries if entry['status'] != "skipped"]
+    skipped = [entry['student']['name'] for entry in entries if entry['status'] == "skipped"]
+    if promoted:
+        name = promoted[0]['student']['name']
+        if promoted[0]['status'] == "held":
+            until = time.strftime("%H:%M", time.localtime(promoted[0]['hold_expires_at']))
+            message = f"Student unenrolled. The seat is held for {name} until {until}; they have been notified."
+        else:
+            message = f"Student unenrolled. {name} was enrolled from the waitlist and has been notified."
+    elif drop_result.get('waitlist_length', len(entries)):
+        message = "Student unenrolled successfully. No one on the waitlist could take the seat."
+    else:
+        message = "Student unenrolled successfully. The course waitlist was empty."
+    if skipped:
+        message += (f" Removed from the waitlist because they can no longer take the course: {', '.join(skipped)};"
+                    " they have been notified.")
+    return message
+
+@app.route('/drop', methods=['POST'])
+@_idempotent
+@_admitted
+async def drop_course():
+    """Facade method to handle dropping a course; the freed seat goes to the head of the waitlist."""
+    data = await request.get_json()
+    student_id, course_id = data['student_id'], data['course_id']
+
+    # 1. Drop the course atomically; the DB service validates the enrollment under the course's lock
+    try:
+        drop_res = await db_shards.for_course(course_id).post(
+            "/ops/drop", json={"student_id": student_id, "course_id": course_id})
+        if drop_res.status_code == 400:
+            return jsonify({"error": f"Student '{student_id}' is not enrolled in this course."}), 400
+        drop_res.raise_for_status()
+        drop_result = wire.decode(drop_res)
+    except httpx.HTTPError as e:
+        return jsonify({"error": f"Could not connect to database service: {e}"}), 503
+    admission.forget(course_id)
+
+    # 2. The DB service already moved the head of the waitlist into the freed seat (or
+    # reserved it for them), passing over students who can no longer take the course;
+    # the promotion notifier tells them via the change feed.
+    return jsonify({"status": "Success", "message": _drop_message(drop_result)})
+
+# --- Schedule and Roster Queries ---
+async def _entity_records(keys, reported):
+    """
+    The user/course records for `keys`, from the cache while the (client, entity
+    version) pairs in `reported` hold; misses come from one batched /entities call.
+    """
+    for client, version in reported:
+        entity_cache.check_version(version, client.name if db_shards.sharded else None)
+    records = entity_cache.get_many(keys)
+    missing = [key for key in keys if key not in records]
+    if missing:
+        client = reported[0][0]
+        found_res = await client.get("/entities", params={
+            "users": ",".join(entity_id for kind, entity_id in missing if kind == "user"),
+            "courses": ",".join(entity_id for kind, entity_id in missing if kind == "course")})
+        found_res.raise_for_status()
+        found = wire.decode(found_res)
+        fetched = {("user", user_id): record for user_id, record in found['users'].items()}
+        fetched.update({("course", course_id): record for course_id, record in found['courses'].items()})
+        source = client.name if db_shards.sharded else None
+        entity_cache.check_version(found['entity_version'], source)
+        entity_cache.put_many(fetched, found['entity_version'], source)
+        records.update(fetched)
+    return records
+
+@app.route('/students/<student_id>/schedule', methods=['GET'])
+async def get_student_schedule(student_id):
+    """A student's enrolled courses with their names and meeting times (shards are read concurrently)."""
+    try:
+        responses = await db_shards.scatter("GET", f"/schedules/{student_id}")
+        course_ids, reported = [], []
+        for client, response in zip(db_shards.clients, responses):
+            response.raise_for_status()
+            schedule = wire.decode(response)
+            course_ids.extend(schedule['courses'])
+            reported.append((client, schedule['entity_version']))
+        records = await _entity_records([("user", student_id)] + [("course", c) for c in course_ids], reported)
+    except httpx.HTTPError as e:
+        return jsonify({"error": f"Could not connect to database service: {e}"}), 503
+
+    student = records.get(("user", student_id))
+    if not student:
+        return jsonify({"error": f"Student ID '{student_id}' not found."}), 404
+    return jsonify(facade._schedule_body(student, course_ids, records))
+
+@app.route('/courses/<course_id>/roster', methods=['GET'])
+async def get_course_roster(course_id):
+    """One page of a course's enrolled students (?limit=100&cursor=<next_cursor of the previous page>)."""
+    client = db_shards.for_course(course_id)
+    try:
+        roster_res = await client.get(f"/rosters/{course_id}", params=request.args.to_dict())
+        if roster_res.status_code == 400:
+            return jsonify(wire.decode(roster_res)), 400
+        roster_res.raise_for_status()
+        roster = wire.decode(roster_res)
+        keys = [("course", course_id)] + [("user", s) for s in roster['student_ids']]
+        records = await _entity_records(keys, [(client, roster['entity_version'])])
+    except httpx.HTTPError as e:
+        return jsonify({"error": f"Could not connect to database service: {e}"}), 503
+
+    course = records.get(("course", course_id))
+    if not course:
+        return jsonify({"error": f"Course ID '{course_id}' not found."}), 404
+    return jsonify(facade._roster_body(roster, course, records))
+
+@app.route('/notifications/metrics', methods=['GET'])
+async def get_notification_metrics():
+    """Queue depth, delivery counters and delivery latency of the notification pipeline."""
+    return jsonify(notifications.metrics())
+
+@app.route('/cache/metrics', methods=['GET'])
+async def get_cache_metrics():
+    """Hit/miss counters and size of the user/course cache."""
+    return jsonify(entity_cache.metrics())
+
+@app.route('/admission/metrics', methods=['GET'])
+async def get_admission_metrics():
+    """Admitted and rejected request counters, database slots in use and known-full courses."""
+    return jsonify(admission.metrics())
+
+@app.route('/idempotency/metrics', methods=['GET'])
+async def get_idempotency_metrics():
+    """Executed, replayed and collapsed keyed requests, and keys held."""
+    return jsonify(idempotency.metrics())
+
+async def _relay(responses, raw=False):
+    """Streams the bodies of `responses` one after another (still encoded if `raw`), closing every one of them."""
+    try:
+        for response in responses:
+            chunks = response.aiter_raw(64 * 1024) if raw else response.aiter_bytes(64 * 1024)
+            async for chunk in chunks:
+                yield chunk
+    finally:
+        for response in responses:
+            await response.aclose()
+
+@app.route('/system_data', methods=['GET'])
+async def get_system_data():
+    """
+    Acts as a proxy to fetch data from the database service.
+    This gives the UI a single endpoint to get a snapshot of the system state.
+    Query parameters (collections, fields, limit, cursor, format) are passed through,
+    and the body is relayed chunk by chunk without being decoded and re-encoded:
+    the caller's Accept and Accept-Encoding choose its format and compression.
+    """
+    if db_shards.sharded:
+        return await _sharded_system_data()
+    try:
+        response = await db_shards.primary.get("/data", params=request.args.to_dict(), stream=True,
+                                               headers=wire.relay_headers(request))
+        if response.status_code >= 500:
+            await response.aclose()
+            response.raise_for_status()  # Will raise an exception for 5xx errors
+    except httpx.HTTPError as e:
+        print(f"Error connecting to database service: {e}")
+        return jsonify({"error": "Could not fetch data from the database service."}), 503
+    headers = {name: response.headers[name] for name in ('Content-Encoding', 'Vary') if name in response.headers}
+    return Response(_relay([response], raw=True), status=response.status_code,
+                    content_type=response.headers.get('Content-Type'), headers=headers)
+
+async def _sharded_system_data():
+    """
+    /system_data over a sharded database: users and courses are read from one shard,
+    enrollments and waitlists from every shard (concurrently) and merged. NDJSON is
+    relayed shard by shard; paging is not available because cursors are per shard.
+    """
+    if 'limit' in request.args or 'cursor' in request.args:
+        return jsonify({"error": "Paging is not available with a sharded database; leave out limit and cursor."}), 400
+    requested = [c for c in request.args.get('collections', '').split(',') if c] or \
+        ["users", "courses", "enrollments", "waitlists"]
+    partitioned = [c for c in requested if c in facade.PARTITIONED_COLLECTIONS]
+    clients = [db_shards.primary] + (db_shards.clients[1:] if partitioned else [])
+    ndjson = request.args.get('format') == 'ndjson'
+
+    def fetch(index, client):
+        params = dict(request.args.to_dict(), collections=",".join(requested if index == 0 else partitioned))
+        return client.get("/data", params=params, stream=ndjson)
+
+    try:
+        responses = await db_shards.parallel([fetch(index, client) for index, client in enumerate(clients)])
+        for response in responses:
+            if response.status_code >= 500:
+                response.raise_for_status()
+    except httpx.HTTPError as e:
+        print(f"Error connecting to database service: {e}")
+        return jsonify({"error": "Could not fetch data from the database service."}), 503
+    if responses[0].status_code != 200:
+        await responses[0].aread()
+        for response in responses:
+            await response.aclose()
+        return jsonify(wire.decode(responses[0])), responses[0].status_code
+
+    if ndjson:
+        return Response(_relay(responses), content_type=responses[0].headers.get('Content-Type'))
+
+    merged = wire.decode(responses[0])
+    for response in responses[1:]:
+        shard_data = wire.decode(response)
+        for student_id, courses in shard_data.get('enrollments', {}).items():
+            merged['enrollments'].setdefault(student_id, []).extend(courses)
+        merged.get('waitlists', {}).update(shard_data.get('waitlists', {}))
+    return jsonify(merged)
+
+if __name__ == '__main__':
+    # Runs on port 5004, in place of the threaded facade
+    app.run(port=5004)
@@ -0,0 +1,85 @@
+# entity_cache.py
+"""
+Read-through cache for the user and course records the enrollment facade needs
+on every request. These records almost never change during registration, so
+the facade keeps them in process and asks the database service only for the
+mutable enrollment and waitlist state.
+
+Invalidation uses a version stamp: the database service bumps its entity
+version on every /users or /courses write and returns it with each enrollment
+context read. Entries belong to the version they were read at; when a response
+carries a different version, the whole cache is dropped. With a sharded
+database every shard has its own stamp; all shards receive every user and
+course write, so a change of any shard's stamp drops the cache. Entries also expire
+after `ttl` seconds, and the least recently used entry is evicted once
+`max_entries` are held.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class EntityCache:
+    def __init__(self, max_entries=10000, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._versions = {}  # source (database shard) -> entity version last seen from it
+        self._entries = OrderedDict()  # key -> (record, stored_at); most recently used last
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get_many(self, keys):
+        """Returns {key: record} for the keys that are cached and fresh."""
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and now - entry[1] > self.ttl:
+                    del self._entries[key]
+                    self._counters["expirations"] += 1
+                    entry = None
+                if entry is None:
+                    self._counters["misses"] += 1
+                    continue
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                found[key] = entry[0]
+        return found
+
+    def put_many(self, records, version, source=None):
+        """Stores records read at `version` from `source`; records from any other version are ignored."""
+        now = time.monotonic()
+        with self._lock:
+            if version != self._versions.get(source):
+                return
+            for key, record in records.items():
+                if record is None:
+                    continue  # unknown IDs are not cached, so a later create is seen at once
+                self._entries[key] = (record, now)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def check_version(self, version, source=None):
+        """Returns True if `version` matches what `source` reported before; otherwise drops every entry and adopts it."""
+        with self._lock:
+            if version == self._versions.get(source):
+                return True
+            if self._entries:
+                self._counters["invalidations"] += 1
+            self._entries.clear()
+            self._versions[source] = version
+            return False
+
+    def metrics(self):
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            metrics = dict(self._counters, size=len(self._entries), max_entries=self.max_entries,
+                           ttl_seconds=self.ttl, version=self._versions.get(None),
+                           hit_ratio=round(self._counters["hits"] / lookups, 3) if lookups else None)
+            shard_versions = {source: version for source, version in self._versions.items() if source is not None}
+            if shard_versions:
+                metrics["shard_versions"] = shard_versions
+            return metrics
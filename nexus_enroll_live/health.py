@@ -0,0 +1,42 @@
+# health.py
+"""
+Liveness and readiness endpoints shared by the five services.
+
+  GET /healthz   the process is up and serving requests (no dependencies checked)
+  GET /readyz    the service can do useful work: every registered check passes.
+                 Returns 503 with the failing checks otherwise, so a launcher or
+                 load balancer can hold traffic until the service is ready.
+
+A check is a callable that returns True when healthy; returning False or raising
+marks the service as not ready.
+"""
+from flask import jsonify
+
+
+def add_health_endpoints(app, **checks):
+    @app.route('/healthz', methods=['GET'])
+    def healthz():
+        return jsonify({"status": "ok"})
+
+    @app.route('/readyz', methods=['GET'])
+    def readyz():
+        results, ready = {}, True
+        for name, check in checks.items():
+            try:
+                ok = bool(check())
+                results[name] = "ok" if ok else "failing"
+            except Exception as e:
+                ok = False
+                results[name] = f"failing: {e}"
+            ready = ready and ok
+        return jsonify({"status": "ready" if ready else "not_ready", "checks": results}), 200 if ready else 503
+
+    return app
+
+
+def downstream_check(client):
+    """Ready when the downstream service behind `client` answers its own /healthz."""
+    def check():
+        client.get('/healthz', timeout=(0.5, 1.0)).raise_for_status()
+        return True
+    return check
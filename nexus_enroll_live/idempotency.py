@@ -0,0 +1,204 @@
+# idempotency.py
+"""
+Idempotency keys for the enrollment facade's write endpoints.
+
+A student who double-clicks "Enroll", or a client that retries after a timeout,
+sends the same /enroll or /drop again. Without a key every copy runs the whole
+read-modify-write sequence against the database, and a retried drop whose first
+attempt succeeded answers "not enrolled". A client that sends an
+`Idempotency-Key` header instead gets one execution per key:
+
+  * The first request with a key runs and its response is stored for `ttl`
+    seconds. Later requests with the key get the stored response back, marked
+    with `Idempotent-Replayed: true`, without touching the database.
+  * Requests that arrive while the first one is still running wait for it
+    (up to `wait` seconds, then 409 with Retry-After) and share its response.
+  * A key reused with a different request body gets 422.
+  * Only definitive answers are stored. A 5xx response, or a request turned
+    away by admission control, leaves the key free, so the client's next retry
+    runs again.
+
+Keys are scoped to the endpoint. At most `max_entries` keys are held; the
+oldest finished ones are dropped first. A key whose request is still running
+is never dropped: if every slot is taken by one, new keyed requests get 503.
+A ttl of 0 turns idempotency keys off.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from instrumentation import registry
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyError(Exception):
+    """Raised when a keyed request cannot be served; carries the HTTP status and Retry-After seconds."""
+
+    def __init__(self, status, reason, retry_after=None):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def fingerprint(body):
+    """Digest of a JSON request body that ignores key order and whitespace."""
+    canonical = json.dumps(body, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "result", "stored_at", "done", "waiters")
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.result = None  # (status, body bytes, mimetype) once the owner has finished
+        self.stored_at = None
+        self.done = threading.Event()
+        self.waiters = []  # (loop, future) of async requests waiting for the owner
+
+
+class IdempotencyStore:
+    def __init__(self, ttl=600.0, max_entries=50000, wait=10.0, service="enrollment_service"):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.wait = wait
+        self.service = service
+        self._entries = OrderedDict()  # (scope, key) -> finished _Entry; oldest first
+        self._in_flight = {}           # (scope, key) -> _Entry whose owner is still running
+        self._lock = threading.Lock()
+        self._counters = {"executed": 0, "replayed": 0, "collapsed": 0, "conflicts": 0,
+                          "wait_timeouts": 0, "released": 0, "expirations": 0, "evictions": 0, "rejected": 0}
+
+    @classmethod
+    def from_env(cls):
+        """Settings from the NEXUS_* environment variables (see the README)."""
+        env = os.environ.get
+        return cls(ttl=float(env("NEXUS_IDEMPOTENCY_TTL", "600")),
+                   max_entries=int(env("NEXUS_IDEMPOTENCY_MAX_KEYS", "50000")),
+                   wait=float(env("NEXUS_IDEMPOTENCY_WAIT_MS", "10000")) / 1000)
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def claim(self, scope, key, body_fingerprint):
+        """
+        Returns (entry, owner). The owner runs the request and must call finish()
+        or release(); everyone else waits for the entry with wait_for() or
+        wait_for_async(). Raises IdempotencyError if the key is invalid or was
+        used with a different body.
+        """
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise IdempotencyError(400, f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters long.")
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            entry = self._in_flight.get((scope, key)) or self._entries.get((scope, key))
+            if entry is not None and entry.fingerprint != body_fingerprint:
+                self._counters["conflicts"] += 1
+                raise IdempotencyError(422, f"This {HEADER} was already used with a different request body.")
+            if entry is not None:
+                self._count("replayed" if entry.done.is_set() else "collapsed")
+                return entry, False
+            if len(self._in_flight) >= self.max_entries:
+                # Dropping a running key would let a retry run the operation twice
+                self._counters["rejected"] += 1
+                raise IdempotencyError(503, f"Too many {HEADER} requests in progress; please retry shortly.", 1)
+            entry = self._in_flight[(scope, key)] = _Entry(body_fingerprint)
+            self._counters["executed"] += 1
+            while self._entries and len(self._entries) + len(self._in_flight) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+            return entry, True
+
+    def finish(self, scope, key, entry, result):
+        """
+        Hands the owner's (status, body, mimetype) to the requests waiting on it,
+        and keeps it for later ones unless it was a server error.
+        """
+        with self._lock:
+            entry.result = result
+            entry.stored_at = time.monotonic()
+            if self._in_flight.get((scope, key)) is entry:
+                del self._in_flight[(scope, key)]
+                if result[0] < 500:
+                    self._entries[(scope, key)] = entry
+            waiters, entry.waiters = entry.waiters, []
+            entry.done.set()
+        self._wake(waiters, result)
+
+    def release(self, scope, key, entry):
+        """Frees the key without a result (the owner raised); waiting requests then run themselves."""
+        with self._lock:
+            if self._in_flight.get((scope, key)) is entry:
+                del self._in_flight[(scope, key)]
+            self._counters["released"] += 1
+            waiters, entry.waiters = entry.waiters, []
+            entry.done.set()
+        self._wake(waiters, None)
+
+    def wait_for(self, entry):
+        """
+        The owner's result, or None if the owner released the key (claim it again).
+        Raises IdempotencyError (409) if the owner is still running after `wait` seconds.
+        """
+        if not entry.done.wait(self.wait):
+            self._timed_out()
+        return entry.result
+
+    async def wait_for_async(self, entry):
+        """wait_for() for asyncio handlers: waits on the event loop instead of blocking it."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if entry.done.is_set():
+                return entry.result
+            future = loop.create_future()
+            entry.waiters.append((loop, future))
+        try:
+            return await asyncio.wait_for(future, self.wait)
+        except asyncio.TimeoutError:
+            self._timed_out()
+
+    @staticmethod
+    def _wake(waiters, result):
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future, result)
+
+    def _timed_out(self):
+        with self._lock:
+            self._counters["wait_timeouts"] += 1
+        raise IdempotencyError(409, f"A request with this {HEADER} is still being processed; please retry shortly.", 1)
+
+    def _purge_expired(self, now):
+        # Caller holds self._lock. Keys in progress are not in _entries, so they never expire
+        # and never hold up the finished ones, which expire oldest first.
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if now - entry.stored_at <= self.ttl:
+                return
+            self._entries.popitem(last=False)
+            self._counters["expirations"] += 1
+
+    def _count(self, counter):
+        # Caller holds self._lock
+        self._counters[counter] += 1
+        registry.inc("nexus_idempotent_replays_total", (("service", self.service), ("kind", counter)))
+
+    def metrics(self):
+        with self._lock:
+            return dict(self._counters, size=len(self._entries) + len(self._in_flight),
+                        in_progress=len(self._in_flight), max_entries=self.max_entries,
+                        ttl_seconds=self.ttl, wait_seconds=self.wait)
+
+
+def _resolve(future, result):
+    if not future.done():  # the waiter may have timed out meanwhile
+        future.set_result(result)
@@ -0,0 +1,266 @@
+# instrumentation.py
+"""
+Request metrics and tracing shared by the five NexusEnroll services.
+
+instrument(app, service) adds to a Flask app:
+  * per-route request counts and latency histograms, response sizes and an
+    in-flight gauge,
+  * GET /metrics, which renders every metric in the Prometheus text format,
+  * an X-Request-ID for every request: taken from the caller when present,
+    otherwise generated, and echoed on the response.
+
+instrument_async(app, service) does the same for a Quart (asyncio) app.
+
+ServiceClient reports each downstream call here (target, route, latency,
+status and payload sizes) and forwards the current request ID, so one request
+can be followed through every service. Each response carries a Server-Timing
+header with its downstream calls. Requests slower than NEXUS_SLOW_REQUEST_MS
+are logged with the same breakdown, so grepping one request ID across the
+service logs shows where the time went, hop by hop.
+"""
+import contextvars
+import os
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from flask import Response, current_app, g, has_app_context, has_request_context, request
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# Latency buckets in seconds (Prometheus convention)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_REQUEST_MS = float(os.environ.get("NEXUS_SLOW_REQUEST_MS", "500"))
+
+METRIC_HELP = {
+    "nexus_http_requests_total": ("counter", "Requests handled, by route and status."),
+    "nexus_http_request_duration_seconds": ("histogram", "Time to produce a response, by route."),
+    "nexus_http_response_bytes_total": ("counter", "Response body bytes sent, by route (streamed bodies excluded)."),
+    "nexus_http_requests_in_flight": ("gauge", "Requests currently being handled."),
+    "nexus_downstream_requests_total": ("counter", "Calls to other services, by target, route and status."),
+    "nexus_downstream_request_duration_seconds": ("histogram", "Latency of calls to other services."),
+    "nexus_downstream_request_bytes_total": ("counter", "Request body bytes sent to other services."),
+    "nexus_downstream_response_bytes_total": ("counter", "Response body bytes received from other services."),
+    "nexus_admission_rejections_total": ("counter", "Requests turned away by admission control, by reason."),
+}
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges and fixed-bucket histograms keyed by (name, labels)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = defaultdict(float)
+        self._histograms = {}  # key -> [bucket counts..., +Inf count, sum]
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self._counters[(name, labels)] += value
+
+    def gauge_add(self, name, labels, delta):
+        with self._lock:
+            self._gauges[(name, labels)] += delta
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[(name, labels)] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[index] += 1
+                    break
+            else:
+                histogram[len(self.buckets)] += 1
+            histogram[-1] += value
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            samples = defaultdict(list)
+            for (name, labels), value in self._counters.items():
+                samples[name].append(f"{name}{_labels(labels)} {_number(value)}")
+            for (name, labels), value in self._gauges.items():
+                samples[name].append(f"{name}{_labels(labels)} {_number(value)}")
+            for (name, labels), histogram in self._histograms.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), histogram):
+                    cumulative += count
+                    samples[name].append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+                samples[name].append(f"{name}_sum{_labels(labels)} {_number(histogram[-1])}")
+                samples[name].append(f"{name}_count{_labels(labels)} {cumulative}")
+        lines = []
+        for name in sorted(samples):
+            kind, help_text = METRIC_HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(sorted(samples[name]))
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+registry = MetricsRegistry()
+_default_service = None
+# Request ID and downstream calls of the request an asyncio task is serving (Quart has no Flask `g`)
+_async_request = contextvars.ContextVar("nexus_async_request", default=None)
+
+# Path segments made of lowercase words are routes ("ops", "enroll", "bulk");
+# anything else (S001, CS101, ...) is an ID and is collapsed to keep label sets small.
+_ROUTE_SEGMENT = re.compile(r"^[a-z_]+$")
+
+
+def route_label(path):
+    """'/enrollment_context/S001/CS101?x=1' -> '/enrollment_context/:id/:id'"""
+    segments = path.split('?', 1)[0].strip('/').split('/')
+    return "/" + "/".join(s if _ROUTE_SEGMENT.match(s) else ":id" for s in segments if s)
+
+
+def _service():
+    if has_app_context():
+        return current_app.extensions.get("nexus_service", _default_service) or "unknown"
+    return _default_service or "unknown"
+
+
+def current_request_id():
+    """The request ID of the request being handled, or None outside a request."""
+    if has_request_context():
+        return g.get('request_id')
+    state = _async_request.get()
+    return state["request_id"] if state else None
+
+
+def record_downstream(target, method, path, seconds, status, request_bytes, response_bytes):
+    """Called by ServiceClient once per attempt; `status` is the HTTP status or "error"."""
+    route = route_label(path)
+    labels = (("service", _service()), ("target", target), ("method", method), ("route", route))
+    registry.inc("nexus_downstream_requests_total", labels + (("status", str(status)),))
+    registry.observe("nexus_downstream_request_duration_seconds", labels, seconds)
+    if request_bytes:
+        registry.inc("nexus_downstream_request_bytes_total", labels, request_bytes)
+    if response_bytes:
+        registry.inc("nexus_downstream_response_bytes_total", labels, response_bytes)
+    if has_request_context():
+        g.setdefault('downstream_calls', []).append((target, method, route, seconds))
+    else:
+        state = _async_request.get()
+        if state is not None:
+            state["downstream_calls"].append((target, method, route, seconds))
+
+
+def _record_request_metrics(service, method, route, response, elapsed, response_bytes, calls, request_id,
+                            quiet_routes):
+    """Records a finished request and adds its Server-Timing and X-Request-ID headers."""
+    labels = (("service", service), ("method", method), ("route", route))
+    registry.inc("nexus_http_requests_total", labels + (("status", str(response.status_code)),))
+    registry.observe("nexus_http_request_duration_seconds", labels, elapsed)
+    if response_bytes:
+        registry.inc("nexus_http_response_bytes_total", labels, response_bytes)
+
+    timings = [f'{target};dur={seconds * 1000:.1f};desc="{call_method} {call_route}"'
+               for target, call_method, call_route, seconds in calls]
+    response.headers["Server-Timing"] = ", ".join(timings + [f"total;dur={elapsed * 1000:.1f}"])
+    response.headers[REQUEST_ID_HEADER] = request_id
+    if elapsed * 1000 >= SLOW_REQUEST_MS and route not in quiet_routes:
+        breakdown = ", ".join(f"{target} {call_method} {call_route} {seconds * 1000:.1f}ms"
+                              for target, call_method, call_route, seconds in calls)
+        print(f"SLOW [{request_id}] {service} {method} {route} {elapsed * 1000:.1f}ms"
+              + (f" ({breakdown})" if breakdown else ""))
+
+
+def instrument(app, service, quiet_routes=()):
+    """
+    Adds request metrics, request IDs and GET /metrics to a Flask app.
+    `quiet_routes` (long-polls, event streams) are measured but never logged as slow.
+    """
+    global _default_service
+    app.extensions["nexus_service"] = service
+    if _default_service is None:
+        _default_service = service
+
+    @app.before_request
+    def _start_timer():
+        g.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+        g.in_flight = True
+        registry.gauge_add("nexus_http_requests_in_flight", (("service", service),), 1)
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop('request_started', None)
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        response_bytes = 0 if response.is_streamed else response.content_length
+        _record_request_metrics(service, request.method, route, response, time.perf_counter() - started,
+                                response_bytes, g.get('downstream_calls', []), g.request_id, quiet_routes)
+        return response
+
+    @app.teardown_request
+    def _finish_request(exc):
+        # Runs even when a handler raised, so the gauge never drifts
+        if g.pop('in_flight', False):
+            registry.gauge_add("nexus_http_requests_in_flight", (("service", service),), -1)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Prometheus scrape endpoint."""
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    return app
+
+
+def instrument_async(app, service, quiet_routes=()):
+    """instrument() for a Quart app. Each request runs in its own task, so its state lives in a context variable."""
+    from quart import Response as AsyncResponse, g as async_g, request as async_request
+
+    global _default_service
+    if _default_service is None:
+        _default_service = service
+
+    @app.before_request
+    async def _start_timer():
+        _async_request.set({"request_id": async_request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex,
+                            "downstream_calls": []})
+        async_g.request_started = time.perf_counter()
+        async_g.in_flight = True
+        registry.gauge_add("nexus_http_requests_in_flight", (("service", service),), 1)
+
+    @app.after_request
+    async def _record_request(response):
+        started = async_g.pop('request_started', None)
+        state = _async_request.get()
+        if started is None or state is None:
+            return response
+        route = async_request.url_rule.rule if async_request.url_rule else "unmatched"
+        _record_request_metrics(service, async_request.method, route, response, time.perf_counter() - started,
+                                response.content_length, state["downstream_calls"], state["request_id"],
+                                quiet_routes)
+        return response
+
+    @app.teardown_request
+    async def _finish_request(exc):
+        if async_g.pop('in_flight', False):
+            registry.gauge_add("nexus_http_requests_in_flight", (("service", service),), -1)
+
+    @app.route('/metrics', methods=['GET'])
+    async def metrics():
+        """Prometheus scrape endpoint."""
+        return AsyncResponse(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    return app
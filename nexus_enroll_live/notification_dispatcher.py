@@ -0,0 +1,126 @@
+# notification_dispatcher.py
+"""
+Queue-backed notification pipeline used by the enrollment facade.
+
+The facade enqueues a notification and returns immediately. A background worker
+drains the queue in batches to the notification service's /notify/batch endpoint,
+so drop latency no longer includes the notification hop and an outage of the
+notification service cannot slow drops down.
+
+  * Dedup: one pending notification per (user_id, course_id); repeats are collapsed.
+  * Bounded buffer: when `max_queue` notifications are pending, new ones are rejected.
+  * Retry: a failed batch is retried with backoff, then put back at the head of the queue.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+import requests
+
+
+class NotificationDispatcher:
+    def __init__(self, client, batch_size=100, flush_interval=0.2, max_queue=10000,
+                 max_retries=3, retry_backoff=0.5):
+        self.client = client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        # (user_id, course_id) -> (payload, enqueued_at); insertion order is delivery order
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._worker = None
+        self._latencies = deque(maxlen=1000)
+        self._counters = {"enqueued": 0, "deduplicated": 0, "rejected": 0,
+                          "delivered": 0, "failed_attempts": 0, "batches": 0}
+
+    def enqueue(self, payload):
+        """Queues a notification. Returns False if the buffer is full."""
+        key = (payload['user_id'], payload.get('course_id'))
+        with self._cond:
+            if key in self._pending:
+                # Keep the original enqueue time but deliver the latest message
+                self._pending[key] = (payload, self._pending[key][1])
+                self._counters["deduplicated"] += 1
+                return True
+            if len(self._pending) >= self.max_queue:
+                self._counters["rejected"] += 1
+                return False
+            self._pending[key] = (payload, time.monotonic())
+            self._counters["enqueued"] += 1
+            self._ensure_worker()
+            self._cond.notify()
+        return True
+
+    def _ensure_worker(self):
+        # Started lazily so importing the module (e.g. by the reloader parent) spawns nothing
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+            self._worker.start()
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            # Give concurrent drops a moment to add to this batch
+            if len(self._pending) < self.batch_size:
+                self._cond.wait(self.flush_interval)
+            batch = []
+            while self._pending and len(batch) < self.batch_size:
+                batch.append(self._pending.popitem(last=False))
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not self._deliver(batch):
+                self._requeue(batch)
+                time.sleep(self.retry_backoff)
+
+    def _deliver(self, batch):
+        notifications = [payload for _, (payload, _) in batch]
+        for attempt in range(self.max_retries):
+            try:
+                response = self.client.post("/notify/batch", json={"notifications": notifications})
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                with self._cond:
+                    self._counters["failed_attempts"] += 1
+                print(f"Notification batch failed (attempt {attempt + 1}): {e}")
+                time.sleep(self.retry_backoff * (2 ** attempt))
+                continue
+            now = time.monotonic()
+            with self._cond:
+                self._counters["delivered"] += len(batch)
+                self._counters["batches"] += 1
+                self._latencies.extend(now - enqueued_at for _, (_, enqueued_at) in batch)
+            return True
+        return False
+
+    def _requeue(self, batch):
+        """Puts an undelivered batch back at the head of the queue, respecting the buffer bound."""
+        with self._cond:
+            for key, entry in reversed(batch):
+                if key in self._pending:
+                    continue  # a newer notification for the same key arrived meanwhile
+                if len(self._pending) >= self.max_queue:
+                    self._counters["rejected"] += 1
+                    continue
+                self._pending[key] = entry
+                self._pending.move_to_end(key, last=False)
+
+    def metrics(self):
+        """Queue depth, counters and delivery latency (enqueue to acknowledged) in milliseconds."""
+        with self._cond:
+            latencies = sorted(self._latencies)
+            stats = dict(self._counters, queue_depth=len(self._pending), max_queue=self.max_queue)
+        if latencies:
+            stats["delivery_latency_ms"] = {
+                "p50": round(latencies[len(latencies) // 2] * 1000, 2),
+                "p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 2),
+                "max": round(latencies[-1] * 1000, 2),
+                "samples": len(latencies),
+            }
+        return stats
@@ -1,9 +1,13 @@
 # notification_service.py
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+from instrumentation import instrument
+from health import add_health_endpoints
 
 app = Flask(__name__)
 CORS(app)
+instrument(app, "notification_service")
+add_health_endpoints(app)
 
 @app.route('/notify', methods=['POST'])
 def send_notification():
@@ -16,6 +20,18 @@ def send_notification():
     print("-----------------------------\n")
     return jsonify({"status": "Notification processed"}), 200
 
+@app.route('/notify/batch', methods=['POST'])
+def send_notification_batch():
+    """Bulk endpoint used by the facade's background dispatcher: one call, many notifications."""
+    notifications = request.json['notifications']
+    # Collapse duplicates within the batch (same user, same course)
+    unique = {(n['user_id'], n.get('course_id')): n for n in notifications}
+    # The request ID of the operation that caused each notification, when known, for tracing
+    lines = [f"TO: {n['user_name']} ({n['user_id']}) | MESSAGE: {n['message']}"
+             + (f" [request {n['request_id']}]" if n.get('request_id') else "") for n in unique.values()]
+    print(f"\n--- 📧 {len(lines)} NOTIFICATION(S) SENT 📧 ---\n" + "\n".join(lines) + "\n-----------------------------\n")
+    return jsonify({"status": "Batch processed", "delivered": len(unique)}), 200
+
 if __name__ == '__main__':
     # Runs on port 5003
     app.run(port=5003, debug=True)
\ No newline at end of file
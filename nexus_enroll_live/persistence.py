@@ -0,0 +1,291 @@
+# persistence.py
+"""
+Durable storage for database_service: an append-only write-ahead log plus
+periodic compacted snapshots.
+
+Every mutation is appended to the log as a small binary record
+(length + CRC32 header, pickled payload). Writers apply and serialize their
+operation under their own (per-course) locks; the log lock is held only to
+number the record and append it. Writers do not fsync individually:
+a background flusher fsyncs whatever has accumulated and wakes every writer
+covered by that fsync (group commit), so one disk flush acknowledges many writes.
+
+The log is split into segments. A snapshot pickles the whole state at sequence
+number N, starts a new segment and deletes the segments it made redundant, so
+restart time depends on the snapshot size plus the log tail, not on the full history.
+A crash can leave a torn record at the end of a segment; recovery truncates it
+so records appended after the restart are not hidden behind it.
+
+On disk (inside the data directory):
+    snapshot.bin            latest snapshot (header + pickled state)
+    wal-<first seq>.log     log segments, replayed in order on startup
+"""
+import glob
+import os
+from contextlib import contextmanager
+import pickle
+import struct
+import threading
+import time
+import zlib
+
+RECORD_HEADER = struct.Struct('<II')     # payload length, CRC32 of payload
+SNAPSHOT_HEADER = struct.Struct('<8sQ')  # magic, sequence number covered
+SNAPSHOT_MAGIC = b'NXSNAP01'
+PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+
+class DurableStore:
+    """
+    Write-ahead log with group commit and snapshot compaction.
+    The owner supplies three callbacks:
+      apply(op)          performs a logged operation on the in-memory state
+                         (used both for live writes and for replay on startup)
+      get_state()        returns the picklable state to snapshot
+      load_state(state)  replaces the in-memory state with a loaded snapshot
+    """
+
+    def __init__(self, data_dir, apply, get_state, load_state,
+                 group_commit_window=0.002, snapshot_every=200000):
+        self.data_dir = data_dir
+        self.apply = apply
+        self.get_state = get_state
+        self.load_state = load_state
+        self.group_commit_window = group_commit_window
+        self.snapshot_every = snapshot_every
+
+        self._lock = threading.Lock()          # guards appends, seq numbers and segment rotation
+        self._durable = threading.Condition(self._lock)
+        self._fsync_lock = threading.Lock()    # fsync and segment close never overlap
+        self._writers = threading.Condition()  # commits in progress; paused while a snapshot is taken
+        self._active_writers = 0
+        self._paused = False
+        self._seq = 0
+        self._durable_seq = 0
+        self._snapshot_seq = 0
+        self._file = None
+        self._flusher_thread = None
+        self._snapshotting = False
+        self._closed = False
+        self.stats = {"records": 0, "fsyncs": 0, "snapshots": 0, "replayed": 0}
+        os.makedirs(data_dir, exist_ok=True)
+
+    # --- Startup ---
+    def recover(self):
+        """Loads the latest snapshot, replays the log tail and starts the flusher. Returns the replay count."""
+        snapshot_path = os.path.join(self.data_dir, 'snapshot.bin')
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, 'rb') as f:
+                magic, seq = SNAPSHOT_HEADER.unpack(f.read(SNAPSHOT_HEADER.size))
+                if magic != SNAPSHOT_MAGIC:
+                    raise ValueError(f"{snapshot_path} is not a NexusEnroll snapshot")
+                self.load_state(pickle.load(f))
+            self._seq = self._snapshot_seq = seq
+
+        replayed = 0
+        for path in self._segments():
+            valid_end = 0
+            for seq, op, valid_end in self._read_segment(path):
+                if seq <= self._seq:
+                    continue  # already covered by the snapshot
+                self.apply(op)
+                self._seq = seq
+                replayed += 1
+            if os.path.getsize(path) > valid_end:
+                # Cut off the torn record, or a later append would land behind it and be unreadable
+                with open(path, 'r+b') as f:
+                    f.truncate(valid_end)
+                    os.fsync(f.fileno())
+        self._durable_seq = self._seq
+        self.stats["replayed"] = replayed
+        self._open_segment()
+        self._flusher_thread = threading.Thread(target=self._flusher, name="wal-flusher", daemon=True)
+        self._flusher_thread.start()
+        return replayed
+
+    def _segments(self):
+        return sorted(glob.glob(os.path.join(self.data_dir, 'wal-*.log')))
+
+    @staticmethod
+    def _read_segment(path):
+        """
+        Yields (seq, op, end offset) for each record; stops at the first torn or corrupt
+        record (an interrupted write), so the last offset yielded is where the valid log ends.
+        """
+        with open(path, 'rb') as f:
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                length, crc = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    return
+                seq, op = pickle.loads(payload)
+                if isinstance(op, bytes):
+                    op = pickle.loads(op)  # serialized by the writer before the record was numbered
+                yield seq, op, f.tell()
+
+    def _open_segment(self):
+        path = os.path.join(self.data_dir, f'wal-{self._seq + 1:020d}.log')
+        self._file = open(path, 'ab', buffering=1 << 20)
+
+    def is_running(self):
+        """True while the log is open and its flusher is acknowledging writes."""
+        return not self._closed and self._flusher_thread is not None and self._flusher_thread.is_alive()
+
+    # --- Writes ---
+    def commit(self, op, exclusive=False):
+        """
+        Applies `op` to the in-memory state and appends it to the log, atomically with
+        respect to snapshots. Returns the sequence number to pass to wait_durable().
+
+        The caller holds the locks that order conflicting operations (the course lock
+        for seat changes); `op` is applied under those, not under the log lock, so
+        writes to different courses still run in parallel. Operations that no such
+        lock orders (a reset, bulk replacements) pass exclusive=True: they wait for
+        every commit in progress and hold back new ones, so the log order matches
+        the order they were applied in. `op` is serialized first, so an operation
+        that cannot be logged never changes the state.
+        """
+        serialized = pickle.dumps(op, protocol=PICKLE_PROTOCOL)
+        with self._writes_paused() if exclusive else self._writer():
+            self.apply(op)
+            with self._lock:
+                self._seq += 1
+                payload = pickle.dumps((self._seq, serialized), protocol=PICKLE_PROTOCOL)
+                self._file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+                self._file.write(payload)
+                self.stats["records"] += 1
+                self._durable.notify_all()
+                return self._seq
+
+    @contextmanager
+    def _writer(self):
+        with self._writers:
+            while self._paused:
+                self._writers.wait()
+            self._active_writers += 1
+        try:
+            yield
+        finally:
+            with self._writers:
+                self._active_writers -= 1
+                self._writers.notify_all()
+
+    @contextmanager
+    def _writes_paused(self):
+        """Waits for commits in progress to finish and holds back new ones, so the state matches self._seq."""
+        with self._writers:
+            while self._paused:
+                self._writers.wait()
+            self._paused = True
+            while self._active_writers:
+                self._writers.wait()
+        try:
+            yield
+        finally:
+            with self._writers:
+                self._paused = False
+                self._writers.notify_all()
+
+    def wait_durable(self, seq, timeout=5.0):
+        """Blocks until the record `seq` has been fsync'd. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._durable:
+            while self._durable_seq < seq:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._durable.wait(remaining)
+        return True
+
+    def _flusher(self):
+        while True:
+            with self._durable:
+                while self._durable_seq == self._seq and not self._closed:
+                    self._durable.wait()
+                if self._closed:
+                    return
+            # Linger briefly so concurrent writers share this fsync
+            time.sleep(self.group_commit_window)
+            with self._fsync_lock:
+                with self._lock:
+                    if self._closed:
+                        return
+                    target = self._seq
+                    self._file.flush()
+                    fileno = self._file.fileno()
+                os.fsync(fileno)
+            with self._durable:
+                self._durable_seq = max(self._durable_seq, target)
+                self.stats["fsyncs"] += 1
+                self._durable.notify_all()
+                due = (bool(self.snapshot_every) and not self._snapshotting
+                       and self._seq - self._snapshot_seq >= self.snapshot_every)
+                if due:
+                    self._snapshotting = True
+            if due:
+                threading.Thread(target=self._snapshot_in_background, name="wal-snapshot", daemon=True).start()
+
+    # --- Snapshots ---
+    def snapshot(self):
+        """
+        Writes a compacted snapshot of the current state and deletes the log segments it covers.
+        The state is serialized while appends are paused, so it matches an exact sequence number.
+        """
+        with self._writes_paused(), self._fsync_lock:
+            with self._lock:
+                data = pickle.dumps(self.get_state(), protocol=PICKLE_PROTOCOL)
+                seq = self._seq
+                # Seal the current segment and start a new one for writes after `seq`
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._open_segment()
+                # Every other segment only holds records <= seq (the new one may reuse an
+                # existing name when nothing was written since the last rotation)
+                old_segments = [path for path in self._segments() if path != self._file.name]
+                self._durable_seq = max(self._durable_seq, seq)
+                self._durable.notify_all()
+
+        tmp_path = os.path.join(self.data_dir, 'snapshot.bin.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, seq))
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.data_dir, 'snapshot.bin'))
+        for path in old_segments:
+            os.remove(path)
+
+        with self._lock:
+            self._snapshot_seq = seq
+            self.stats["snapshots"] += 1
+        return {"seq": seq, "bytes": len(data)}
+
+    def _snapshot_in_background(self):
+        try:
+            self.snapshot()
+        finally:
+            with self._lock:
+                self._snapshotting = False
+
+    def archive(self, label):
+        """Writes a standalone copy of the current state (e.g. before /clear) for manual recovery."""
+        with self._writes_paused():
+            data = pickle.dumps(self.get_state(), protocol=PICKLE_PROTOCOL)
+        path = os.path.join(self.data_dir, f'{label}-{time.strftime("%Y%m%d-%H%M%S")}.bin')
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def close(self):
+        with self._fsync_lock, self._lock:
+            self._closed = True
+            if self._file and not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+            self._durable_seq = self._seq
+            self._durable.notify_all()
@@ -4,11 +4,7 @@ echo "Starting all NexusEnroll services..."
 # Use python3 or python depending on the system
 PYTHON_CMD=python3
 
-# Start each service in the background
-$PYTHON_CMD database_service.py &
-$PYTHON_CMD user_service.py &
-$PYTHON_CMD course_service.py &
-$PYTHON_CMD notification_service.py &
-$PYTHON_CMD enrollment_service.py &
-
-echo "All services started. Open http://127.0.0.1:5004 in your browser."
\ No newline at end of file
+# serve.py runs every service under a production WSGI server and waits until all
+# are ready; extra arguments are passed through (e.g. --threads 32 --workers 4).
+# For development with the auto-reloader, run each service file directly instead.
+exec $PYTHON_CMD serve.py "$@"
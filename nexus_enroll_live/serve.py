@@ -0,0 +1,278 @@
+# serve.py
+"""
+Production launcher for NexusEnroll (replaces run_all_services.sh/.bat).
+
+Each service runs in its own process under waitress, a multi-threaded
+production WSGI server: no debug mode, no reloader, one process per service.
+
+  * database_service and enrollment_service keep state in memory (the data
+    itself; the caches, notification queue and promotion notifier), so each
+    always runs as a single process with a pool of threads.
+  * user_service, course_service and notification_service are stateless; with
+    --workers N they run N worker processes under gunicorn (POSIX only, needs
+    `pip install gunicorn`), otherwise as a single threaded waitress process.
+
+With --async-facade the enrollment facade runs as enrollment_service_async
+(Quart on hypercorn, one event loop) instead of under waitress; it needs
+`pip install -r requirements-optional.txt` and serves the API but not the UI page.
+
+With --shards N the database runs as N processes, each owning the courses that
+hash to it (see sharding.py). Shard i listens on the database port + 100 * i and
+keeps its write-ahead log in data/shard-<i>; the other services are given every
+shard's URL. A data directory written with one shard count should not be reused
+with another: courses would be looked up on shards that do not hold them.
+
+With --embedded every service runs in this one process instead, behind a single
+waitress server on the usual ports, and calls between services are direct
+in-process calls rather than HTTP (see embedded.py). It starts faster and uses
+less memory, but runs one database and the threaded facade only.
+
+The database starts first (restoring its write-ahead log), the other services
+start once its /readyz passes, and the launcher waits until every service is
+ready. Output from all services is shown in one console, prefixed with the
+service name. Ctrl+C stops everything; if any service exits, the rest are stopped.
+
+Usage:
+    python serve.py [--host 127.0.0.1] [--threads 16] [--workers 1] [--shards 1] [--async-facade] [--embedded]
+                    [--port enrollment_service=8080 ...] [--only database_service ...]
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+LIVE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PORTS = OrderedDict([
+    ("database_service", 5000),
+    ("user_service", 5001),
+    ("course_service", 5002),
+    ("notification_service", 5003),
+    ("enrollment_service", 5004),
+])
+STATEFUL_SERVICES = {"database_service", "enrollment_service"}
+SHARD_PORT_STEP = 100
+# Environment variables through which the services find each other
+URL_VARIABLES = {
+    "database_service": "NEXUS_DB_URL",
+    "user_service": "NEXUS_USER_URL",
+    "course_service": "NEXUS_COURSE_URL",
+    "notification_service": "NEXUS_NOTIFY_URL",
+}
+
+
+def run_service(service, host, port, threads):
+    """Child process: serves one service under waitress until terminated."""
+    from waitress import serve
+
+    # SIGTERM from the launcher becomes a normal exit, so the log is closed cleanly
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    module = __import__(service)
+    if service == "database_service" and module.DATA_DIR:
+        module.init_persistence(module.DATA_DIR)
+    try:
+        serve(module.app, host=host, port=port, threads=threads, ident=service)
+    finally:
+        if service == "database_service" and module.store is not None:
+            module.store.close()
+
+
+def service_command(service, args, port):
+    if service == "enrollment_service" and args.async_facade:
+        # A deep accept backlog, so a burst of thousands of connections is queued rather than reset
+        return [sys.executable, "-m", "hypercorn", "enrollment_service_async:app", "--bind", f"{args.host}:{port}",
+                "--backlog", "2048"]
+    if args.workers > 1 and service not in STATEFUL_SERVICES and can_use_gunicorn():
+        return [sys.executable, "-m", "gunicorn", f"{service}:app", "--bind", f"{args.host}:{port}",
+                "--workers", str(args.workers), "--threads", str(args.threads), "--worker-class", "gthread"]
+    return [sys.executable, "-u", os.path.abspath(__file__), "--run", service,
+            "--host", args.host, "--threads", str(args.threads), "--port", f"{service}={port}"]
+
+
+def can_use_gunicorn():
+    if os.name != "posix":
+        return False
+    try:
+        import gunicorn  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def missing_async_packages():
+    """The packages the async facade needs that are not installed."""
+    missing = []
+    for package in ("quart", "httpx", "hypercorn"):
+        try:
+            __import__(package)
+        except ImportError:
+            missing.append(package)
+    return missing
+
+
+def parse_ports(values):
+    ports = dict(DEFAULT_PORTS)
+    for value in values:
+        service, _, port = value.partition('=')
+        if service not in ports or not port.isdigit():
+            raise SystemExit(f"Invalid --port {value!r}; expected <service>=<port> with one of: {', '.join(ports)}")
+        ports[service] = int(port)
+    return ports
+
+
+def database_shards(count, port, env):
+    """(label, port, environment) for each database shard process."""
+    if count == 1:
+        return [("database_service", port, env)]
+    data_dir = env.get("NEXUS_DB_DATA_DIR", os.path.join(LIVE_DIR, "data"))
+    return [(f"database_service-{index}", port + SHARD_PORT_STEP * index,
+             dict(env, NEXUS_DB_DATA_DIR=os.path.join(data_dir, f"shard-{index}") if data_dir else ""))
+            for index in range(count)]
+
+
+def relay_output(service, stream):
+    for line in stream:
+        sys.stdout.write(f"[{service}] {line}")
+        sys.stdout.flush()
+
+
+def wait_until_ready(url, process, timeout):
+    """Polls /readyz until it answers 200; fails early if the process exits."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            if requests.get(f"{url}/readyz", timeout=2).status_code == 200:
+                return True
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def stop_all(processes):
+    for process in processes.values():
+        if process.poll() is None:
+            process.terminate()
+    for process in processes.values():
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--threads', type=int, default=16, help="request threads per process")
+    parser.add_argument('--workers', type=int, default=1, help="processes per stateless service (gunicorn)")
+    parser.add_argument('--shards', type=int, default=1, help="database processes, partitioned by course")
+    parser.add_argument('--async-facade', action='store_true', help="run the asyncio enrollment facade")
+    parser.add_argument('--embedded', action='store_true', help="run every service in this one process")
+    parser.add_argument('--port', action='append', default=[], metavar="SERVICE=PORT")
+    parser.add_argument('--only', action='append', choices=list(DEFAULT_PORTS), help="start only these services")
+    parser.add_argument('--ready-timeout', type=float, default=120.0, help="seconds to wait for each service")
+    parser.add_argument('--run', choices=list(DEFAULT_PORTS), help=argparse.SUPPRESS)  # child mode
+    args = parser.parse_args()
+    ports = parse_ports(args.port)
+
+    if args.run:
+        run_service(args.run, args.host, ports[args.run], args.threads)
+        return
+
+    # Browsers and services reach each other on 127.0.0.1 when listening on all interfaces
+    public_host = "127.0.0.1" if args.host in ("0.0.0.0", "::") else args.host
+    if args.embedded:
+        if args.shards != 1 or args.only:
+            raise SystemExit("--embedded runs every service with a single database; drop --shards and --only")
+        if args.async_facade or args.workers > 1:
+            print("Note: --embedded runs the threaded enrollment facade in one process; "
+                  "--async-facade and --workers are ignored.")
+        import embedded
+        try:
+            embedded.serve(args.host, public_host, ports, args.threads)
+        except KeyboardInterrupt:
+            print("Stopping all services...")
+        return
+
+    if args.workers > 1 and not can_use_gunicorn():
+        print("Note: --workers needs gunicorn on a POSIX system; stateless services will run as one process.")
+    missing = missing_async_packages() if args.async_facade else []
+    if missing:
+        raise SystemExit(f"--async-facade needs {', '.join(missing)}, which are not installed. "
+                         "Install them with: pip install -r requirements-optional.txt")
+    if args.shards < 1:
+        raise SystemExit("--shards must be at least 1")
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    shard_urls = [f"http://{public_host}:{ports['database_service'] + SHARD_PORT_STEP * index}"
+                  for index in range(args.shards)]
+    env.setdefault("NEXUS_DB_URL", ",".join(shard_urls))
+    for service, variable in URL_VARIABLES.items():
+        env.setdefault(variable, f"http://{public_host}:{ports[service]}")
+
+    services = [s for s in DEFAULT_PORTS if not args.only or s in args.only]
+    processes = OrderedDict()
+    # Ctrl+C and SIGTERM (e.g. from a process manager) both stop every service cleanly
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    # (label, service, port, environment) of every process; the database has one per shard
+    launches = []
+    for service in services:
+        if service == "database_service":
+            launches.extend((label, service, port, shard_env)
+                            for label, port, shard_env in database_shards(args.shards, ports[service], env))
+        else:
+            launches.append((service, service, ports[service], env))
+
+    def start(label, service, port, process_env):
+        process = subprocess.Popen(service_command(service, args, port), cwd=LIVE_DIR, env=process_env,
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+        threading.Thread(target=relay_output, args=(label, process.stdout), daemon=True).start()
+        processes[label] = process
+
+    try:
+        # The database first: everything else depends on it
+        database = [launch for launch in launches if launch[1] == "database_service"]
+        for launch in database:
+            start(*launch)
+        if len(services) > 1:
+            for label, _, port, _ in database:
+                if not wait_until_ready(f"http://{public_host}:{port}", processes[label], args.ready_timeout):
+                    raise RuntimeError(f"{label} did not become ready")
+        for launch in launches:
+            if launch[1] != "database_service":
+                start(*launch)
+        for label, _, port, _ in launches:
+            if not wait_until_ready(f"http://{public_host}:{port}", processes[label], args.ready_timeout):
+                raise RuntimeError(f"{label} did not become ready")
+
+        print("All services ready:")
+        for label, _, port, _ in launches:
+            print(f"  {label:<22} http://{public_host}:{port}")
+        if "enrollment_service" in processes and not args.async_facade:
+            print(f"Open http://{public_host}:{ports['enrollment_service']} in your browser. Press Ctrl+C to stop.")
+
+        # Supervise: if any service exits, stop the rest
+        while all(process.poll() is None for process in processes.values()):
+            time.sleep(0.5)
+        exited = [s for s, p in processes.items() if p.poll() is not None]
+        print(f"Service(s) exited: {', '.join(exited)}; stopping the others.")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("Stopping all services...")
+    except RuntimeError as e:
+        print(f"Startup failed: {e}")
+        sys.exit(1)
+    finally:
+        stop_all(processes)
+
+
+if __name__ == '__main__':
+    main()
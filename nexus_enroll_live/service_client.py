@@ -0,0 +1,159 @@
+# service_client.py
+"""
+Shared HTTP client used for every call between the NexusEnroll services.
+
+Each downstream service gets one ServiceClient, which provides:
+  * a pooled keep-alive requests.Session (no TCP handshake per call),
+  * connect/read timeouts on every call, so a slow service cannot hang a worker,
+  * bounded retries with jittered backoff for idempotent reads only,
+  * a circuit breaker that fails fast while the downstream is unhealthy,
+  * per-call timing and payload sizes reported to instrumentation, plus the
+    current X-Request-ID forwarded so a request can be traced across services,
+  * content negotiation of the wire format (see wire.py): read bodies with
+    wire.decode(response) rather than response.json(),
+  * a pluggable transport (see transport.py): HTTP by default, or a direct call
+    when the downstream app runs in the same process.
+
+Errors are raised as requests exceptions, so callers keep catching
+requests.exceptions.RequestException exactly as before.
+"""
+import random
+import threading
+import time
+
+import requests
+
+import instrumentation
+import transport
+import wire
+
+# (connect timeout, read timeout) in seconds
+DEFAULT_TIMEOUT = (1.0, 5.0)
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised without touching the network while a downstream's circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Classic three-state circuit breaker.
+    CLOSED: calls flow normally. After `failure_threshold` consecutive failures it
+    OPENS and rejects calls for `reset_timeout` seconds, then goes HALF-OPEN and lets
+    a single trial call through; success closes the circuit, failure re-opens it.
+    A trial that never reports back within `reset_timeout` counts as a failure.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN and now - self._trial_started_at >= self.reset_timeout:
+                # The trial call was lost (e.g. cancelled by its caller): re-open instead of waiting forever
+                self.state = self.OPEN
+                self._opened_at = now
+            if self.state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_started_at = now
+                return True
+            # OPEN within the timeout, or HALF_OPEN with the trial call still in flight
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class ServiceClient:
+    """Pooled, timeout-bounded, retrying HTTP client for one downstream service."""
+
+    def __init__(self, base_url, timeout=DEFAULT_TIMEOUT, retries=2, backoff=0.05,
+                 pool_size=32, breaker=None, name=None, binary_bodies=False, adapter=None):
+        self.base_url = base_url.rstrip('/')
+        self.name = name or self.base_url  # target label in metrics and Server-Timing
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.binary_bodies = binary_bodies  # the downstream reads MessagePack request bodies
+        self.session = requests.Session()
+        # Any requests transport adapter; by default HTTP, or in process if the downstream app is mounted here
+        adapter = adapter or transport.adapter_for(self.base_url, pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # Proxy settings from the environment are looked up on every call and do not apply in process
+        self.session.trust_env = not getattr(adapter, 'in_process', False)
+
+    def request(self, method, path, timeout=None, **kwargs):
+        """
+        Sends a request to `base_url + path`.
+        Reads are retried on connection errors, timeouts and 5xx responses; writes are sent once.
+        """
+        method = method.upper()
+        attempts = 1 + self.retries if method in IDEMPOTENT_METHODS else 1
+        url = f"{self.base_url}{path}"
+        kwargs = wire.prepare_request(kwargs, self.binary_bodies)
+        request_id = instrumentation.current_request_id()
+        if request_id:
+            kwargs['headers'][instrumentation.REQUEST_ID_HEADER] = request_id
+
+        for attempt in range(attempts):
+            if not self.breaker.allow_request():
+                raise CircuitOpenError(f"Circuit open for {self.base_url}; failing fast.")
+            last_attempt = attempt == attempts - 1
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except requests.exceptions.RequestException as error:
+                # Every attempt reports to the breaker, or a failed half-open trial would leave it stuck
+                instrumentation.record_downstream(self.name, method, path, time.perf_counter() - started,
+                                                  "error", 0, 0)
+                self.breaker.record_failure()
+                retryable = isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+                if last_attempt or not retryable:
+                    raise
+                self._sleep_before_retry(attempt)
+                continue
+
+            # Streamed bodies have not been read yet; their size is only known from Content-Length
+            instrumentation.record_downstream(
+                self.name, method, path, time.perf_counter() - started, response.status_code,
+                len(response.request.body or b""), int(response.headers.get('Content-Length') or 0))
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+                if not last_attempt:
+                    self._sleep_before_retry(attempt)
+                    continue
+            else:
+                self.breaker.record_success()
+            return response
+
+    def _sleep_before_retry(self, attempt):
+        # Exponential backoff with full jitter keeps retrying clients from synchronizing
+        time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
@@ -0,0 +1,140 @@
+# sharding.py
+"""
+Routing client for a database service split across several processes.
+
+One database_service process holds every lock and dict in one interpreter, so
+under load it is limited to one core by the GIL. In sharded mode, N processes
+each own part of the seat state:
+
+  * course-scoped state (rosters, waitlists, holds, capacity tracking) lives on
+    the shard that owns the course, chosen by consistent hashing of course_id;
+  * user and course records are small, read by every eligibility check and
+    rarely written, so every shard holds a full copy (writes are broadcast);
+  * a student's enrollments are split by course: each shard holds the ones for
+    its own courses, and a student's whole schedule is a scatter-gather read.
+
+Each shard is a separate process, so writes for different courses run on
+different cores. Consistent hashing (many virtual points per shard on a hash
+ring) means adding a shard moves only about 1/N of the courses.
+
+NEXUS_DB_URL takes a comma-separated list of shard URLs. With a single URL the
+router is a thin wrapper around one ServiceClient and nothing is scattered.
+"""
+import bisect
+import contextvars
+import functools
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import wire
+from service_client import ServiceClient
+
+DEFAULT_DB_URL = "http://127.0.0.1:5000"
+
+
+def _point(key):
+    # A stable hash: Python's hash() is salted per process, and every service must agree on placement
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring with `vnodes` points per node, so keys spread evenly across nodes."""
+
+    def __init__(self, nodes, vnodes=128):
+        self.nodes = list(nodes)
+        points = sorted((_point(f"{node}#{i}"), index) for index, node in enumerate(self.nodes) for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._owners = [index for _, index in points]
+
+    def index_for(self, key):
+        """Position in `nodes` of the node that owns `key`."""
+        if len(self.nodes) == 1:
+            return 0
+        position = bisect.bisect(self._hashes, _point(key)) % len(self._hashes)
+        return self._owners[position]
+
+
+class ShardedDatabase:
+    """One ServiceClient per shard, plus routing by course ID and fan-out to every shard."""
+    client_class = ServiceClient
+    # Fan-outs run on a thread pool; a subclass that scatters some other way turns it off
+    scatter_threads = True
+
+    def __init__(self, urls, name="database_service"):
+        urls = [url.strip().rstrip('/') for url in urls if url.strip()]
+        if not urls:
+            raise ValueError("At least one database URL is required.")
+        # Every shard is a database_service, which reads MessagePack request bodies
+        self.clients = [self.client_class(url, name=name if len(urls) == 1 else f"{name}-{index}",
+                                          binary_bodies=True)
+                        for index, url in enumerate(urls)]
+        # Shards are placed on the ring by URL, so the order of NEXUS_DB_URL does not matter
+        self.ring = HashRing(urls)
+        # Shared by every request thread of the calling service, so sized for several scatters at once
+        self._pool = None
+        if len(urls) > 1 and self.scatter_threads:
+            self._pool = ThreadPoolExecutor(max_workers=8 * len(urls), thread_name_prefix="shard-scatter")
+
+    @classmethod
+    def from_env(cls, name="database_service"):
+        return cls(os.environ.get("NEXUS_DB_URL", DEFAULT_DB_URL).split(','), name=name)
+
+    @property
+    def sharded(self):
+        return len(self.clients) > 1
+
+    @property
+    def primary(self):
+        """Shard 0: serves reads of the replicated user and course records."""
+        return self.clients[0]
+
+    def index_for(self, course_id):
+        return self.ring.index_for(course_id)
+
+    def for_course(self, course_id):
+        """The client of the shard that owns a course."""
+        return self.clients[self.ring.index_for(course_id)]
+
+    def group_runs(self, course_ids):
+        """
+        Splits course IDs into runs of consecutive courses owned by the same shard,
+        as [(client, [course_ids])] in the original order.
+        """
+        runs = []
+        for course_id in course_ids:
+            client = self.for_course(course_id)
+            if runs and runs[-1][0] is client:
+                runs[-1][1].append(course_id)
+            else:
+                runs.append((client, [course_id]))
+        return runs
+
+    def parallel(self, calls):
+        """
+        Runs zero-argument callables (typically one request per shard) concurrently
+        and returns their results in order. Raises the first error, if any.
+        """
+        if self._pool is None or len(calls) <= 1:
+            return [call() for call in calls]
+        # Each call runs in a copy of the caller's context, so request IDs and timings still reach the request
+        futures = [self._pool.submit(contextvars.copy_context().run, call) for call in calls]
+        return [future.result() for future in futures]
+
+    def scatter(self, method, path, clients=None, **kwargs):
+        """Sends the same request to every shard (or to `clients`) in parallel; returns the responses in order."""
+        clients = self.clients if clients is None else clients
+        return self.parallel([functools.partial(client.request, method, path, **kwargs) for client in clients])
+
+    def broadcast(self, path, **kwargs):
+        """POSTs a replicated write (users, courses, clear) to every shard; returns the responses."""
+        return self.scatter("POST", path, **kwargs)
+
+    def student_enrollments(self, student_id, exclude=()):
+        """A student's enrolled courses gathered from every shard except those in `exclude`."""
+        clients = [client for client in self.clients if client not in exclude]
+        courses = []
+        for response in self.scatter("GET", f"/enrollments/{student_id}", clients=clients):
+            response.raise_for_status()
+            courses.extend(wire.decode(response))
+        return courses
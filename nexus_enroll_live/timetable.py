@@ -0,0 +1,70 @@
+# timetable.py
+"""
+Course meeting times as bitmaps, so schedule conflicts are a single AND.
+
+A course's schedule is a list of meetings such as "Mon 09:00-10:30". The week
+is cut into 5-minute slots (7 days x 288 slots); a meeting sets the bits of every
+slot it touches, and a schedule's mask is the OR of its meetings. A student's
+busy time is the OR of their enrolled courses' masks. Two courses can only
+conflict when their masks share a bit; meetings off the 5-minute grid can share
+a slot without overlapping (10:00-10:02 and 10:03-10:30), so a shared bit is
+confirmed with schedules_overlap().
+"""
+import re
+
+DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+SLOT_MINUTES = 5
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+_MEETING = re.compile(r"^\s*([A-Za-z]{3})\s+(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*$")
+
+
+def parse_meeting(text):
+    """'Mon 09:00-10:30' -> (day index, start minute, end minute). Raises ValueError."""
+    match = _MEETING.match(text) if isinstance(text, str) else None
+    if not match or match.group(1).capitalize() not in DAYS or int(match.group(3)) > 59 or int(match.group(5)) > 59:
+        raise ValueError(f"Invalid meeting time {text!r}; expected e.g. 'Mon 09:00-10:30'.")
+    start = int(match.group(2)) * 60 + int(match.group(3))
+    end = int(match.group(4)) * 60 + int(match.group(5))
+    if not start < end <= 24 * 60:
+        raise ValueError(f"Invalid meeting time {text!r}; the end must be after the start on the same day.")
+    return DAYS.index(match.group(1).capitalize()), start, end
+
+
+def normalize_schedule(value):
+    """
+    Validates a schedule given as a list or a ';'-separated string (CSV uploads)
+    and returns it as a list of canonical 'Day HH:MM-HH:MM' strings.
+    """
+    if value is None or value == "":
+        return []
+    meetings = value.split(';') if isinstance(value, str) else list(value)
+    normalized = []
+    for meeting in meetings:
+        if isinstance(meeting, str) and not meeting.strip():
+            continue
+        day, start, end = parse_meeting(meeting)
+        normalized.append(f"{DAYS[day]} {start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}")
+    return normalized
+
+
+def schedule_mask(schedule):
+    """Bitmap of the 5-minute slots a schedule occupies (0 for no meetings)."""
+    mask = 0
+    for meeting in schedule or ():
+        day, start, end = parse_meeting(meeting)
+        first = start // SLOT_MINUTES
+        last = -(-end // SLOT_MINUTES)  # slots the meeting touches, rounded outwards
+        mask |= ((1 << (last - first)) - 1) << (day * SLOTS_PER_DAY + first)
+    return mask
+
+
+def schedules_overlap(first, second):
+    """Exact check of two schedules: True if any of their meetings overlap in time."""
+    meetings = [parse_meeting(meeting) for meeting in first or ()]
+    for meeting in second or ():
+        day, start, end = parse_meeting(meeting)
+        if any(other_day == day and other_start < end and start < other_end
+               for other_day, other_start, other_end in meetings):
+            return True
+    return False
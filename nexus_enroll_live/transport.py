@@ -0,0 +1,88 @@
+# transport.py
+"""
+Pluggable transports for ServiceClient.
+
+A ServiceClient sends its requests through a requests transport adapter. By
+default that is a pooled HTTPAdapter, so every call is an HTTP request over the
+network (or loopback). When the service behind a URL runs in the same process
+(embedded mode, see embedded.py), mount() registers its WSGI app for that URL
+and clients created afterwards get a WSGITransport instead: the call goes
+straight into the app in the calling thread, with no socket, no HTTP parsing and
+no server thread. Status, headers and body are exactly what the app produces, so
+retries, circuit breakers, metrics and wire.decode() work unchanged.
+
+In-process calls cannot be interrupted, so client timeouts do not apply to them.
+"""
+import io
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+_mounted = {}  # base URL -> WSGI app served by this process
+
+
+def mount(base_url, app):
+    """Routes clients of `base_url` created from now on straight into `app`."""
+    _mounted[base_url.rstrip('/')] = app
+
+
+def adapter_for(base_url, pool_size):
+    """The transport for a client of `base_url`: in process if its app is mounted here, HTTP otherwise."""
+    app = _mounted.get(base_url.rstrip('/'))
+    if app is not None:
+        return WSGITransport(app)
+    return HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+
+
+class _AppIterReader(io.RawIOBase):
+    """File-like view of a WSGI response iterable, read as the caller consumes it."""
+
+    def __init__(self, app_iter):
+        self._app_iter = app_iter
+        self._chunks = iter(app_iter)
+        self._pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = chunk
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def close(self):
+        if not self.closed and hasattr(self._app_iter, 'close'):
+            self._app_iter.close()  # runs the app's teardown for streamed responses
+        super().close()
+
+
+class WSGITransport(HTTPAdapter):
+    """Transport adapter that calls a WSGI app in process instead of opening a connection."""
+    in_process = True
+
+    def __init__(self, app):
+        super().__init__()
+        self.app = app
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        url = urlsplit(request.url)
+        body = request.body or b""
+        environ = EnvironBuilder(
+            method=request.method, base_url=f"{url.scheme}://{url.netloc}", path=url.path,
+            query_string=url.query, headers=dict(request.headers),
+            data=body.encode() if isinstance(body, str) else body).get_environ()
+        # Streamed responses (event streams, relayed snapshots) are read as the caller consumes them
+        app_iter, status, headers = run_wsgi_app(self.app, environ, buffered=not stream)
+        code, _, reason = status.partition(' ')
+        raw = HTTPResponse(body=io.BufferedReader(_AppIterReader(app_iter)), headers=headers.to_wsgi_list(),
+                           status=int(code), reason=reason, preload_content=False, decode_content=False,
+                           request_url=request.url)
+        return self.build_response(request, raw)
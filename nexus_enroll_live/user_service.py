@@ -2,6 +2,10 @@
 from flask import Flask, request, jsonify
 import requests
 from flask_cors import CORS # Import CORS
+from sharding import ShardedDatabase
+from bulk_import import BulkReport, BulkRowError, chunked, iter_rows, split_ids
+from instrumentation import instrument
+from health import add_health_endpoints, downstream_check
 
 # The Factory Pattern implementation remains the same
 from abc import ABC, abstractmethod
@@ -16,7 +20,13 @@ class User(ABC):
         return {"user_id": self.user_id, "name": self.name, "role": self.get_role()}
 
 class Student(User):
+    def __init__(self, user_id, name, completed_courses=None):
+        super().__init__(user_id, name)
+        self.completed_courses = completed_courses or []
     def get_role(self): return "Student"
+    def to_dict(self):
+        # Completed courses satisfy prerequisites when enrolling
+        return dict(super().to_dict(), completed_courses=self.completed_courses)
 
 class Faculty(User):
     def get_role(self): return "Faculty"
@@ -25,33 +35,74 @@ class Administrator(User):
     def get_role(self): return "Administrator"
 
 class ConcreteUserFactory:
-    def create_user(self, user_type, user_id, name):
-        if user_type.lower() == 'student': return Student(user_id, name)
+    def create_user(self, user_type, user_id, name, completed_courses=None):
+        if user_type.lower() == 'student': return Student(user_id, name, completed_courses)
         if user_type.lower() == 'faculty': return Faculty(user_id, name)
         if user_type.lower() == 'administrator': return Administrator(user_id, name)
         raise ValueError(f"Unknown user type: {user_type}")
 
 app = Flask(__name__)
 CORS(app)
+instrument(app, "user_service")
 user_factory = ConcreteUserFactory()
-DB_SERVICE_URL = "http://127.0.0.1:5000"
+# Every database shard keeps a copy of every user, so user writes go to all of them
+db_shards = ShardedDatabase.from_env()
+add_health_endpoints(app, **{client.name: downstream_check(client) for client in db_shards.clients})
 
 @app.route('/users', methods=['POST'])
 def create_user_endpoint():
     data = request.json
     try:
         # 1. Use the factory to create a user object
-        new_user = user_factory.create_user(data['type'], data['user_id'], data['name'])
+        new_user = user_factory.create_user(data['type'], data['user_id'], data['name'],
+                                            split_ids(data.get('completed_courses')))
         
         # 2. Persist it by calling the database service
-        response = requests.post(f"{DB_SERVICE_URL}/users", json=new_user.to_dict())
+        responses = db_shards.broadcast("/users", json=new_user.to_dict())
         
-        if response.status_code == 201:
+        if all(response.status_code == 201 for response in responses):
             return jsonify({"message": f"{new_user.get_role()} created successfully.", "user": new_user.to_dict()}), 201
         else:
             return jsonify({"error": "Failed to save user in db service"}), 500
     except (ValueError, KeyError) as e:
         return jsonify({"error": str(e)}), 400
+    except requests.exceptions.RequestException as e:
+        return jsonify({"error": f"Could not connect to database service: {e}"}), 503
+
+def _validated_users(rows, report):
+    """Runs every uploaded row through the factory, recording rows that fail."""
+    for row, data in rows:
+        report.received += 1
+        if isinstance(data, BulkRowError):
+            report.error(row, str(data))
+            continue
+        try:
+            yield row, user_factory.create_user(data['type'], data['user_id'], data['name'],
+                                                split_ids(data.get('completed_courses'))).to_dict()
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            report.error(row, f"Invalid user: {e}")
+
+@app.route('/users/bulk', methods=['POST'])
+def bulk_create_users_endpoint():
+    """
+    Bulk import for semester rollover: accepts a JSON array, NDJSON or CSV
+    (columns: type, user_id, name and optionally completed_courses, ';'-separated).
+    Valid users are saved in chunks.
+    """
+    report = BulkReport()
+    try:
+        for chunk in chunked(_validated_users(iter_rows(request), report)):
+            responses = db_shards.broadcast("/users/bulk", json={"users": [user for _, user in chunk]})
+            if all(response.status_code == 201 for response in responses):
+                report.imported += len(chunk)
+            else:
+                for row, _ in chunk:
+                    report.error(row, "Failed to save user in db service")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except requests.exceptions.RequestException as e:
+        return jsonify({"error": f"Could not connect to database service: {e}", "report": report.to_dict()}), 503
+    return jsonify(report.to_dict()), 200
 
 if __name__ == '__main__':
     # Runs on port 5001
@@ -0,0 +1,86 @@
+# utilization.py
+"""
+Per-course seat utilization, kept up to date as enrollments change.
+
+The database service calls update() whenever a course's enrolled count or
+capacity changes, so a capacity report never scans enrollments. Courses are
+bucketed by whole-percent utilization (0..100, over-full courses in 100), so a
+report for "at least 90% full" only visits the buckets from 90 up plus the
+courses in them, not the whole catalog.
+
+crossings() compares a course's utilization before and after a change against
+the alert thresholds, so the caller can publish an alert the moment a course
+fills past (or drops back under) one.
+"""
+import os
+import threading
+
+
+def alert_thresholds_from_env():
+    """NEXUS_CAPACITY_ALERTS, e.g. "0.9,1.0"; an empty value turns alerts off."""
+    value = os.environ.get("NEXUS_CAPACITY_ALERTS", "0.9,1.0")
+    return sorted(float(t) for t in value.split(',') if t.strip())
+
+
+class UtilizationIndex:
+    def __init__(self, thresholds=()):
+        self.thresholds = sorted(thresholds)
+        self._courses = {}  # course_id -> (enrolled, capacity, bucket)
+        self._buckets = [set() for _ in range(101)]  # whole percent -> course_ids
+        self._lock = threading.Lock()
+
+    def update(self, course_id, enrolled, capacity):
+        """Records a course's current enrolled count and capacity."""
+        bucket = _bucket(enrolled, capacity)
+        with self._lock:
+            previous = self._courses.get(course_id)
+            if previous is not None and previous[2] != bucket:
+                self._buckets[previous[2]].discard(course_id)
+            self._courses[course_id] = (enrolled, capacity, bucket)
+            self._buckets[bucket].add(course_id)
+
+    def clear(self):
+        with self._lock:
+            self._courses.clear()
+            for bucket in self._buckets:
+                bucket.clear()
+
+    def ratio(self, course_id):
+        """Enrolled / capacity for a course, or None if it is not tracked."""
+        entry = self._courses.get(course_id)
+        return None if entry is None else _ratio(entry[0], entry[1])
+
+    def crossings(self, before, after):
+        """Thresholds crossed going from ratio `before` to `after`, as (threshold, "above" | "below"), in the order crossed."""
+        if before is None or after is None or before == after:
+            return []
+        if after > before:
+            return [(t, "above") for t in self.thresholds if before < t <= after]
+        return [(t, "below") for t in reversed(self.thresholds) if after < t <= before]
+
+    def report(self, threshold=0.0):
+        """Courses at or above `threshold` utilization as (course_id, enrolled, capacity), fullest first."""
+        # One bucket of slack below the threshold absorbs floating-point rounding
+        first_bucket = max(0, min(100, int(threshold * 100) - 1))
+        rows = []
+        with self._lock:
+            for bucket in range(100, first_bucket - 1, -1):
+                for course_id in self._buckets[bucket]:
+                    enrolled, capacity, _ = self._courses[course_id]
+                    if _ratio(enrolled, capacity) >= threshold:
+                        rows.append((course_id, enrolled, capacity))
+            tracked = len(self._courses)
+        rows.sort(key=lambda row: (-_ratio(row[1], row[2]), row[0]))
+        return rows, tracked
+
+
+def _ratio(enrolled, capacity):
+    if capacity > 0:
+        return enrolled / capacity
+    return 1.0 if enrolled else 0.0
+
+
+def _bucket(enrolled, capacity):
+    if capacity > 0:
+        return min(100, enrolled * 100 // capacity)
+    return 100 if enrolled else 0
@@ -0,0 +1,142 @@
+# wire.py
+"""
+Wire format for calls between the NexusEnroll services.
+
+JSON is what browsers get and what every service understands. Internal hops can
+use MessagePack instead, a binary encoding of the same values that is smaller
+and faster to encode and decode, chosen per request by content negotiation:
+
+  * ServiceClient asks for it with `Accept: application/msgpack` (JSON is still
+    accepted) and, for clients created with binary_bodies=True, sends request
+    bodies as MessagePack too. Callers read bodies with decode(response), which
+    handles whichever format the server picked.
+  * A Flask app set up with enable(app) answers jsonify() in MessagePack when
+    the caller prefers it, and reads MessagePack request bodies through the usual
+    request.json / request.get_json().
+  * Large responses are gzip-compressed for callers that accept it: any body of
+    at least NEXUS_COMPRESS_MIN_BYTES (default 64 KiB; 0 turns compression off),
+    and streamed snapshots through gzip_stream(). Browsers accept gzip; service
+    clients only with NEXUS_WIRE_COMPRESSION=1, since between processes on one
+    machine compressing costs more CPU than the bytes it saves.
+
+MessagePack needs `pip install msgpack` (see requirements-optional.txt). Without
+it, or with NEXUS_WIRE_FORMAT=json, nothing asks for it and everything stays JSON.
+"""
+import gzip
+import os
+import zlib
+
+from flask import has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+from flask.wrappers import Request
+from werkzeug.exceptions import BadRequest
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+COMPRESS_MIN_BYTES = int(os.environ.get("NEXUS_COMPRESS_MIN_BYTES", str(64 * 1024)))
+# What ServiceClient asks for when the caller does not say
+BINARY = msgpack is not None and os.environ.get("NEXUS_WIRE_FORMAT", "msgpack") == "msgpack"
+ACCEPT = f"{MSGPACK}, {JSON};q=0.9" if BINARY else JSON
+ACCEPT_ENCODING = "gzip" if os.environ.get("NEXUS_WIRE_COMPRESSION", "0") == "1" else "identity"
+
+
+def pack(value):
+    return msgpack.packb(value)
+
+
+def decode(response):
+    """The body of a requests or httpx response, in whichever format the server chose."""
+    if msgpack is not None and response.headers.get('Content-Type', '').startswith(MSGPACK):
+        return msgpack.unpackb(response.content)
+    return response.json()
+
+
+def prepare_request(kwargs, binary_bodies):
+    """Adds the negotiation headers to a ServiceClient call and, if asked, sends its `json=` body as MessagePack."""
+    headers = dict(kwargs.get('headers') or {})
+    headers.setdefault('Accept', ACCEPT)
+    headers.setdefault('Accept-Encoding', ACCEPT_ENCODING)
+    if binary_bodies and BINARY and kwargs.get('json') is not None:
+        kwargs['data'] = pack(kwargs.pop('json'))
+        headers['Content-Type'] = MSGPACK
+    kwargs['headers'] = headers
+    return kwargs
+
+
+def relay_headers(incoming=None):
+    """
+    Headers that let the service behind a proxying endpoint negotiate with the
+    original caller of `incoming` (default: Flask's current request).
+    """
+    incoming = request if incoming is None else incoming
+    return {"Accept": incoming.headers.get('Accept', JSON),
+            "Accept-Encoding": incoming.headers.get('Accept-Encoding', 'identity')}
+
+
+def wants_msgpack():
+    """True when the current request's caller prefers MessagePack over JSON."""
+    return msgpack is not None and request.accept_mimetypes.best_match([JSON, MSGPACK]) == MSGPACK
+
+
+def accepts_gzip():
+    return COMPRESS_MIN_BYTES > 0 and 'gzip' in request.accept_encodings
+
+
+def gzip_stream(chunks, level=1):
+    """Compresses a streamed body (str or bytes chunks) into one gzip stream."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class WireJSONProvider(DefaultJSONProvider):
+    """jsonify() that answers in MessagePack when the caller prefers it."""
+
+    def response(self, *args, **kwargs):
+        if not has_request_context() or not wants_msgpack():
+            return super().response(*args, **kwargs)
+        response = self._app.response_class(pack(self._prepare_response_obj(args, kwargs)), mimetype=MSGPACK)
+        response.vary.add('Accept')
+        return response
+
+
+class WireRequest(Request):
+    """Request whose get_json() also reads MessagePack bodies."""
+
+    def get_json(self, force=False, silent=False, cache=True):
+        if msgpack is None or self.mimetype != MSGPACK:
+            return super().get_json(force=force, silent=silent, cache=cache)
+        try:
+            return msgpack.unpackb(self.get_data(cache=cache))
+        except ValueError as e:
+            if silent:
+                return None
+            raise BadRequest(f"Failed to decode MessagePack body: {e}")
+
+
+def _compress(response):
+    """Gzips a large, fully built response body for callers that accept it."""
+    if response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers:
+        return response
+    if not accepts_gzip() or (response.content_length or 0) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(response.get_data(), compresslevel=1))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def enable(app):
+    """Adds MessagePack negotiation and gzip compression of large responses to a Flask app."""
+    app.json = WireJSONProvider(app)
+    app.request_class = WireRequest
+    app.after_request(_compress)
+    return app
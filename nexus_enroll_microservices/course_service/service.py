@@ -1,57 +1,87 @@
 # course_service/service.py
 from shared_db.singleton_db import db
+from shared_db.console import log
+from course_service.timetable import schedule_mask
 
 # --- The 'Subject' for the Observer Pattern ---
 class Course:
-    def __init__(self, course_id, name, capacity, prerequisites=None):
+    __slots__ = ("course_id", "name", "capacity", "prerequisites", "schedule", "time_mask", "_observers")
+
+    def __init__(self, course_id, name, capacity, prerequisites=None, schedule=None):
         self.course_id = course_id
         self.name = name
         self.capacity = capacity
         self.prerequisites = prerequisites or []
-        self._observers = [] # List of student observers on the waitlist
+        self.schedule = schedule or [] # meetings such as "Mon 09:00-10:30"
+        self.time_mask = schedule_mask(self.schedule) # bitmap of the time slots it occupies
+        self._observers = {} # user_id -> student observer on the waitlist, in arrival order
 
     # --- Observer Pattern Methods ---
     def attach(self, observer):
         """Add a student to the waitlist (observers)."""
-        if observer not in self._observers:
-            self._observers.append(observer)
-            print(f"  - Observer Added: {observer.name} is now observing {self.name}.")
+        if observer.user_id not in self._observers:
+            self._observers[observer.user_id] = observer
+            log("  - Observer Added: %s is now observing %s.", observer.name, self.name)
 
     def detach(self, observer):
         """Remove a student from the waitlist."""
-        self._observers.remove(observer)
-        print(f"  - Observer Removed: {observer.name} is no longer observing {self.name}.")
+        del self._observers[observer.user_id]
+        log("  - Observer Removed: %s is no longer observing %s.", observer.name, self.name)
 
     def notify(self):
         """Notify all observers (waitlisted students) of a change."""
-        print(f"\n--- Notifying Observers for Course '{self.name}' ---")
+        log("\n--- Notifying Observers for Course '%s' ---", self.name)
         if not self._observers:
-            print("  - No observers to notify.")
+            log("  - No observers to notify.")
             return
         # Notify the first student on the waitlist
-        observer_to_notify = self._observers[0]
-        print(f"  - Notifying {observer_to_notify.name}...")
+        observer_to_notify = next(iter(self._observers.values()))
+        log("  - Notifying %s...", observer_to_notify.name)
         observer_to_notify.update(self)
 
 # --- Service Logic ---
 class CourseService:
-    def add_course(self, course_id, name, capacity):
+    def add_course(self, course_id, name, capacity, prerequisites=None, schedule=None):
         if course_id in db.courses:
             return None
-        new_course = Course(course_id, name, capacity)
+        # Prerequisites must already exist, so closures never change later and cycles cannot form
+        unknown = [p for p in prerequisites or [] if p not in db.courses]
+        if unknown:
+            log("Error: Prerequisite(s) %s of %s do not exist.", ", ".join(unknown), course_id)
+            return None
+        new_course = Course(course_id, name, capacity, prerequisites, schedule)
         db.courses[course_id] = new_course
-        print(f"Course Added: {name} (Capacity: {capacity})")
+        closure = set(new_course.prerequisites)
+        for prerequisite in new_course.prerequisites:
+            closure |= db.prerequisite_closure[prerequisite]
+        db.prerequisite_closure[course_id] = frozenset(closure)
+        db.track_utilization(course_id)
+        log("Course Added: %s (Capacity: %s)", name, capacity)
         return new_course
 
     def get_course(self, course_id):
         return db.courses.get(course_id)
 
+    def get_courses(self, course_ids):
+        """Batched lookup: {course_id: course} for the IDs that exist, in the order given."""
+        courses = db.courses
+        return {course_id: courses[course_id] for course_id in course_ids if course_id in courses}
+
     def get_enrolled_count(self, course_id):
-        return sum(1 for enroll_list in db.enrollments.values() if course_id in enroll_list)
+        return db.get_enrolled_count(course_id)
+
+    def subscribe_capacity_alerts(self, callback):
+        """Calls callback(course, threshold, direction, enrolled_count) whenever a course crosses an alert threshold."""
+        db.capacity_alert_listeners.append(callback)
 
     def generate_capacity_report(self, threshold=0.9):
-        print(f"\n--- Generating Report: Courses over {threshold*100}% capacity ---")
-        for course_id, course in db.courses.items():
-            enrolled_count = self.get_enrolled_count(course_id)
-            if course.capacity > 0 and (enrolled_count / course.capacity) >= threshold:
-                print(f"  - {course.name}: {enrolled_count}/{course.capacity} students")
\ No newline at end of file
+        """
+        Lists the courses at or above `threshold` utilization, fullest first, from the
+        utilization index kept up to date on every enrollment change. Returns the
+        (course_id, enrolled_count, capacity) rows.
+        """
+        log("\n--- Generating Report: Courses over %s%% capacity ---", threshold*100)
+        rows = db.utilization.report(threshold)
+        for course_id, enrolled_count, capacity in rows:
+            log("  - %s: %s/%s students", db.courses[course_id].name, enrolled_count, capacity)
+        return rows
@@ -1,7 +1,9 @@
 # enrollment_service/service.py
 from shared_db.singleton_db import db
 from course_service.service import CourseService
+from course_service.timetable import schedules_overlap
 from user_service.service import UserService
+from shared_db.console import log
 
 class EnrollmentFacade:
     """
@@ -11,82 +13,140 @@ class EnrollmentFacade:
     def __init__(self):
         self.course_service = CourseService()
         self.user_service = UserService()
-        print("\nEnrollmentFacade initialized.")
+        log("\nEnrollmentFacade initialized.")
 
     def enroll_student(self, student_id, course_id):
         """A single, simple method to handle the entire enrollment process."""
-        print(f"\n--- Attempting to enroll Student {student_id} in Course {course_id} ---")
+        log("\n--- Attempting to enroll Student %s in Course %s ---", student_id, course_id)
         student = self.user_service.get_user(student_id)
         course = self.course_service.get_course(course_id)
 
         if not student or not course:
-            print("Error: Invalid student or course ID.")
+            log("Error: Invalid student or course ID.")
             return False
 
-        # 1. Check if already enrolled
-        if student_id in db.enrollments and course_id in db.enrollments[student_id]:
-            print(f"Result: {student.name} is already enrolled in {course.name}.")
+        # 1. Check if already enrolled (set lookup on the course roster)
+        roster = db.get_roster(course_id)
+        if student_id in roster:
+            log("Result: %s is already enrolled in %s.", student.name, course.name)
             return False
 
-        # 2. Check for capacity
-        enrolled_count = self.course_service.get_enrolled_count(course_id)
-        if enrolled_count >= course.capacity:
+        # 2. Check prerequisites and timetable clashes (precomputed credit sets and time-slot bitmaps)
+        problem = self._eligibility_problem(student_id, course)
+        if problem:
+            log("Result: %s cannot enroll in %s: %s.", student.name, course.name, problem)
+            return False
+
+        # 3. Check for capacity
+        if len(roster) >= course.capacity:
             # Capacity is full, add to waitlist
-            if course_id not in db.waitlists:
-                db.waitlists[course_id] = []
-            if student_id not in db.waitlists[course_id]:
-                db.waitlists[course_id].append(student_id)
+            if db.add_to_waitlist(course_id, student_id):
                 course.attach(student) # Attach student as an observer
-                print(f"Result: {course.name} is full. {student.name} has been added to the waitlist.")
+                log("Result: %s is full. %s has been added to the waitlist.", course.name, student.name)
             else:
-                print(f"Result: {student.name} is already on the waitlist for {course.name}.")
+                log("Result: %s is already on the waitlist for %s.", student.name, course.name)
             return False
 
-        # 3. All checks passed, perform enrollment (Transactional step)
-        if student_id not in db.enrollments:
-            db.enrollments[student_id] = []
-        db.enrollments[student_id].append(course_id)
-        print(f"SUCCESS: {student.name} has been enrolled in {course.name}.")
+        # 4. All checks passed, perform enrollment (Transactional step)
+        db.add_enrollment(student_id, course_id)
+        waitlist = db.get_waitlist(course_id)
+        if waitlist is not None and waitlist.remove(student_id):
+            course.detach(student) # A waitlisted student took an open seat
+        log("SUCCESS: %s has been enrolled in %s.", student.name, course.name)
         return True
 
+    def _eligibility_problem(self, student_id, course):
+        """Returns why a student may not take a course, or None if they may."""
+        if course.prerequisites:
+            credits = db.get_credits(student_id)
+            missing = [p for p in course.prerequisites if p not in credits]
+            if missing:
+                return f"missing prerequisite(s) {', '.join(missing)}"
+        if course.time_mask & db.get_busy_mask(student_id):
+            clash = next((c for c in db.enrollments[student_id] if db.courses[c].time_mask & course.time_mask
+                          and schedules_overlap(db.courses[c].schedule, course.schedule)), None)
+            if clash:
+                return f"it meets at the same time as {db.courses[clash].name}"
+        return None
+
     def drop_course(self, student_id, course_id):
         """Handles dropping a course and triggers the notification system."""
-        print(f"\n--- Attempting to drop Course {course_id} for Student {student_id} ---")
+        log("\n--- Attempting to drop Course %s for Student %s ---", course_id, student_id)
         student = self.user_service.get_user(student_id)
         course = self.course_service.get_course(course_id)
 
-        if student_id in db.enrollments and course_id in db.enrollments[student_id]:
-            db.enrollments[student_id].remove(course_id)
-            print(f"SUCCESS: {student.name} has dropped {course.name}.")
+        if student_id in db.get_roster(course_id):
+            db.remove_enrollment(student_id, course_id)
+            log("SUCCESS: %s has dropped %s.", student.name, course.name)
             
             # --- Trigger for Observer Pattern ---
-            # If there's a waitlist for this course, notify them.
-            if course_id in db.waitlists and db.waitlists[course_id]:
-                course.notify()
+            # The freed seat goes straight to the head of the waitlist, who is then notified.
+            self._promote_from_waitlist(course)
+            return True
         else:
-            print(f"Error: {student.name} is not enrolled in {course.name}.")
+            log("Error: %s is not enrolled in %s.", student.name, course.name)
+            return False
+
+    def _promote_from_waitlist(self, course):
+        """Moves waitlisted students, first come first served, into any free seats of a course."""
+        waitlist = db.get_waitlist(course.course_id)
+        promoted = 0
+        while waitlist and db.get_enrolled_count(course.course_id) < course.capacity:
+            student_id = waitlist.pop()
+            student = self.user_service.get_user(student_id)
+            if student is None or student_id in db.get_roster(course.course_id):
+                continue # stale entry, trimmed from the line
+            if self._eligibility_problem(student_id, course):
+                course.detach(student) # enrolled in a clashing course since joining the line
+                continue
+            db.add_enrollment(student_id, course.course_id)
+            log("PROMOTED: %s has been moved from the waitlist into %s.", student.name, course.name)
+            course.notify() # the promoted student is the first observer
+            course.detach(student)
+            promoted += 1
+        return promoted
 
     def get_student_schedule(self, student_id):
+        """
+        Returns the student's enrolled courses, read from the per-student enrollment
+        index with one batched course lookup, in the shape of the live service's
+        GET /students/<id>/schedule. Returns None for an unknown student.
+        """
         student = self.user_service.get_user(student_id)
-        print(f"\n--- Schedule for {student.name} ---")
-        if student_id in db.enrollments and db.enrollments[student_id]:
-            for course_id in db.enrollments[student_id]:
-                course = self.course_service.get_course(course_id)
-                print(f"  - {course.name} (ID: {course.course_id})")
-        else:
-            print("  - No courses enrolled.")
-            
-    def get_faculty_roster(self, faculty_id, course_id):
+        if student is None:
+            log("Error: Invalid student ID.")
+            return None
+        courses = self.course_service.get_courses(db.enrollments.get(student_id, ()))
+        log("\n--- Schedule for %s ---", student.name)
+        for course in courses.values():
+            log("  - %s (ID: %s)", course.name, course.course_id)
+        if not courses:
+            log("  - No courses enrolled.")
+        return {"student_id": student_id, "name": student.name,
+                "courses": [{"course_id": course.course_id, "name": course.name, "schedule": list(course.schedule)}
+                            for course in courses.values()]}
+
+    def get_faculty_roster(self, faculty_id, course_id, limit=100, cursor=None):
+        """
+        Returns one page of a course's roster in student ID order, in the shape of the
+        live service's GET /courses/<id>/roster. Pass the returned next_cursor as
+        `cursor` for the next page. Returns None for an unknown faculty member or course.
+        """
         faculty = self.user_service.get_user(faculty_id)
         course = self.course_service.get_course(course_id)
-        print(f"\n--- Roster for {course.name} (Instructor: {faculty.name}) ---")
-        enrolled_students = [
-            self.user_service.get_user(s_id)
-            for s_id, c_list in db.enrollments.items()
-            if course_id in c_list
-        ]
-        if enrolled_students:
-            for student in enrolled_students:
-                print(f"  - Student: {student.name} (ID: {student.user_id})")
-        else:
-            print("  - No students enrolled.")
\ No newline at end of file
+        if not faculty or not course:
+            log("Error: Invalid faculty or course ID.")
+            return None
+        student_ids, next_cursor = db.get_roster_page(course_id, cursor, limit)
+        students = self.user_service.get_users(student_ids)
+        log("\n--- Roster for %s (Instructor: %s) ---", course.name, faculty.name)
+        for student in students.values():
+            log("  - Student: %s (ID: %s)", student.name, student.user_id)
+        if not students:
+            log("  - No students enrolled.")
+        waitlist = db.get_waitlist(course_id)
+        return {"course_id": course_id, "name": course.name, "instructor": faculty.name,
+                "capacity": course.capacity, "enrolled_count": db.get_enrolled_count(course_id),
+                "waitlist_length": len(waitlist) if waitlist is not None else 0,
+                "students": [{"user_id": student.user_id, "name": student.name} for student in students.values()],
+                "next_cursor": next_cursor}
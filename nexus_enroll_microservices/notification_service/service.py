@@ -1,8 +1,9 @@
 # notification_service/service.py
+from shared_db.console import log
 
 class NotificationService:
     @staticmethod
     def send_notification(user, message):
         """Simulates sending an email or other notification."""
-        print(f"--- Notification Sent to {user.name} ({user.get_role()}) ---")
-        print(f"  - Message: Hi {user.name}, {message}")
\ No newline at end of file
+        log("--- Notification Sent to %s (%s) ---", user.name, user.get_role())
+        log("  - Message: Hi %s, %s", user.name, message)
\ No newline at end of file
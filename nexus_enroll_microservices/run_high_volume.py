@@ -0,0 +1,116 @@
+# run_high_volume.py
+"""
+High-volume simulation: replays a full registration period through the
+EnrollmentFacade with console output switched off, then reports throughput.
+
+Events come from a generator, so a million-event run never materializes the
+event list. Course popularity is skewed (Zipf), so popular courses fill up,
+build waitlists and trigger observer notifications when seats are dropped.
+
+Usage:
+    python run_high_volume.py [--events 1000000] [--students 50000] [--courses 2000]
+                              [--capacity 40] [--drop-ratio 0.3] [--seed 42]
+"""
+import argparse
+import bisect
+import itertools
+import random
+import time
+
+from shared_db import console
+
+# Quiet from the start: the shared database is created (and logs it) on import;
+# main() turns output back on for --verbose
+console.set_verbose(False)
+
+from user_service.service import UserService
+from course_service.service import CourseService
+from enrollment_service.service import EnrollmentFacade
+from shared_db.singleton_db import db
+
+def populate(num_students, num_courses, capacity):
+    """Creates the students and courses for the run; returns their IDs."""
+    user_service = UserService()
+    course_service = CourseService()
+    student_ids = [f"S{i:06d}" for i in range(num_students)]
+    course_ids = [f"C{i:05d}" for i in range(num_courses)]
+    for i, student_id in enumerate(student_ids):
+        user_service.add_user('student', student_id, f"Student {i}")
+    for i, course_id in enumerate(course_ids):
+        course_service.add_course(course_id, f"Course {i}", capacity)
+    return student_ids, course_ids
+
+def registration_events(num_events, student_ids, course_ids, drop_ratio, zipf, rng):
+    """
+    Yields ('enroll' | 'drop', student_id, course_id) tuples.
+    Drops are drawn from the student's current schedule, so nearly all of them succeed.
+    """
+    cumulative = list(itertools.accumulate(1.0 / (rank ** zipf) for rank in range(1, len(course_ids) + 1)))
+    total_weight = cumulative[-1]
+    random_value = rng.random
+    pick_student = rng.choice
+    for _ in range(num_events):
+        student_id = pick_student(student_ids)
+        if random_value() < drop_ratio:
+            schedule = db.enrollments.get(student_id)
+            if schedule:
+                yield 'drop', student_id, pick_student(schedule)
+                continue
+        yield 'enroll', student_id, course_ids[bisect.bisect_left(cumulative, random_value() * total_weight)]
+
+def check_consistency():
+    """Verifies capacity limits and that the per-student and per-course indexes agree."""
+    for course_id, course in db.courses.items():
+        assert db.get_enrolled_count(course_id) <= course.capacity, f"{course_id} is over capacity"
+    pairs = sum(len(courses) for courses in db.enrollments.values())
+    assert pairs == sum(len(roster) for roster in db.course_rosters.values()), "indexes disagree"
+    return pairs
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=1000000)
+    parser.add_argument('--students', type=int, default=50000)
+    parser.add_argument('--courses', type=int, default=2000)
+    parser.add_argument('--capacity', type=int, default=40)
+    parser.add_argument('--drop-ratio', type=float, default=0.3)
+    parser.add_argument('--zipf', type=float, default=1.1, help="course popularity skew")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--verbose', action='store_true', help="keep per-event console output")
+    args = parser.parse_args()
+
+    console.set_verbose(args.verbose)
+    db.clear_data()
+    setup_start = time.perf_counter()
+    student_ids, course_ids = populate(args.students, args.courses, args.capacity)
+    setup_seconds = time.perf_counter() - setup_start
+
+    facade = EnrollmentFacade()
+    enroll, drop = facade.enroll_student, facade.drop_course
+    counts = {'enroll': 0, 'enrolled': 0, 'drop': 0, 'dropped': 0}
+    events = registration_events(args.events, student_ids, course_ids, args.drop_ratio, args.zipf,
+                                 random.Random(args.seed))
+    start = time.perf_counter()
+    for kind, student_id, course_id in events:
+        counts[kind] += 1
+        if kind == 'enroll':
+            counts['enrolled'] += enroll(student_id, course_id)
+        else:
+            counts['dropped'] += drop(student_id, course_id)
+    elapsed = time.perf_counter() - start
+
+    enrollments = check_consistency()
+    full_courses = sum(1 for c, course in db.courses.items() if db.get_enrolled_count(c) >= course.capacity)
+    print("--- HIGH-VOLUME REGISTRATION RUN ---")
+    print(f"  Students: {args.students}  Courses: {args.courses}  Capacity: {args.capacity}")
+    print(f"  Setup: {setup_seconds:.2f}s")
+    print(f"  Events: {args.events} in {elapsed:.2f}s ({args.events / elapsed:,.0f} events/s)")
+    print(f"  Enroll requests: {counts['enroll']} ({counts['enrolled']} enrolled, "
+          f"{counts['enroll'] - counts['enrolled']} waitlisted or rejected)")
+    print(f"  Drop requests: {counts['drop']} ({counts['dropped']} dropped)")
+    # Every seat not taken by a direct enrollment was filled from a waitlist
+    print(f"  Waitlist promotions: {enrollments - counts['enrolled'] + counts['dropped']}")
+    print(f"  Final state: {enrollments} enrollments, {full_courses} full courses, "
+          f"{sum(len(w) for w in db.waitlists.values())} waitlist entries")
+
+if __name__ == "__main__":
+    main()
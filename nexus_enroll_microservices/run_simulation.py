@@ -2,8 +2,15 @@
 from user_service.service import UserService
 from course_service.service import CourseService
 from enrollment_service.service import EnrollmentFacade
+from notification_service.service import NotificationService
 from shared_db.singleton_db import db
 
+def alert_administrator(course, threshold, direction, enrolled_count):
+    """Capacity alert listener: tells the administrator when a course fills up or frees up."""
+    change = "has reached" if direction == "above" else "has fallen below"
+    NotificationService.send_notification(db.users['A001'], f"'{course.name}' {change} {threshold:.0%} of capacity "
+                                          f"({enrolled_count}/{course.capacity} seats taken).")
+
 def populate_initial_data():
     """Sets up the initial state of the university system."""
     print("--- POPULATING INITIAL UNIVERSITY DATA ---")
@@ -20,6 +27,14 @@ def populate_initial_data():
     # Add Courses
     course_service.add_course('CS101', 'Intro to Python', 2) # Small capacity for testing
     course_service.add_course('MA202', 'Calculus II', 20)
+    course_service.add_course('CS201', 'Data Structures', 10, prerequisites=['CS101'], schedule=['Tue 10:00-11:30'])
+    course_service.add_course('PH101', 'Physics I', 10, schedule=['Tue 11:00-12:30'])
+
+    # The administrator is alerted as courses fill up
+    course_service.subscribe_capacity_alerts(alert_administrator)
+
+    # Alice passed Intro to Python last term
+    user_service.record_completed_courses('S001', ['CS101'])
     print("--- INITIAL DATA POPULATED ---")
 
 def main():
@@ -44,13 +59,13 @@ def main():
     enrollment_system.get_faculty_roster('F001', 'CS101')
 
     # --- Use Case 4: Student drops a course, triggering Observer pattern ---
-    # Alice drops CS101. This should free up a spot.
-    # The Course (Subject) should notify the first person on the waitlist (Charlie, the Observer).
+    # Alice drops CS101. This frees up a spot, which goes to the first person on the
+    # waitlist (Charlie, the Observer); the Course (Subject) then notifies him.
     enrollment_system.drop_course('S001', 'CS101')
 
     # --- Use Case 5: Student Views Updated Schedule ---
     enrollment_system.get_student_schedule('S001') # Alice's updated schedule
-    enrollment_system.get_student_schedule('S003') # Charlie is still not enrolled yet, just notified
+    enrollment_system.get_student_schedule('S003') # Charlie was promoted from the waitlist
 
     # --- Use Case 6: Administrator generates a report ---
     # Let's enroll Bob in MA202 to push its capacity over 0% for the report
@@ -58,5 +73,10 @@ def main():
     course_service = CourseService()
     course_service.generate_capacity_report(threshold=0.05) # Low threshold to ensure it appears
 
+    # --- Use Case 7: Prerequisites and timetable clashes are enforced ---
+    enrollment_system.enroll_student('S001', 'CS201') # Alice has credit for CS101
+    enrollment_system.enroll_student('S003', 'CS201') # Charlie is still taking CS101
+    enrollment_system.enroll_student('S001', 'PH101') # Overlaps Data Structures on Tuesday
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,18 @@
+# shared_db/console.py
+"""
+Console output shared by all simulated services.
+
+Messages are %-formatted only when output is on, so the high-volume runner
+can switch logging off and the hot path pays for a single flag check.
+"""
+
+verbose = True
+
+def set_verbose(enabled):
+    """Turns simulation output on or off for every service."""
+    global verbose
+    verbose = enabled
+
+def log(message, *args):
+    if verbose:
+        print(message % args if args else message)
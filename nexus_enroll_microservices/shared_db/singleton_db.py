@@ -1,4 +1,77 @@
 # shared_db/singleton_db.py
+from bisect import bisect_right
+from collections import deque
+from itertools import count
+
+from shared_db.console import log
+from shared_db.utilization import UtilizationIndex, utilization_ratio
+
+# Utilization levels at which capacity alert listeners are called
+CAPACITY_ALERT_THRESHOLDS = (0.9, 1.0)
+
+class Waitlist:
+    """
+    FIFO waitlist for one course: a deque keeps the order and a dict gives
+    constant-time membership. Removing a student only forgets their ticket;
+    stale deque entries are skipped when the head is read.
+    """
+    __slots__ = ("_queue", "_tickets", "_next_ticket")
+
+    def __init__(self):
+        self._queue = deque()   # (ticket, student_id) in arrival order
+        self._tickets = {}      # student_id -> ticket of their live entry
+        self._next_ticket = count()
+
+    def add(self, student_id):
+        """Appends a student; returns False if they are already waiting."""
+        if student_id in self._tickets:
+            return False
+        ticket = next(self._next_ticket)
+        self._tickets[student_id] = ticket
+        self._queue.append((ticket, student_id))
+        return True
+
+    def remove(self, student_id):
+        """Removes a student from anywhere in the line; returns False if absent."""
+        return self._tickets.pop(student_id, None) is not None
+
+    def peek(self):
+        """Returns the student at the head of the line, or None."""
+        queue = self._queue
+        while queue:
+            ticket, student_id = queue[0]
+            if self._tickets.get(student_id) == ticket:
+                return student_id
+            queue.popleft()
+        return None
+
+    def pop(self):
+        """Removes and returns the student at the head of the line, or None."""
+        student_id = self.peek()
+        if student_id is not None:
+            self._queue.popleft()
+            del self._tickets[student_id]
+        return student_id
+
+    def position(self, student_id):
+        """1-based place in line (walks the queue; not used on the hot path)."""
+        for place, waiting in enumerate(self, start=1):
+            if waiting == student_id:
+                return place
+        return None
+
+    def __contains__(self, student_id):
+        return student_id in self._tickets
+
+    def __len__(self):
+        return len(self._tickets)
+
+    def __iter__(self):
+        tickets = self._tickets
+        return (student_id for ticket, student_id in self._queue if tickets.get(student_id) == ticket)
+
+    def __repr__(self):
+        return f"Waitlist({list(self)!r})"
 
 class InMemoryDatabase:
     """
@@ -9,22 +82,127 @@ class InMemoryDatabase:
 
     def __new__(cls):
         if cls._instance is None:
-            print("Creating a new database instance.")
+            log("Creating a new database instance.")
             cls._instance = super(InMemoryDatabase, cls).__new__(cls)
             # Initialize data stores
             cls._instance.courses = {}
             cls._instance.users = {}
             cls._instance.enrollments = {} 
-            cls._instance.waitlists = {} 
+            cls._instance.waitlists = {} # course_id -> Waitlist
+            # Reverse index: course_id -> set of enrolled student_ids
+            cls._instance.course_rosters = {}
+            # Rosters in student ID order for paginated reads, built on first read
+            # and dropped whenever the course's roster changes
+            cls._instance.sorted_rosters = {}
+            # Precomputed for prerequisite and timetable checks:
+            #   prerequisite_closure  course_id -> every course it requires, directly or transitively
+            #   credits               student_id -> completed courses plus everything they required
+            #   busy_masks            student_id -> OR of their enrolled courses' time-slot bitmaps
+            cls._instance.prerequisite_closure = {}
+            cls._instance.credits = {}
+            cls._instance.busy_masks = {}
+            # Per-course utilization for capacity reports, and callbacks
+            # (course, threshold, direction, enrolled_count) for threshold crossings
+            cls._instance.utilization = UtilizationIndex(CAPACITY_ALERT_THRESHOLDS)
+            cls._instance.capacity_alert_listeners = []
         return cls._instance
 
+    # --- Enrollment Index Methods ---
+    def add_enrollment(self, student_id, course_id):
+        """Records an enrollment in the student's list, the course's roster and the student's busy times."""
+        self.enrollments.setdefault(student_id, []).append(course_id)
+        self.course_rosters.setdefault(course_id, set()).add(student_id)
+        self.sorted_rosters.pop(course_id, None)
+        time_mask = self.courses[course_id].time_mask
+        if time_mask:
+            self.busy_masks[student_id] = self.busy_masks.get(student_id, 0) | time_mask
+        self.track_utilization(course_id)
+
+    def remove_enrollment(self, student_id, course_id):
+        """Removes an enrollment from the student's list, the course's roster and the student's busy times."""
+        self.enrollments[student_id].remove(course_id)
+        self.course_rosters[course_id].discard(student_id)
+        self.sorted_rosters.pop(course_id, None)
+        if self.courses[course_id].time_mask:
+            busy = 0
+            for remaining in self.enrollments[student_id]:
+                busy |= self.courses[remaining].time_mask
+            self.busy_masks[student_id] = busy
+        self.track_utilization(course_id)
+
+    def get_enrolled_count(self, course_id):
+        """Constant-time enrolled count read from the roster index."""
+        return len(self.course_rosters.get(course_id, ()))
+
+    def get_roster(self, course_id):
+        """Returns the set of student IDs enrolled in a course."""
+        return self.course_rosters.get(course_id, set())
+
+    def get_roster_page(self, course_id, cursor=None, limit=100):
+        """
+        Returns (student_ids, next_cursor): up to `limit` enrolled students in ID order,
+        starting after the student ID `cursor`. next_cursor is None on the last page.
+        """
+        roster = self.sorted_rosters.get(course_id)
+        if roster is None:
+            roster = self.sorted_rosters[course_id] = sorted(self.course_rosters.get(course_id, ()))
+        start = bisect_right(roster, cursor) if cursor is not None else 0
+        page = roster[start:start + limit]
+        return page, (page[-1] if page and start + limit < len(roster) else None)
+
+    # --- Utilization Methods ---
+    def track_utilization(self, course_id):
+        """Refreshes a course's utilization and calls the alert listeners for any threshold it crossed."""
+        course = self.courses[course_id]
+        enrolled_count = len(self.course_rosters.get(course_id, ()))
+        previous = self.utilization.update(course_id, enrolled_count, course.capacity)
+        if previous is not None and self.capacity_alert_listeners:
+            before = utilization_ratio(previous[0], previous[1])
+            after = utilization_ratio(enrolled_count, course.capacity)
+            for threshold, direction in self.utilization.crossings(before, after):
+                for listener in self.capacity_alert_listeners:
+                    listener(course, threshold, direction, enrolled_count)
+
+    # --- Prerequisite and Timetable Methods ---
+    def add_credits(self, student_id, course_ids):
+        """Records completed courses; each one also counts for everything it required."""
+        credits = set(self.credits.get(student_id, ()))
+        for course_id in course_ids:
+            credits.add(course_id)
+            credits |= self.prerequisite_closure.get(course_id, frozenset())
+        self.credits[student_id] = frozenset(credits)
+
+    def get_credits(self, student_id):
+        return self.credits.get(student_id, frozenset())
+
+    def get_busy_mask(self, student_id):
+        return self.busy_masks.get(student_id, 0)
+
+    # --- Waitlist Methods ---
+    def add_to_waitlist(self, course_id, student_id):
+        """Appends a student to a course's waitlist; returns False if already on it."""
+        waitlist = self.waitlists.get(course_id)
+        if waitlist is None:
+            waitlist = self.waitlists[course_id] = Waitlist()
+        return waitlist.add(student_id)
+
+    def get_waitlist(self, course_id):
+        """Returns the course's Waitlist, or None if nobody has ever waited for it."""
+        return self.waitlists.get(course_id)
+
     def clear_data(self):
         """Utility method to reset data for clean test runs."""
-        print("\n--- CLEARING ALL DATABASE DATA ---")
+        log("\n--- CLEARING ALL DATABASE DATA ---")
         self.courses.clear()
         self.users.clear()
         self.enrollments.clear()
         self.waitlists.clear()
+        self.course_rosters.clear()
+        self.sorted_rosters.clear()
+        self.prerequisite_closure.clear()
+        self.credits.clear()
+        self.busy_masks.clear()
+        self.utilization.clear()
 
 # Instantiate the singleton
 db = InMemoryDatabase()
\ No newline at end of file
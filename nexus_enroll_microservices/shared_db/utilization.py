@@ -0,0 +1,62 @@
+# shared_db/utilization.py
+"""
+Per-course seat utilization, kept up to date as enrollments change.
+
+The database updates a course's entry on every enrollment and drop, so a
+capacity report never counts rosters. Courses are bucketed by whole-percent
+utilization (0..100, over-full courses in 100), so a report for "at least 90%
+full" only visits the buckets from 90 up.
+
+crossings() compares a course's utilization before and after a change against
+the alert thresholds, so the caller can raise an alert the moment a course
+fills past (or drops back under) one.
+"""
+
+class UtilizationIndex:
+    def __init__(self, thresholds=()):
+        self.thresholds = sorted(thresholds)
+        self._courses = {}  # course_id -> (enrolled, capacity, bucket)
+        self._buckets = [set() for _ in range(101)]  # whole percent -> course_ids
+
+    def update(self, course_id, enrolled, capacity):
+        """Records a course's current enrolled count and capacity; returns the previous (enrolled, capacity, bucket) or None."""
+        bucket = min(100, enrolled * 100 // capacity) if capacity > 0 else (100 if enrolled else 0)
+        previous = self._courses.get(course_id)
+        self._courses[course_id] = (enrolled, capacity, bucket)
+        if previous is None or previous[2] != bucket:
+            if previous is not None:
+                self._buckets[previous[2]].discard(course_id)
+            self._buckets[bucket].add(course_id)
+        return previous
+
+    def clear(self):
+        self._courses.clear()
+        for bucket in self._buckets:
+            bucket.clear()
+
+    def crossings(self, before, after):
+        """Thresholds crossed going from ratio `before` to `after`, as (threshold, "above" | "below"), in the order crossed."""
+        if before is None or after is None or before == after:
+            return []
+        if after > before:
+            return [(t, "above") for t in self.thresholds if before < t <= after]
+        return [(t, "below") for t in reversed(self.thresholds) if after < t <= before]
+
+    def report(self, threshold=0.0):
+        """Courses at or above `threshold` utilization as (course_id, enrolled, capacity), fullest first."""
+        # One bucket of slack below the threshold absorbs floating-point rounding
+        first_bucket = max(0, min(100, int(threshold * 100) - 1))
+        rows = []
+        for bucket in range(100, first_bucket - 1, -1):
+            for course_id in self._buckets[bucket]:
+                enrolled, capacity, _ = self._courses[course_id]
+                if utilization_ratio(enrolled, capacity) >= threshold:
+                    rows.append((course_id, enrolled, capacity))
+        rows.sort(key=lambda row: (-utilization_ratio(row[1], row[2]), row[0]))
+        return rows
+
+def utilization_ratio(enrolled, capacity):
+    """Enrolled / capacity; a zero-capacity course counts as full once anyone is in it."""
+    if capacity > 0:
+        return enrolled / capacity
+    return 1.0 if enrolled else 0.0
@@ -1,10 +1,13 @@
 # user_service/service.py
 from abc import ABC, abstractmethod
 from shared_db.singleton_db import db
+from shared_db.console import log
 
 # --- User Models (Product Interface and Concrete Products) ---
 class User(ABC):
     """Abstract Product: Defines the interface for user objects."""
+    __slots__ = ("user_id", "name")
+
     def __init__(self, user_id, name):
         self.user_id = user_id
         self.name = name
@@ -15,10 +18,12 @@ class User(ABC):
         
     def update(self, course):
         """Method for Observer pattern, primarily for students."""
-        print(f"  - NOTE: User {self.name} has no specific notification action.")
+        log("  - NOTE: User %s has no specific notification action.", self.name)
 
 class Student(User):
     """Concrete Product: Represents a student user."""
+    __slots__ = ()
+
     def get_role(self):
         return "Student"
         
@@ -28,16 +33,23 @@ class Student(User):
         When notified, a student will receive a message.
         """
         from notification_service.service import NotificationService
-        message = f"a spot has opened up in {course.name} (ID: {course.course_id})."
+        if self.user_id in db.get_roster(course.course_id):
+            message = f"you have been enrolled in {course.name} (ID: {course.course_id}) from the waitlist."
+        else:
+            message = f"a spot has opened up in {course.name} (ID: {course.course_id})."
         NotificationService.send_notification(self, message)
 
 class Faculty(User):
     """Concrete Product: Represents a faculty user."""
+    __slots__ = ()
+
     def get_role(self):
         return "Faculty"
 
 class Administrator(User):
     """Concrete Product: Represents an administrator user."""
+    __slots__ = ()
+
     def get_role(self):
         return "Administrator"
 
@@ -67,12 +79,22 @@ class UserService:
 
     def add_user(self, user_type, user_id, name):
         if user_id in db.users:
-            print(f"Error: User with ID {user_id} already exists.")
+            log("Error: User with ID %s already exists.", user_id)
             return None
         new_user = self.user_factory.create_user(user_type, user_id, name)
         db.users[user_id] = new_user
-        print(f"User Added: {new_user.name} ({new_user.get_role()})")
+        log("User Added: %s (%s)", new_user.name, new_user.get_role())
         return new_user
 
     def get_user(self, user_id):
-        return db.users.get(user_id)
\ No newline at end of file
+        return db.users.get(user_id)
+
+    def get_users(self, user_ids):
+        """Batched lookup: {user_id: user} for the IDs that exist, in the order given."""
+        users = db.users
+        return {user_id: users[user_id] for user_id in user_ids if user_id in users}
+
+    def record_completed_courses(self, student_id, course_ids):
+        """Gives a student credit for finished courses, which satisfy prerequisites."""
+        db.add_credits(student_id, course_ids)
+        log("Completed courses recorded for %s: %s", student_id, ", ".join(course_ids))
\ No newline at end of file